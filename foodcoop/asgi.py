@@ -0,0 +1,17 @@
+"""
+ASGI config for foodcoop project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with an ASGI server, e.g. ``uvicorn foodcoop.asgi:application``.
+
+See order.asgi for the differences to the WSGI application.
+"""
+
+import os
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "foodcoop.settings")
+
+import django
+django.setup()
+
+from order.asgi import ASGIHandler
+application = ASGIHandler()
@@ -8,8 +8,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/1.7/ref/settings/
 """
 
-# Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
+
+from order.cacheprofiles import get_caches
+from order.database import SQLITE_PRAGMAS, get_databases
+
+# Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 
 
@@ -40,6 +44,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'order.middleware.CacheGenerationMiddleware',
+    'order.middleware.QueryCountMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -49,6 +55,10 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 )
 
+# The session is read on each request to the order pages. Keep it in the
+# cache and only write it to the database.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 ROOT_URLCONF = 'foodcoop.urls'
 
 WSGI_APPLICATION = 'foodcoop.wsgi.application'
@@ -56,13 +66,35 @@ WSGI_APPLICATION = 'foodcoop.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/1.7/ref/settings/#databases
+# Select the database with the environment variable FOODCOOP_DATABASE: sqlite
+# (default) or postgresql (see order.database).
+
+DATABASES = get_databases(os.environ, BASE_DIR)
+
+# Pragmas, that are set on each new SQLite connection.
+ORDER_SQLITE_PRAGMAS = SQLITE_PRAGMAS
+
+# Count the queries of each request (see order.middleware). Django logs the
+# queries for this, so it is only enabled with DEBUG by default.
+ORDER_COUNT_QUERIES = DEBUG
+
+# Cache
+# https://docs.djangoproject.com/en/1.7/topics/cache/
+# The product catalog, the pages of closed bundles and the sessions are cached.
+# All processes of the site share the cache: select it with the environment
+# variable FOODCOOP_CACHE: file (default), memcached or locmem (only for one
+# process, see order.cacheprofiles).
+
+CACHES = get_caches(os.environ, BASE_DIR)
+
+# Seconds to collect the changes of the order and output tables, before they
+# are saved together in one transaction (see order.writes). 0 saves each change
+# on its own. The changes are only collected within one process, so with many
+# worker processes only the requests to the same process are coalesced.
+ORDER_COALESCE_DELAY = 0
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
-}
+# Number of threads, that run Django under ASGI (see foodcoop.asgi).
+ORDER_ASGI_THREADS = 10
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.7/topics/i18n/
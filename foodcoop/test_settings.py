@@ -0,0 +1,11 @@
+"""
+Settings for the tests.
+
+The tests run in one process, so the cache stays in memory and no cached page
+of an earlier test run is used.
+"""
+from order.cacheprofiles import LOCMEM, get_caches
+
+from .settings import *  # noqa
+
+CACHES = get_caches({'FOODCOOP_CACHE': LOCMEM})
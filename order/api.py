@@ -0,0 +1,139 @@
+"""
+Compact json representation of a bundle for scripts and external tools.
+
+The data are organised in columns instead of nested objects: 'products' and
+'groups' are dicts of parallel lists with one entry for each product or group.
+The orders are parallel lists too and refer to the products and groups by
+their position in these lists. So the names of the fields and the objects are
+not repeated for each order.
+
+The values are calculated by the same OutputTable as the output table of the
+bundle (see BundleOutputView), the ordered amounts and prices are the same as
+in the summary of BundleOrderView.
+
+bundle_changes only returns the orders and totals, that changed after a
+sequence number of the bundle (see Bundle.sequence), so clients can keep a
+loaded page up to date with small responses.
+"""
+from .export import format_price
+from .fields import from_micros
+from .models import BundleTotal
+from .pivot import OutputTable
+
+
+def bundle_data(bundle):
+    """
+    Returns a dict with the data of a bundle, that can be serialized as json:
+
+    * bundle: id, start, open and archived of the bundle
+    * products: the lists id, name, unit, price, amount (the ordered amount),
+      order_price (the price of the ordered amount) and delivered (the
+      delivered amount) of all ordered products
+    * groups: the lists id, name and price (the price of the delivered
+      amounts) of all groups with an order
+    * orders: the lists product and group (the positions in the lists above),
+      amount and delivered
+    * order_price: the price of all ordered amounts
+    * price_for_all: the price of all delivered amounts
+
+    Prices are strings with two decimal places.
+    """
+    table = OutputTable(bundle)
+
+    products = {'id': [], 'name': [], 'unit': [], 'price': [], 'amount': [], 'order_price': [],
+                'delivered': table.product_delivered}
+    orders = {'product': [], 'group': [], 'amount': [], 'delivered': []}
+    order_price = 0
+    for product_position, product in enumerate(table.products):
+        amount = 0
+        for group_position, (group_amount, delivered) in enumerate(
+                zip(table.amounts[product_position], table.delivered[product_position])):
+            if group_amount is None:
+                continue
+            amount += group_amount
+            orders['product'].append(product_position)
+            orders['group'].append(group_position)
+            orders['amount'].append(group_amount)
+            orders['delivered'].append(delivered)
+
+        price = product.get_line_price(amount)
+        order_price += price
+        products['id'].append(product.pk)
+        products['name'].append(product.name)
+        products['unit'].append(product.unit.order_name or product.unit.name)
+        products['price'].append(None if product.price is None else format_price(product.price))
+        products['amount'].append(amount)
+        products['order_price'].append(format_price(from_micros(price)))
+
+    return {
+        'bundle': {
+            'id': bundle.pk,
+            'start': bundle.start.isoformat(),
+            'open': bundle.open,
+            'archived': bundle.archived},
+        'products': products,
+        'groups': {
+            'id': [group.pk for group in table.groups],
+            'name': [group.name for group in table.groups],
+            'price': [format_price(price) for price in table.group_prices]},
+        'orders': orders,
+        'order_price': format_price(from_micros(order_price)),
+        'price_for_all': format_price(table.price_for_all),
+    }
+
+
+def bundle_changes(bundle, since):
+    """
+    Returns a dict with the changes of a bundle after the sequence since, that
+    can be serialized as json:
+
+    * sequence: the current sequence of the bundle, which the client sends as
+      since with the next request
+    * cells: a list [group, product, amount, delivered, version] for each
+      changed order, where delivered is the ordered amount, if no delivered
+      amount is set
+    * groups: a dict with the price and price_delivered of each group with a
+      changed order
+    * products: a dict with the amount and delivered of each product with a
+      changed order
+    * price and price_delivered: the prices of all ordered and all delivered
+      amounts
+
+    If since is 0, all orders are returned (also the orders, that were created
+    before the sequence was introduced and have the sequence 0).
+
+    If the client has to load the whole bundle again, because since is newer
+    then the bundle (e.g. the database was restored), an order was deleted
+    after since (see Bundle.deleted_sequence) or the bundle is archived, only
+    sequence and reload (True) are returned.
+    """
+    if since > bundle.sequence or 0 < since < bundle.deleted_sequence or bundle.archived:
+        return {'sequence': bundle.sequence, 'reload': True}
+
+    orders = bundle.orders.all()
+    if since:
+        orders = orders.filter(sequence__gt=since)
+    cells = [
+        [group, product, amount, amount if delivered is None else delivered, version]
+        for group, product, amount, delivered, version in orders.values_list(
+            'group', 'product', 'amount', 'delivered', 'version').order_by('sequence')]
+    groups = {}
+    products = {}
+    if cells:
+        group_totals = bundle.group_totals.filter(group__in=list(set(cell[0] for cell in cells)))
+        for group, price, price_delivered in group_totals.values_list('group', 'price', 'price_delivered'):
+            groups[group] = {'price': format_price(from_micros(price)),
+                             'price_delivered': format_price(from_micros(price_delivered))}
+        product_totals = bundle.product_totals.filter(product__in=list(set(cell[1] for cell in cells)))
+        for product, amount, delivered in product_totals.values_list('product', 'amount', 'delivered'):
+            products[product] = {'amount': amount, 'delivered': delivered}
+    total = BundleTotal.objects.filter(bundle=bundle).values_list('price', 'price_delivered').first() or (0, 0)
+
+    return {
+        'sequence': bundle.sequence,
+        'cells': cells,
+        'groups': groups,
+        'products': products,
+        'price': format_price(from_micros(total[0])),
+        'price_delivered': format_price(from_micros(total[1])),
+    }
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class OrderConfig(AppConfig):
     name = 'order'
     verbose_name = "Order"
+
+    def ready(self):
+        from . import signals  # NOQA
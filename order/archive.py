@@ -0,0 +1,68 @@
+"""
+Archive for bundles that are closed for some time.
+
+Archiving a bundle turns its running totals (see order.totals) into a fixed
+settlement:
+
+* the price and the divisor of each product are saved in its ProductTotal, so
+  later changes of the catalog do not change the prices of the bundle.
+* orders and product totals without an ordered and a delivered amount are
+  deleted.
+* optionally, the remaining orders are moved to the table of the archived
+  orders, so the table of the orders only contains the active bundles.
+
+The totals of archived bundles are not rebuilt anymore and the views read the
+prices from the settlement.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import caching, totals
+from .models import ArchivedOrder, Bundle
+
+ZERO = Q(amount=0) & (Q(delivered=None) | Q(delivered=0))
+
+
+def archivable(days):
+    """
+    Returns a queryset with all bundles that are closed for at least the given
+    number of days and are not archived yet.
+    """
+    return Bundle.objects.filter(open=False, archived=False, closed__lte=timezone.now() - timedelta(days=days))
+
+
+def archive(bundle, move_orders=False):
+    """
+    Archives a closed bundle.
+
+    If move_orders is True, the orders of the bundle are moved to the model
+    ArchivedOrder.
+    """
+    if bundle.open:
+        raise ValueError("Open bundles can not be archived.")
+
+    with transaction.atomic(), totals.paused():
+        # The settlement is based on the current orders and prices.
+        totals.rebuild([bundle.pk])
+        bundle.orders.filter(ZERO).delete()
+        bundle.product_totals.filter(amount=0, delivered=0).delete()
+
+        for total in bundle.product_totals.select_related('product__unit'):
+            total.unit_price = total.product.price_cents
+            total.divisor = total.product.unit.divisor
+            total.save(update_fields=['unit_price', 'divisor'])
+
+        if move_orders:
+            ArchivedOrder.objects.bulk_create(
+                ArchivedOrder(bundle_id=bundle.pk, group_id=group, product_id=product, amount=amount,
+                              delivered=delivered, version=version)
+                for group, product, amount, delivered, version
+                in bundle.orders.values_list('group', 'product', 'amount', 'delivered', 'version').iterator())
+            bundle.orders.all().delete()
+
+        bundle.archived = True
+        bundle.save()
+    caching.bump_deferred()
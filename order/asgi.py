@@ -0,0 +1,226 @@
+"""
+ASGI application for the site.
+
+Django 1.7 only speaks WSGI, so ASGIHandler translates each http request of
+the ASGI server into a WSGI environ and lets the WSGI handler of Django (with
+all middleware) handle it in a pool of threads. The event loop receives the
+bodies and sends the responses, so slow clients do not hold a thread.
+
+The ajax-requests of the order page and the output table (one request for each
+changed input) are handled asynchronously: the view checks the request in a
+thread, adds the change to the WriteBuffer of the process and returns a
+DeferredResponse (see order.writes). The handler waits for the batch of the
+change in the event loop and only needs a thread again to calculate the new
+prices. So many small writes can be in flight with a few threads and the
+changes, that arrive at the same time, are saved in one transaction.
+
+Run it with an ASGI server, for example:
+
+    uvicorn foodcoop.asgi:application
+
+Streaming responses (e.g. the server-sent events of the output table) are read
+chunk by chunk in the pool, so each open stream holds a thread while it waits
+for the next event.
+
+The module needs Python 3.5 (and so Django 1.8). The rest of the site does not
+import it.
+"""
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import close_old_connections
+
+from . import writes
+
+THREADS = 10
+
+
+def environ_from_scope(scope, body):
+    """
+    Returns the WSGI environ for the scope of an ASGI http request and its body.
+    """
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin-1')
+        environ[name] = environ[name] + ',' + value if name in environ else value
+    # The body is already read, also if it was sent in chunks.
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+async def read_body(receive):
+    """
+    Returns the whole body of an ASGI http request.
+    """
+    body = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+    return b''.join(body)
+
+
+class ASGIHandler:
+    """
+    ASGI application (version 3), that runs Django in a pool of threads.
+
+    threads is the size of the pool, the default is settings.ORDER_ASGI_THREADS
+    or THREADS.
+    """
+
+    def __init__(self, threads=None):
+        self.wsgi_handler = WSGIHandler()
+        self.executor = ThreadPoolExecutor(threads or getattr(settings, 'ORDER_ASGI_THREADS', THREADS))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError("Unsupported scope type {}".format(scope['type']))
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def run(self, function, *args):
+        return await asyncio.get_event_loop().run_in_executor(self.executor, run_in_thread, function, *args)
+
+    def handle(self, environ):
+        """
+        Runs the WSGI handler in a thread of the pool and returns a tuple
+        (status, headers, response, body).
+
+        A complete response is read and closed in the same thread, so Django
+        closes the database connection of the thread, that served the request.
+        For a DeferredResponse and a streaming response, body is None and the
+        response has to be closed later.
+        """
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        response = self.wsgi_handler(environ, start_response)
+        if isinstance(response, writes.DeferredResponse) or getattr(response, 'streaming', False):
+            return started[0], started[1], response, None
+        try:
+            body = b''.join(response)
+        finally:
+            response.close()
+        return started[0], started[1], response, body
+
+    def complete(self, response, saved):
+        """
+        Sets the content of a DeferredResponse and closes it in the same thread.
+        """
+        try:
+            response.complete(saved)
+            return b''.join(response)
+        finally:
+            response.close()
+
+    async def http(self, scope, receive, send):
+        environ = environ_from_scope(scope, await read_body(receive))
+        environ[writes.DEFER_WRITES] = True
+
+        status, headers, response, body = await self.run(self.handle, environ)
+        try:
+            if isinstance(response, writes.DeferredResponse):
+                saved = await commit(response.buffer, response.batch, self.executor)
+                body = await self.run(self.complete, response, saved)
+
+            await send({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            })
+            if body is None:
+                chunks = iter(response)
+                while True:
+                    chunk = await self.run(next, chunks, None)
+                    if chunk is None:
+                        break
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+            else:
+                await send({'type': 'http.response.body', 'body': body})
+        finally:
+            if body is None:
+                # Django sends the signal request_finished and closes the
+                # database connection of this thread.
+                await self.run(response.close)
+
+
+def run_in_thread(function, *args):
+    """
+    Calls function in a thread of the pool.
+
+    The steps of a request (e.g. a DeferredResponse or the chunks of a
+    streaming response) can run in different threads, so the database
+    connections of the thread are closed afterwards (if they are too old), like
+    Django does at the end of a request.
+    """
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+
+def set_done(future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def commit(buffer, batch, executor=None):
+    """
+    Waits in the event loop until the batch of the WriteBuffer buffer is saved.
+    Returns False, if it could not be saved.
+
+    Like WriteBuffer.commit, the batch is saved by this request, if it is not
+    saved in time. Then flush is called in the executor.
+    """
+    loop = asyncio.get_event_loop()
+    saved = loop.create_future()
+    delay = buffer.add_waiter(batch, partial(loop.call_soon_threadsafe, set_done, saved))
+    try:
+        await asyncio.wait_for(asyncio.shield(saved), delay)
+    except asyncio.TimeoutError:
+        await loop.run_in_executor(executor, run_in_thread, buffer.flush, batch)
+    return batch not in buffer.failed
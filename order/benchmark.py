@@ -0,0 +1,275 @@
+"""
+Benchmark for all views of order.urls.
+
+Each view is requested several times with the test client. For each view the
+median and the 95th percentile of the latency, the number of queries and the
+peak memory (measured with tracemalloc in an extra request, only on Python 3.4
+and later) are reported.
+
+concurrent_orders() measures, how many orders per second the database saves,
+if many groups order at the same time. The comparison of the WSGI and the ASGI
+application is in order.loadtest.
+"""
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client, RequestFactory
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.crypto import get_random_string
+from django.utils.importlib import import_module
+
+from . import seeding
+from .urls import urlpatterns
+
+AJAX = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+
+def percentile(values, percent):
+    """
+    Returns the percentile of a list of values (nearest-rank method).
+    """
+    values = sorted(values)
+    index = max(0, int(round(percent / 100 * len(values))) - 1)
+    return values[index]
+
+
+def get_requests(data):
+    """
+    Returns a list of tuples (name, url_name, args, method, data, extra) with all
+    requests of the benchmark, using the objects created by seeding.seed().
+
+    The requests with side effects are at the end of the list, so they do not
+    change the data for the other requests.
+    """
+    bundle = data['bundles'][0].pk
+    group = data['groups'][0]
+    product = data['products'][0].pk
+    products = [product.pk for product in data['products'][:20]]
+    groups = [data['groups'][i % len(data['groups'])].pk for i in range(len(products))]
+    return [
+        ('bundle_list', 'order_bundle_list', [], 'GET', {}, {}),
+        ('bundle_newest', 'order_bundle_newest', [], 'GET', {}, {}),
+        ('bundle_detail', 'order_bundle_detail', [bundle], 'GET', {'group': group.pk}, {}),
+        ('bundle_detail_ajax', 'order_bundle_detail', [bundle], 'POST', {'product': product, 'amount': 5}, AJAX),
+        ('bundle_detail_batch', 'order_bundle_detail_batch', [bundle], 'POST',
+         {'product': products, 'amount': [5] * len(products)}, AJAX),
+        ('bundle_order', 'order_bundle_order', [bundle], 'GET', {}, {}),
+        ('bundle_order_export', 'order_bundle_order_export', [bundle, 'ordered', 'csv'], 'GET', {}, {}),
+        ('bundle_output', 'order_bundle_output', [bundle], 'GET', {}, {}),
+        ('bundle_output_ajax', 'order_bundle_output', [bundle], 'POST',
+         {'product': product, 'group': group.pk, 'delivered': 3}, AJAX),
+        ('bundle_output_batch', 'order_bundle_output_batch', [bundle], 'POST',
+         {'product': products, 'group': groups, 'delivered': [3] * len(products)}, AJAX),
+        ('bundle_output_events', 'order_bundle_output_events', [bundle], 'GET', {'duration': 0}, {}),
+        ('bundle_data', 'order_bundle_data', [bundle], 'GET', {}, {'HTTP_ACCEPT_ENCODING': 'gzip'}),
+        ('bundle_changes', 'order_bundle_changes', [bundle], 'GET', {'since': 1}, {}),
+        ('bundle_output_export', 'order_bundle_output_export', [bundle, 'delivered', 'tsv'], 'GET', {}, {}),
+        ('bundle_delete', 'order_bundle_delete', [bundle], 'GET', {}, {}),
+        ('product_update', 'order_product_update', [product], 'GET', {}, {}),
+        ('product_formset', 'order_product_formset', [], 'GET', {}, {}),
+        ('product_import', 'order_product_import', [], 'GET', {}, {}),
+        ('group_list', 'order_group_list', [], 'GET', {}, {}),
+        ('group_create', 'order_group_create', [], 'GET', {}, {}),
+        ('group_update', 'order_group_update', [group.pk], 'GET', {}, {}),
+        ('group_delete', 'order_group_delete', [group.pk], 'GET', {}, {}),
+        ('bundle_close', 'order_bundle_close', [bundle], 'GET', {}, {}),
+        ('bundle_open', 'order_bundle_open', [bundle], 'GET', {}, {}),
+        ('bundle_create', 'order_bundle_create', [], 'GET', {}, {}),
+    ]
+
+
+def missing_url_names(results):
+    """
+    Returns the names of all urls in order.urls, that are not in the results of
+    run().
+    """
+    return sorted(set(pattern.name for pattern in urlpatterns) - set(result['url_name'] for result in results.values()))
+
+
+def request(client, url, method, data, extra):
+    response = getattr(client, method.lower())(url, data, **extra)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def measure(client, url, method, data, extra, repeat):
+    """
+    Requests the url repeat times and returns a dict with the results.
+    """
+    latencies = []
+    queries = []
+    for __ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = request(client, url, method, data, extra)
+            latencies.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured))
+
+    peak = peak_memory(request, client, url, method, data, extra)
+
+    return {
+        'status': response.status_code,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'queries': percentile(queries, 50),
+        'peak_memory_kb': None if peak is None else round(peak / 1024, 1),
+    }
+
+
+def peak_memory(function, *args):
+    """
+    Calls the function and returns the peak of the memory, that was allocated
+    meanwhile, in bytes.
+
+    Returns None, if tracemalloc is not available (before Python 3.4).
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        function(*args)
+        return None
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(size, repeat=10, random_seed=0):
+    """
+    Seeds the database with the given size (a dict with the arguments for
+    seeding.seed) and benchmarks all requests.
+
+    Returns a dict where the key is the name of the request and the value the
+    result of measure().
+    """
+    data = seeding.seed(random_seed=random_seed, **size)
+    client = Client()
+    results = {}
+    for name, url_name, args, method, post_data, extra in get_requests(data):
+        url = reverse(url_name, args=args)
+        results[name] = dict(measure(client, url, method, post_data, extra, repeat), url_name=url_name)
+    return results
+
+
+@contextmanager
+def thread_database(**extra_settings):
+    """
+    Creates a new test database, that can be used by many threads, and
+    overrides the cache and the extra settings while it is used.
+
+    A SQLite test database is created as a file, because the connections of
+    other threads can not see an in-memory database.
+    """
+    if connection.vendor == 'sqlite':
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(
+            tempfile.mkdtemp(), 'benchmark.sqlite3')
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    old_config = runner.setup_databases()
+    try:
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'order-benchmark'}},
+                **extra_settings):
+            yield
+    finally:
+        runner.teardown_databases(old_config)
+
+
+def get_ajax_extra(group):
+    """
+    Returns the WSGI headers of an ajax-request of the group: a new session
+    with the active group and a csrf token.
+    """
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session['active_group'] = group
+    session.save()
+    token = get_random_string(32)
+    return {
+        'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest',
+        'HTTP_X_CSRFTOKEN': token,
+        'HTTP_COOKIE': '{}={}; {}={}'.format(
+            settings.SESSION_COOKIE_NAME, session.session_key, settings.CSRF_COOKIE_NAME, token),
+    }
+
+
+def get_order_environs(data, orders):
+    """
+    Returns a list of WSGI environs, where each group of the data of
+    seeding.seed() orders the amounts of orders products on the order page.
+
+    The requests of the groups alternate, so all groups order at the same time.
+    """
+    url = reverse('order_bundle_detail', args=[data['bundles'][0].pk])
+    products = [product.pk for product in data['products']]
+    extras = [get_ajax_extra(group.pk) for group in data['groups']]
+    factory = RequestFactory()
+    return [
+        factory.post(url, {'product': products[i % len(products)], 'amount': i + 1}, **extra).environ
+        for i in range(orders) for extra in extras]
+
+
+def summarize(latencies, errors, duration):
+    """
+    Returns a dict with the results of concurrent_orders() or of a server in
+    loadtest.compare_servers().
+    """
+    return {
+        'requests_per_second': round(len(latencies) / duration, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'errors': errors,
+    }
+
+
+def is_error(status, body):
+    return status != 200 or 'error' in json.loads(body.decode('utf-8'))
+
+
+def wsgi_request(handler, environ):
+    """
+    Sends one request to a WSGI handler in the current thread. Returns a tuple
+    (status, body).
+    """
+    started = []
+    response = handler(environ, lambda status, headers, exc_info=None: started.append(status))
+    try:
+        content = b''.join(response)
+    finally:
+        response.close()
+    return int(started[0].split(' ', 1)[0]), content
+
+
+def concurrent_orders(data, orders=10, threads=8):
+    """
+    Lets all groups of the data of seeding.seed() order orders products at the
+    same time. The requests are handled by the WSGI handler of Django in threads
+    threads.
+
+    Returns the result of summarize(), where requests_per_second is the number
+    of saved orders per second and errors contains the failed writes (e.g.
+    "database is locked").
+    """
+    environs = get_order_environs(data, orders)
+    handler = WSGIHandler()
+
+    def send(environ):
+        start = time.perf_counter()
+        status, content = wsgi_request(handler, environ)
+        return (time.perf_counter() - start) * 1000, is_error(status, content)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(send, environs))
+    duration = time.perf_counter() - start
+    return summarize([latency for latency, __ in results], sum(error for __, error in results), duration)
@@ -0,0 +1,51 @@
+"""
+Cache profiles for the site.
+
+The generations of order.caching and the sessions (SESSION_ENGINE cached_db)
+are kept in the cache, so all processes of the site have to use the same
+cache. Otherwise a process keeps serving pages and the active group of a
+session, that were changed by another process. The profile is selected with
+the environment variable FOODCOOP_CACHE (see get_caches):
+
+* file (default): files in the directory FOODCOOP_CACHE_DIR, which all
+  processes on one host share.
+
+* memcached: the memcached servers in FOODCOOP_CACHE_LOCATION (separated by
+  ';', needs python-memcached), which also processes on other hosts share.
+
+* locmem: the memory of the process. Only for a site, that runs in one process
+  (e.g. with runserver), and for the tests.
+"""
+import os
+
+FILE = 'file'
+MEMCACHED = 'memcached'
+LOCMEM = 'locmem'
+
+MAX_ENTRIES = 10000
+
+
+def get_caches(environ=os.environ, base_dir=''):
+    """
+    Returns the setting CACHES for the profile in environ['FOODCOOP_CACHE'].
+
+    The profile file uses environ['FOODCOOP_CACHE_DIR'] or the directory cache
+    in base_dir.
+    """
+    profile = environ.get('FOODCOOP_CACHE', FILE)
+    if profile == FILE:
+        return {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': environ.get('FOODCOOP_CACHE_DIR', os.path.join(base_dir, 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': MAX_ENTRIES},
+        }}
+    if profile == MEMCACHED:
+        return {'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': environ.get('FOODCOOP_CACHE_LOCATION', '127.0.0.1:11211').split(';'),
+        }}
+    if profile == LOCMEM:
+        return {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}
+    raise ValueError("Unknown cache profile '{}', use '{}', '{}' or '{}'.".format(profile, FILE, MEMCACHED, LOCMEM))
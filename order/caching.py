@@ -0,0 +1,176 @@
+"""
+Cache for the product catalog and for the rendered pages of closed bundles.
+
+The cache keys contain generation numbers, which are saved in the cache too.
+Instead of deleting cached pages, the generation is replaced by a new one (see
+order.signals), so all old keys are not used anymore and expire. The cache has
+to be shared by all processes of the site (see order.cacheprofiles).
+
+* the generation of a bundle changes, if the bundle or one of its orders is
+  changed.
+* the generation of the catalog changes, if a product, a unit or a group is
+  changed.
+
+Together with the time of their last change, the generations are also used as
+version of a bundle for conditional requests (see bundle_version).
+
+A generation, that is replaced in a transaction, is replaced again after the
+commit (see bump_deferred). Otherwise a concurrent request could read the
+data before the commit and cache it with the new generation.
+"""
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Group, Product
+
+PAGE_TIMEOUT = getattr(settings, 'ORDER_PAGE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+CATALOG = 'catalog'
+
+_deferred = threading.local()
+
+
+def _generation_key(name):
+    return 'order-generation:{}'.format(name)
+
+
+def _modified_key(name):
+    return 'order-modified:{}'.format(name)
+
+
+def _new_generation():
+    # A value based on the time, so a generation that was evicted from the
+    # cache does not start with a number that was used before, and a random
+    # part, so two processes, that change the same bundle at the same moment,
+    # do not set the same generation (the file cache has no atomic incr).
+    return int(time.time() * 1000) * 1000000 + random.randrange(1000000)
+
+
+def get_generations(*names):
+    """
+    Returns a list with the current generation for each name.
+    """
+    keys = [_generation_key(name) for name in names]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, _new_generation(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def _replace_generation(name):
+    cache.set(_generation_key(name), _new_generation(), None)
+    cache.set(_modified_key(name), time.time(), None)
+
+
+def bump_generation(name):
+    """
+    Replaces the generation, so all cache keys with the old generation become
+    invalid.
+
+    In a transaction, the generation is replaced once more by bump_deferred.
+    """
+    _replace_generation(name)
+    if transaction.get_connection().in_atomic_block:
+        _deferred.__dict__.setdefault('names', set()).add(name)
+
+
+def bump_deferred():
+    """
+    Replaces the generations, that were replaced in a transaction of this
+    thread, again. Has to be called after the transaction is committed or
+    rolled back, e.g. by order.middleware.CacheGenerationMiddleware after each
+    request.
+    """
+    for name in _deferred.__dict__.pop('names', ()):
+        _replace_generation(name)
+
+
+def bundle_generation_name(bundle_pk):
+    return 'bundle-{}'.format(bundle_pk)
+
+
+def bundle_changed(bundle_pk):
+    """
+    Invalidates all cached pages of a bundle.
+    """
+    bump_generation(bundle_generation_name(bundle_pk))
+
+
+def catalog_changed():
+    """
+    Invalidates all cached pages.
+    """
+    bump_generation(CATALOG)
+
+
+def bundle_version(bundle_pk):
+    """
+    Returns a tuple (generations, modified) for a bundle, where generations is
+    a tuple with the generations of the bundle and the catalog and modified is
+    the time of the last change of one of them as datetime.
+
+    All values are read from the cache at once.
+    """
+    names = (bundle_generation_name(bundle_pk), CATALOG)
+    keys = [_generation_key(name) for name in names] + [_modified_key(name) for name in names]
+    values = cache.get_many(keys)
+    if len(values) < len(keys):
+        # Unknown generations are created with the current time
+        generations = get_generations(*names)
+        now = time.time()
+        for name in names:
+            cache.add(_modified_key(name), now, None)
+        values = cache.get_many(keys)
+        values.update(zip(keys, generations))
+    modified = max(values.get(_modified_key(name), time.time()) for name in names)
+    return (tuple(values[_generation_key(name)] for name in names),
+            datetime.fromtimestamp(modified, timezone.utc))
+
+
+def page_key(bundle, view_name, extra=''):
+    """
+    Returns the cache key for a page of a bundle.
+    """
+    bundle_generation, catalog_generation = get_generations(bundle_generation_name(bundle.pk), CATALOG)
+    return 'order-page:{}:{}:{}:{}:{}'.format(
+        bundle.pk, bundle_generation, catalog_generation, view_name, extra)
+
+
+def get_page(key):
+    """
+    Returns the tuple (content, content_type) for a cached page or None.
+    """
+    return cache.get(key)
+
+
+def set_page(key, response):
+    cache.set(key, (response.content, response['Content-Type']), PAGE_TIMEOUT)
+
+
+def get_catalog():
+    """
+    Returns a dict with the catalog for the order page:
+
+    * products: list of all available products, with their units
+    * groups:   list of all groups, that can order
+
+    The catalog is cached until the generation of the catalog changes.
+    """
+    catalog_generation, = get_generations(CATALOG)
+    key = 'order-catalog:{}'.format(catalog_generation)
+    catalog = cache.get(key)
+    if catalog is None:
+        catalog = {
+            'products': list(Product.objects.filter(available=True).select_related('unit')),
+            'groups': list(Group.objects.filter(enclosure=True)),
+        }
+        cache.set(key, catalog, PAGE_TIMEOUT)
+    return catalog
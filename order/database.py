@@ -0,0 +1,112 @@
+"""
+Database profiles for the site.
+
+The profile is selected with the environment variable FOODCOOP_DATABASE (see
+get_databases):
+
+* sqlite (default): a SQLite file. On each new connection the pragmas of
+  settings.ORDER_SQLITE_PRAGMAS are set (see configure_sqlite). With WAL
+  journaling the readers do not block the writer and the writer does not block
+  the readers, and with a busy timeout a writer waits for the lock of another
+  writer instead of failing with "database is locked".
+
+* postgresql: a PostgreSQL database (needs psycopg2). The connections are kept
+  open for FOODCOOP_DB_CONN_MAX_AGE seconds and are reused by the following
+  requests of the same thread, so each thread of the server (or of the ASGI
+  handler, see order.asgi) keeps one connection. To share a pool between processes, let
+  FOODCOOP_DB_HOST and FOODCOOP_DB_PORT point to a pooler like pgbouncer.
+"""
+import os
+
+from django.conf import settings
+
+SQLITE = 'sqlite'
+POSTGRESQL = 'postgresql'
+
+CONN_MAX_AGE = 600
+
+UPSERT_SQLITE_VERSION = (3, 24)
+UPSERT_POSTGRESQL_VERSION = 90500
+"""
+SQLite and PostgreSQL versions for INSERT ... ON CONFLICT.
+"""
+
+RETURNING_SQLITE_VERSION = (3, 35)
+RETURNING_POSTGRESQL_VERSION = 80200
+"""
+SQLite and PostgreSQL versions for UPDATE ... RETURNING.
+"""
+
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    # With WAL, NORMAL is safe against corruption. Only the last transactions
+    # can be lost, if the system (not the process) crashes.
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 20000),
+    # 20 MB page cache for each connection
+    ('cache_size', -20000),
+    ('temp_store', 'MEMORY'),
+)
+"""
+Default for settings.ORDER_SQLITE_PRAGMAS.
+"""
+
+
+def get_databases(environ=os.environ, base_dir=''):
+    """
+    Returns the setting DATABASES for the profile in environ['FOODCOOP_DATABASE'].
+
+    The profile sqlite uses environ['FOODCOOP_SQLITE_PATH'] or db.sqlite3 in
+    base_dir. The profile postgresql uses FOODCOOP_DB_NAME, FOODCOOP_DB_USER,
+    FOODCOOP_DB_PASSWORD, FOODCOOP_DB_HOST, FOODCOOP_DB_PORT and
+    FOODCOOP_DB_CONN_MAX_AGE.
+    """
+    profile = environ.get('FOODCOOP_DATABASE', SQLITE)
+    if profile == SQLITE:
+        return {'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': environ.get('FOODCOOP_SQLITE_PATH', os.path.join(base_dir, 'db.sqlite3')),
+        }}
+    if profile == POSTGRESQL:
+        return {'default': {
+            'ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'NAME': environ.get('FOODCOOP_DB_NAME', 'foodcoop'),
+            'USER': environ.get('FOODCOOP_DB_USER', ''),
+            'PASSWORD': environ.get('FOODCOOP_DB_PASSWORD', ''),
+            'HOST': environ.get('FOODCOOP_DB_HOST', ''),
+            'PORT': environ.get('FOODCOOP_DB_PORT', ''),
+            'CONN_MAX_AGE': int(environ.get('FOODCOOP_DB_CONN_MAX_AGE', CONN_MAX_AGE)),
+        }}
+    raise ValueError("Unknown database profile '{}', use '{}' or '{}'.".format(profile, SQLITE, POSTGRESQL))
+
+
+def configure_sqlite(connection):
+    """
+    Sets the pragmas of settings.ORDER_SQLITE_PRAGMAS on a new connection, if
+    it is a SQLite connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    # Use the cursor of sqlite3, so the pragmas are not logged as queries.
+    cursor = connection.connection.cursor()
+    for name, value in getattr(settings, 'ORDER_SQLITE_PRAGMAS', SQLITE_PRAGMAS):
+        cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+
+def sqlite_version_info():
+    from django.db.backends.sqlite3.base import Database
+    return Database.sqlite_version_info
+
+
+def supports(connection, sqlite_version, postgresql_version):
+    """
+    Returns True, if the database of the connection supports a statement, that
+    needs the given SQLite version (as tuple) or PostgreSQL version (as number
+    like connection.pg_version, e.g. 90500 for 9.5).
+
+    Other databases and older versions (e.g. the SQLite libraries of older
+    Python builds) use the statements of the ORM instead.
+    """
+    if connection.vendor == 'postgresql':
+        return connection.pg_version >= postgresql_version
+    return connection.vendor == 'sqlite' and sqlite_version_info() >= sqlite_version
@@ -0,0 +1,127 @@
+"""
+In-process publish/subscribe for changes of bundles.
+
+BundleOutputView publishes each change of the delivered amounts, so all clients
+showing the output table of the bundle can update the changed cells and totals
+without loading the whole page again. The clients receive the changes as a
+stream of server-sent events (see BundleOutputEventsView).
+
+The events are only kept in the memory of the current process and no external
+broker is needed. This works with a single (threaded) server process. If the
+site runs in more then one process, a client only receives the changes that
+were made in the process, that serves its stream.
+
+Each bundle has a channel, which numbers its events and keeps the last
+BUFFER_SIZE events. A client, that reconnects with the id of the last event it
+has seen, receives all events it has missed. If the events are not available
+anymore (or the process was restarted), the client receives a 'reload' event.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+BUFFER_SIZE = 200
+
+STREAM_DURATION = 60
+"""
+Maximum time in seconds, a stream is kept open. Each open stream needs a thread
+of the server. The browser reconnects automatically after the end of a stream.
+"""
+
+HEARTBEAT = 15
+"""
+Time in seconds after that a comment is send, if there was no event.
+"""
+
+RETRY = 1000
+"""
+Time in milliseconds, the browser waits before it reconnects.
+"""
+
+_channels = {}
+_channels_lock = threading.Lock()
+
+
+class Channel:
+    """
+    The events of one bundle.
+
+    events contains tuples (id, data) for the last events.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.events = deque(maxlen=BUFFER_SIZE)
+        self.last_id = 0
+
+    def publish(self, data):
+        """
+        Adds an event and wakes up all waiting clients. Returns the id of the
+        event.
+        """
+        with self.condition:
+            self.last_id += 1
+            self.events.append((self.last_id, data))
+            self.condition.notify_all()
+            return self.last_id
+
+    def get_since(self, last_id):
+        """
+        Returns a list of all events after last_id or None, if some of these
+        events are not available anymore.
+        """
+        with self.condition:
+            if last_id > self.last_id or (self.events and last_id < self.events[0][0] - 1):
+                return None
+            return [event for event in self.events if event[0] > last_id]
+
+    def wait(self, last_id, timeout):
+        """
+        Waits at most timeout seconds for events after last_id and returns them
+        like get_since.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.last_id != last_id, timeout)
+            return self.get_since(last_id)
+
+
+def get_channel(bundle_pk):
+    with _channels_lock:
+        return _channels.setdefault(int(bundle_pk), Channel())
+
+
+def publish(bundle_pk, data):
+    """
+    Publishes a change of a bundle. data has to be serializable as json.
+    """
+    return get_channel(bundle_pk).publish(data)
+
+
+def format_event(event_id, name, data):
+    return "id: {}\nevent: {}\ndata: {}\n\n".format(event_id, name, json.dumps(data))
+
+
+def stream(bundle_pk, last_id=None, duration=STREAM_DURATION):
+    """
+    Yields the events of a bundle in the format of server-sent events.
+
+    If last_id is None, only new events are send. Stops after duration seconds.
+    """
+    channel = get_channel(bundle_pk)
+    if last_id is None:
+        last_id = channel.last_id
+    yield "retry: {}\n\n".format(RETRY)
+
+    end = time.time() + duration
+    while True:
+        events = channel.wait(last_id, max(0, min(HEARTBEAT, end - time.time())))
+        if events is None:
+            yield format_event(channel.last_id, 'reload', {})
+            return
+        for last_id, data in events:
+            yield format_event(last_id, 'change', data)
+        if not events:
+            yield ": keep-alive\n\n"
+        if time.time() >= end:
+            return
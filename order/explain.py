@@ -0,0 +1,77 @@
+"""
+EXPLAIN for the frequent queries of the views, to find queries that have to
+read a whole table.
+
+The queries are the same as in order.models, order.views and order.pivot, but
+with objects that do not have to exist in the database. Only the query plans
+are read, the queries are not executed.
+"""
+import re
+
+from django.db import connection
+
+from .models import Bundle, BundleTotal, Group, Order, Product
+
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+
+def hot_queries():
+    """
+    Returns a list of tuples (name, queryset) for the frequent queries.
+    """
+    bundle, group, product = Bundle(pk=1), Group(pk=1), Product(pk=1)
+    return [
+        ('detail: orders of a group', Order.objects.filter(bundle=bundle, group=group)),
+        ('detail: order of a product', Order.objects.filter(bundle=bundle, group=group, product=product)),
+        ('detail batch: orders of products',
+         Order.objects.filter(bundle=bundle, group=group, product__in=[product.pk])),
+        ('output: all orders', bundle.orders.values_list('group', 'product', 'amount', 'delivered', 'version')),
+        ('output batch: orders of cells', bundle.orders.filter(group__in=[group.pk], product__in=[product.pk])),
+        ('changes: orders since a sequence', bundle.orders.filter(sequence__gt=0).order_by('sequence')),
+        ('totals: orders of bundles', Order.objects.filter(bundle__in=[bundle.pk])),
+        ('totals: product of a bundle', bundle.orders.filter(product=product)),
+        ('bundle total', BundleTotal.objects.filter(bundle=bundle)),
+        ('group total', bundle.group_totals.filter(group=group)),
+        ('product totals', bundle.product_totals.filter(product__in=[product.pk])),
+    ]
+
+
+def explain(queryset):
+    """
+    Returns the query plan of a queryset as list of strings.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(EXPLAIN_PREFIXES[connection.vendor] + sql, params)
+        return [" ".join(str(column) for column in row) for row in cursor.fetchall()]
+
+
+def is_full_scan(line, table):
+    """
+    Returns True, if the line of a query plan reads the whole table without an
+    index.
+    """
+    if connection.vendor == 'sqlite':
+        # e.g. "SCAN TABLE order_order" or "SCAN order_order"
+        return re.search(r'\bSCAN (TABLE )?{}\b'.format(table), line) is not None and 'INDEX' not in line
+    if connection.vendor == 'postgresql':
+        return 'Seq Scan on {}'.format(table) in line
+    # mysql: the column 'type' is ALL for full scans
+    return ' {} '.format(table) in line and ' ALL ' in line
+
+
+def full_scans():
+    """
+    Returns a list of tuples (name, plan, scanned) for each hot query, where
+    scanned is True, if the query reads the whole table of its model.
+    """
+    results = []
+    for name, queryset in hot_queries():
+        plan = explain(queryset)
+        table = queryset.model._meta.db_table
+        results.append((name, plan, any(is_full_scan(line, table) for line in plan)))
+    return results
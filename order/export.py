@@ -0,0 +1,120 @@
+"""
+Export of bundles as csv- or tsv-files.
+
+The rows are read in chunks (see order.pagination.keyset_rows) and are
+streamed to the client, so a bundle is never loaded into memory at once.
+"""
+import csv
+from itertools import chain
+
+from django.http import StreamingHttpResponse
+
+from .fields import from_cents, from_micros, line_price
+from .models import Group
+from .pagination import keyset_rows
+
+DELIMITERS = {'csv': ',', 'tsv': '\t'}
+
+CONTENT_TYPES = {'csv': 'text/csv', 'tsv': 'text/tab-separated-values'}
+
+
+class Echo:
+    """
+    File-like object for csv.writer, that returns the written value instead of
+    saving it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def format_price(price):
+    return "{:.2f}".format(price)
+
+
+def order_rows(bundle, delivered=False):
+    """
+    Yields the rows of the order summary (see BundleOrderView).
+
+    If delivered is True, the delivered amounts are used instead of the ordered
+    amounts.
+    """
+    yield ["Produkt", "Menge", "Einheit", "Preis", "Gesamtpreis"]
+
+    # Archived bundles have the prices of their settlement
+    price_field = 'unit_price' if bundle.archived else 'product__price_cents'
+    totals = keyset_rows(bundle.product_totals.filter(amount__gt=0), ('product__name', 'product'),
+                         ('product__name', 'product__unit__name', 'product__unit__order_name', price_field, 'amount',
+                          'delivered', 'price', 'price_delivered'))
+    price_for_all = 0
+    for name, unit, order_unit, price, amount, delivered_amount, order_price, delivered_price in totals:
+        if delivered:
+            amount, order_price = delivered_amount, delivered_price
+        price_for_all += order_price
+        yield [name, amount, order_unit or unit, "" if price is None else format_price(from_cents(price)),
+               format_price(from_micros(order_price))]
+
+    yield ["Gesamtpreis", "", "", "", format_price(from_micros(price_for_all))]
+
+
+def output_rows(bundle, delivered=False):
+    """
+    Yields the rows of the output table (see BundleOutputView), with one column
+    for each group.
+
+    If delivered is False, the cells contain the ordered amounts, else the
+    delivered amounts. The last row contains the price for each group.
+    """
+    groups = Group.objects.filter(order__bundle=bundle)
+    if bundle.archived:
+        groups = groups | Group.objects.filter(archived_orders__bundle=bundle)
+    groups = list(groups.distinct().values_list('pk', 'name'))
+    group_index = dict((pk, i) for i, (pk, __) in enumerate(groups))
+    yield ["Produkt", "Einheit", "Summe"] + [name for __, name in groups]
+
+    fields = ('product', 'product__name', 'product__unit__name', 'product__unit__order_name', 'product__price_cents',
+              'product__unit__divisor', 'group', 'amount', 'delivered')
+    keys = ('product__name', 'product', 'group')
+    orders = keyset_rows(bundle.orders.all(), keys, fields)
+    settled_prices = None
+    if bundle.archived:
+        settled_prices = bundle.get_settled_prices()
+        # order.archive moves all orders of a bundle at once, so only one of
+        # them contains orders.
+        orders = chain(orders, keyset_rows(bundle.archived_orders.all(), keys, fields))
+
+    group_prices = [0] * len(groups)
+    row = None
+    for product, name, unit, order_unit, price, divisor, group, amount, delivered_amount in orders:
+        if settled_prices is not None:
+            price, divisor = settled_prices.get(product, (None, divisor))
+        if row is None or row[0] != product:
+            if row is not None and row[1] > 0:
+                yield row[2]
+            # row is [product, ordered amount, csv-row]
+            row = [product, 0, [name, order_unit or unit, 0] + [""] * len(groups)]
+
+        value = amount
+        if delivered:
+            value = delivered_amount if delivered_amount is not None else amount
+        row[1] += amount
+        row[2][2] += value
+        row[2][3 + group_index[group]] = value
+        group_prices[group_index[group]] += line_price(price, divisor, value)
+
+    if row is not None and row[1] > 0:
+        yield row[2]
+
+    yield (["Gesamtpreis", "", format_price(from_micros(sum(group_prices)))] +
+           [format_price(from_micros(price)) for price in group_prices])
+
+
+def streaming_response(rows, filename, file_format):
+    """
+    Returns a StreamingHttpResponse with the rows as csv- or tsv-file.
+    """
+    writer = csv.writer(Echo(), delimiter=DELIMITERS[file_format])
+    response = StreamingHttpResponse((writer.writerow(row) for row in rows),
+                                     content_type=CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(filename, file_format)
+    return response
@@ -0,0 +1,94 @@
+"""
+Integer fields for prices.
+
+Prices are saved as integers in cents (PriceField) and the running totals (see
+order.totals) as integers in millionths of euros, so prices can be added
+without Decimal objects and summed in the database. Only when a price is shown,
+it is converted to a Decimal in euros.
+
+The price of an order line is amount * price in cents / divisor of the unit.
+line_price returns it in millionths of euros, which is exact for all divisors,
+that divide 10000 (e.g. 1, 10, 100, 1000). Sums of line prices are rounded to
+cents only once, when they are formatted.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django import forms
+from django.db import models
+
+CENTS = 100
+
+MICROS_PER_CENT = 10000
+
+
+def to_cents(price):
+    """
+    Returns a price in euros (Decimal, int, float or string) as integer number of
+    cents or None.
+    """
+    if price is None or price == '':
+        return None
+    return int((Decimal(str(price)) * CENTS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    """
+    Returns a price in cents as Decimal in euros with two decimal places or None.
+    """
+    if cents is None:
+        return None
+    return Decimal(cents).scaleb(-2)
+
+
+def from_micros(micros):
+    """
+    Returns a price in millionths of euros (e.g. a running total) as Decimal in
+    euros.
+    """
+    return Decimal(micros or 0).scaleb(-6)
+
+
+def line_price(cents, divisor, amount):
+    """
+    Returns the price in millionths of euros for an amount of a product with a
+    price in cents and the divisor of its unit. A product without a price costs
+    nothing.
+    """
+    if cents is None or not amount:
+        return 0
+    numerator = 2 * amount * cents * MICROS_PER_CENT
+    return (numerator + divisor) // (2 * divisor)
+
+
+class PriceFormField(forms.DecimalField):
+    """
+    Form field for a PriceField, that shows and accepts the price in euros.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_digits', 10)
+        kwargs.setdefault('decimal_places', 2)
+        kwargs.setdefault('min_value', 0)
+        super().__init__(*args, **kwargs)
+
+    def prepare_value(self, value):
+        if isinstance(value, int):
+            return from_cents(value)
+        return value
+
+    def clean(self, value):
+        return to_cents(super().clean(value))
+
+    def _has_changed(self, initial, data):
+        return super()._has_changed(self.prepare_value(initial), data)
+
+
+class PriceField(models.IntegerField):
+    """
+    Price in cents.
+    """
+
+    def formfield(self, **kwargs):
+        defaults = {'form_class': PriceFormField}
+        defaults.update(kwargs)
+        return super().formfield(**defaults)
@@ -1,11 +1,36 @@
 from django import forms
 
-from .models import Group, Order, Product
+from . import caching
+from .models import Order, Product, Unit
+
+
+class GroupChoiceField(forms.TypedChoiceField):
+    """
+    ChoiceField for groups, that also accepts a group-object as value.
+    """
+
+    def prepare_value(self, value):
+        return getattr(value, 'pk', value)
 
 
 class GroupChooseForm(forms.Form):
-    group = forms.ModelChoiceField(
-        queryset=Group.objects.filter(enclosure=True))
+    """
+    Form to choose the active group.
+
+    The choices are the groups from the cached catalog (see order.caching), so
+    the form does not need a query.
+    """
+
+    group = GroupChoiceField(coerce=int)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.groups = dict((group.pk, group) for group in caching.get_catalog()['groups'])
+        self.fields['group'].choices = [('', '---------')] + [
+            (group.pk, group.name) for group in sorted(self.groups.values(), key=lambda group: group.name)]
+
+    def clean_group(self):
+        return self.groups[self.cleaned_data['group']]
 
 
 class OrderForm(forms.ModelForm):
@@ -15,5 +40,51 @@ class OrderForm(forms.ModelForm):
 
 
 class ProductForm(forms.ModelForm):
+    """
+    Form for one product.
+
+    unit_choices can be used to set the choices of the units, so forms for many
+    products do not need a query for each form.
+    """
+
     class Meta:
         model = Product
+        fields = ['name', 'unit', 'price_cents', 'available']
+
+    def __init__(self, *args, **kwargs):
+        unit_choices = kwargs.pop('unit_choices', None)
+        super().__init__(*args, **kwargs)
+        if unit_choices is not None:
+            self.fields['unit'].choices = unit_choices
+
+
+class ProductFilterForm(forms.Form):
+    """
+    Form to filter the products of the bulk editor.
+    """
+
+    name = forms.CharField(required=False, label="Name")
+    unit = forms.ModelChoiceField(Unit.objects.all(), required=False, label="Einheit")
+    available = forms.NullBooleanField(required=False, label="Verfügbar")
+
+    def filter(self, queryset):
+        """
+        Returns the queryset filtered with the cleaned data.
+        """
+        if self.cleaned_data.get('name'):
+            queryset = queryset.filter(name__icontains=self.cleaned_data['name'])
+        if self.cleaned_data.get('unit') is not None:
+            queryset = queryset.filter(unit=self.cleaned_data['unit'])
+        if self.cleaned_data.get('available') is not None:
+            queryset = queryset.filter(available=self.cleaned_data['available'])
+        return queryset
+
+
+class PriceListForm(forms.Form):
+    """
+    Form to upload a price list (see order.pricelist).
+    """
+
+    file = forms.FileField(label="Preisliste (CSV)")
+    disable_vanished = forms.BooleanField(required=False, label="Fehlende Produkte deaktivieren")
+    dry_run = forms.BooleanField(required=False, label="Nur Änderungen anzeigen")
@@ -0,0 +1,143 @@
+"""
+Load test of the WSGI and the ASGI application (see order.asgi).
+
+compare_servers() sends many concurrent ajax-requests of the order page and
+the output table to both applications. Like order.asgi, the module needs
+Python 3.5.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlencode
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.urlresolvers import reverse
+
+from .asgi import ASGIHandler, environ_from_scope
+from .benchmark import get_ajax_extra, is_error, summarize, wsgi_request
+
+
+def get_ajax_headers(group):
+    """
+    Returns the headers of an ajax-request of the group as ASGI headers (see
+    benchmark.get_ajax_extra).
+    """
+    headers = [(b'content-type', b'application/x-www-form-urlencoded')]
+    for name, value in sorted(get_ajax_extra(group).items()):
+        headers.append((name[len('HTTP_'):].lower().replace('_', '-').encode('ascii'), value.encode('ascii')))
+    return headers
+
+
+def get_ajax_scope(url, headers, data):
+    """
+    Returns a tuple (scope, body) for an ajax post-request.
+    """
+    scope = {'type': 'http', 'method': 'POST', 'path': url, 'query_string': b'', 'headers': headers,
+             'server': ('testserver', 80), 'client': ('127.0.0.1', 0)}
+    return scope, urlencode(data).encode('ascii')
+
+
+def get_ajax_scopes(data, count):
+    """
+    Returns a list of count ASGI scopes with bodies for ajax-requests of the
+    order page and the output table, using the objects created by
+    seeding.seed().
+    """
+    bundle = data['bundles'][0].pk
+    group = data['groups'][0].pk
+    products = [product.pk for product in data['products']]
+    headers = get_ajax_headers(group)
+
+    scopes = []
+    for i in range(count):
+        product = products[i // 2 % len(products)]
+        if i % 2:
+            scopes.append(get_ajax_scope(reverse('order_bundle_output', args=[bundle]), headers,
+                                         {'product': product, 'group': group, 'delivered': i}))
+        else:
+            scopes.append(get_ajax_scope(reverse('order_bundle_detail', args=[bundle]), headers,
+                                         {'product': product, 'amount': i}))
+    return scopes
+
+
+async def wsgi_client(loop, executor, handler, scope, body):
+    """
+    Sends one request to the WSGI handler, that runs in the threads of the
+    executor, like a threaded WSGI server. Returns a tuple (status, body).
+    """
+    return await loop.run_in_executor(executor, wsgi_request, handler, environ_from_scope(scope, body))
+
+
+async def asgi_client(application, scope, body):
+    """
+    Sends one request to the ASGI application. Returns a tuple (status, body).
+    """
+    messages = [{'type': 'http.request', 'body': body}]
+    status = []
+    content = []
+
+    async def receive():
+        return messages.pop() if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        else:
+            content.append(message.get('body', b''))
+
+    await application(scope, receive, send)
+    return status[0], b''.join(content)
+
+
+def measure_concurrent(send, scopes, concurrency):
+    """
+    Sends all requests with concurrency clients, that send their requests one
+    after another, and returns the result of summarize(). send is a coroutine
+    function, that gets the scope and the body and returns (status, body).
+    """
+    latencies = []
+    errors = 0
+    requests = iter(scopes)
+
+    async def client():
+        nonlocal errors
+        for scope, body in requests:
+            start = time.perf_counter()
+            status, content = await send(scope, body)
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += is_error(status, content)
+
+    loop = asyncio.new_event_loop()
+    try:
+        start = time.perf_counter()
+        loop.run_until_complete(asyncio.gather(*(client() for __ in range(concurrency)), loop=loop))
+        duration = time.perf_counter() - start
+    finally:
+        loop.close()
+    return summarize(latencies, errors, duration)
+
+
+def compare_servers(data, requests=200, concurrency=50, threads=4):
+    """
+    Sends the same ajax-requests to the WSGI handler of Django (running in
+    threads threads, like a threaded WSGI server) and to the ASGI application
+    (with threads threads), each time with concurrency concurrent clients.
+
+    Returns a dict with the result of summarize() for 'wsgi' and 'asgi'.
+    """
+    scopes = get_ajax_scopes(data, requests)
+    results = {}
+
+    handler = WSGIHandler()
+    with ThreadPoolExecutor(threads) as executor:
+        def send_wsgi(scope, body):
+            return wsgi_client(asyncio.get_event_loop(), executor, handler, scope, body)
+        results['wsgi'] = measure_concurrent(send_wsgi, scopes, concurrency)
+
+    application = ASGIHandler(threads)
+    try:
+        results['asgi'] = measure_concurrent(partial(asgi_client, application), scopes, concurrency)
+    finally:
+        application.executor.shutdown()
+    return results
@@ -0,0 +1,29 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from order import archive
+from order.models import Bundle
+
+
+class Command(BaseCommand):
+    """
+    Archives all bundles that are closed for some days (see order.archive).
+    """
+
+    help = "Archives bundles that are closed for some time."
+    args = "[bundle_id ...]"
+    option_list = BaseCommand.option_list + (
+        make_option('--days', type='int', default=30,
+                    help="Archive bundles that are closed for at least this number of days (default 30)."),
+        make_option('--move-orders', action='store_true', default=False,
+                    help="Move the orders to the table of the archived orders."),
+    )
+
+    def handle(self, *args, **options):
+        bundles = archive.archivable(options['days'])
+        if args:
+            bundles = Bundle.objects.filter(pk__in=args, open=False, archived=False)
+        for bundle in bundles:
+            archive.archive(bundle, move_orders=options['move_orders'])
+            self.stdout.write("Archived {} ({}).".format(bundle, bundle.pk))
@@ -0,0 +1,75 @@
+import json
+from datetime import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from order import benchmark
+
+
+def parse_sizes(value):
+    """
+    Parses sizes like '10x50,40x300' (groups x products) into a list of dicts
+    with arguments for order.seeding.seed().
+    """
+    sizes = []
+    for size in value.split(','):
+        try:
+            groups, products = (int(number) for number in size.split('x'))
+        except ValueError:
+            raise CommandError("Invalid size '{}', use GROUPSxPRODUCTS.".format(size))
+        sizes.append({'groups': groups, 'products': products})
+    return sizes
+
+
+class Command(BaseCommand):
+    """
+    Benchmarks all views of order.urls with synthetic data of different sizes
+    and saves the results as json.
+
+    The benchmark uses a new test database, so the data of the site is not
+    changed.
+    """
+
+    help = "Measures latency, queries and memory of all views for different data sizes."
+    option_list = BaseCommand.option_list + (
+        make_option('--sizes', default='10x50,40x300',
+                    help="Comma separated sizes as GROUPSxPRODUCTS (default 10x50,40x300)."),
+        make_option('--repeat', type='int', default=10, help="Number of requests for each view (default 10)."),
+        make_option('--output', default=None, help="Save the results as json to this file."),
+    )
+
+    def handle(self, *args, **options):
+        sizes = parse_sizes(options['sizes'])
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            # Only the cache of this process is used, so there are no cached
+            # pages from other runs.
+            with override_settings(CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'order-benchmark'}}):
+                results = self.run_sizes(sizes, options['repeat'])
+        finally:
+            runner.teardown_databases(old_config)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+
+    def run_sizes(self, sizes, repeat):
+        results = {'date': datetime.now().isoformat(), 'repeat': repeat, 'sizes': []}
+        for size in sizes:
+            size_results = benchmark.run(size, repeat)
+            missing = benchmark.missing_url_names(size_results)
+            if missing:
+                self.stderr.write("Not benchmarked: {}".format(", ".join(missing)))
+            results['sizes'].append(dict(size, results=size_results))
+            self.stdout.write("{groups} groups x {products} products".format(**size))
+            for name, result in sorted(size_results.items()):
+                memory = result['peak_memory_kb']
+                self.stdout.write("  {:<22} p50 {p50_ms:8.1f} ms  p95 {p95_ms:8.1f} ms  {queries:4d} queries  "
+                                  "{:>9} KiB".format(name, "-" if memory is None else "{:.1f}".format(memory),
+                                                     **result))
+        return results
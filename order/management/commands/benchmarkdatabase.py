@@ -0,0 +1,49 @@
+import json
+from datetime import datetime
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from order import benchmark, seeding
+
+from .benchmark import parse_sizes
+
+
+class Command(BaseCommand):
+    """
+    Measures the write throughput of the database profile (see order.database),
+    when many groups order at the same moment, and saves the results as json.
+
+    Run it once for each profile, e.g. with FOODCOOP_DATABASE=postgresql. The
+    benchmark uses a new test database, so the data of the site is not
+    changed.
+    """
+
+    help = "Measures the throughput of concurrent orders of many groups for the selected database."
+    option_list = BaseCommand.option_list + (
+        make_option('--size', default='40x100', help="Size as GROUPSxPRODUCTS (default 40x100)."),
+        make_option('--orders', type='int', default=10, help="Number of orders of each group (default 10)."),
+        make_option('--threads', type='int', default=8, help="Number of threads of the server (default 8)."),
+        make_option('--no-pragmas', action='store_true', default=False,
+                    help="Do not set ORDER_SQLITE_PRAGMAS, to compare with the defaults of SQLite."),
+        make_option('--output', default=None, help="Save the results as json to this file."),
+    )
+
+    def handle(self, *args, **options):
+        size, = parse_sizes(options['size'])
+        pragmas = () if options['no_pragmas'] else settings.ORDER_SQLITE_PRAGMAS
+        with benchmark.thread_database(ORDER_SQLITE_PRAGMAS=pragmas):
+            data = seeding.seed(**size)
+            result = benchmark.concurrent_orders(data, options['orders'], options['threads'])
+
+        profile = connection.vendor
+        if profile == 'sqlite':
+            profile += ' without pragmas' if options['no_pragmas'] else ' with pragmas'
+        self.stdout.write("{}: {requests_per_second:8.1f} orders/s  p50 {p50_ms:8.1f} ms  p95 {p95_ms:8.1f} ms  "
+                          "{errors:4d} errors".format(profile, **result))
+        if options['output']:
+            result.update(options, profile=profile, date=datetime.now().isoformat(), **size)
+            with open(options['output'], 'w') as output:
+                json.dump(result, output, indent=2, sort_keys=True)
@@ -0,0 +1,48 @@
+import json
+from datetime import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from order import benchmark, loadtest, seeding
+
+from .benchmark import parse_sizes
+
+
+class Command(BaseCommand):
+    """
+    Compares the WSGI and the ASGI application with many concurrent
+    ajax-requests of the order page and the output table and saves the results
+    as json.
+
+    The benchmark uses a new test database, so the data of the site is not
+    changed. Like order.asgi, it needs Python 3.5.
+    """
+
+    help = "Compares the latency and the throughput of concurrent ajax-requests under WSGI and ASGI."
+    option_list = BaseCommand.option_list + (
+        make_option('--size', default='10x50', help="Size as GROUPSxPRODUCTS (default 10x50)."),
+        make_option('--requests', type='int', default=400, help="Number of requests (default 400)."),
+        make_option('--concurrency', type='int', default=50, help="Number of concurrent clients (default 50)."),
+        make_option('--threads', type='int', default=4, help="Number of threads of each server (default 4)."),
+        make_option('--coalesce-delay', type='float', default=None,
+                    help="ORDER_COALESCE_DELAY for both servers (default from the settings)."),
+        make_option('--output', default=None, help="Save the results as json to this file."),
+    )
+
+    def handle(self, *args, **options):
+        size, = parse_sizes(options['size'])
+        extra_settings = {}
+        if options['coalesce_delay'] is not None:
+            extra_settings['ORDER_COALESCE_DELAY'] = options['coalesce_delay']
+        with benchmark.thread_database(**extra_settings):
+            data = seeding.seed(**size)
+            results = loadtest.compare_servers(data, options['requests'], options['concurrency'], options['threads'])
+
+        for server, result in sorted(results.items()):
+            self.stdout.write("{}  {requests_per_second:8.1f} requests/s  p50 {p50_ms:8.1f} ms  "
+                              "p95 {p95_ms:8.1f} ms  {errors:4d} errors".format(server, **result))
+        if options['output']:
+            results.update(options, date=datetime.now().isoformat(), **size)
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
@@ -0,0 +1,33 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from order import totals
+from order.models import Bundle
+
+
+class Command(BaseCommand):
+    """
+    Compares the running totals of all bundles with totals calculated from the
+    orders and prints all differences.
+    """
+
+    help = "Checks the running totals of the bundles against their orders."
+    args = "[bundle_id ...]"
+    option_list = BaseCommand.option_list + (
+        make_option('--fix', action='store_true', default=False,
+                    help="Rebuild the totals of all bundles with differences."),
+    )
+
+    def handle(self, *args, **options):
+        bundle_ids = args or Bundle.objects.values_list('pk', flat=True)
+        differences = totals.compare(bundle_ids)
+        for model, key, field, saved, calculated in differences:
+            self.stdout.write("{} {}: {} is {}, should be {}".format(
+                model.__name__, key, field, saved, calculated))
+
+        if not differences:
+            self.stdout.write("All totals are correct.")
+        elif options['fix']:
+            totals.rebuild(set(key[0] for __, key, __, __, __ in differences))
+            self.stdout.write("Rebuilt the totals of the bundles with differences.")
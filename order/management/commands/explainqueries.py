@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from order import explain
+
+
+class Command(BaseCommand):
+    """
+    Shows the query plans of the frequent queries (see order.explain) and fails,
+    if one of them reads a whole table.
+    """
+
+    help = "Runs EXPLAIN on the frequent queries and reports full table scans."
+
+    def handle(self, *args, **options):
+        scanned = []
+        for name, plan, full_scan in explain.full_scans():
+            self.stdout.write("{}: {}".format(name, "FULL SCAN" if full_scan else "ok"))
+            if full_scan or int(options['verbosity']) > 1:
+                for line in plan:
+                    self.stdout.write("    {}".format(line))
+            if full_scan:
+                scanned.append(name)
+
+        if scanned:
+            raise CommandError("Full table scans in: {}".format(", ".join(scanned)))
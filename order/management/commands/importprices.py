@@ -0,0 +1,43 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from order import pricelist
+
+
+class Command(BaseCommand):
+    """
+    Imports a price list from a csv-file (see order.pricelist) and prints the
+    changed products.
+    """
+
+    help = "Imports the prices and the availability of the products from a csv-file."
+    args = "<file>"
+    option_list = BaseCommand.option_list + (
+        make_option('--delimiter', default=None, help="Delimiter of the columns (default: from the header)."),
+        make_option('--encoding', default='utf-8', help="Encoding of the file (default utf-8)."),
+        make_option('--disable-vanished', action='store_true', default=False,
+                    help="Set products, that are not in the file, to not available."),
+        make_option('--dry-run', action='store_true', default=False,
+                    help="Only show the changes, without saving them."),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Usage: importprices <file>")
+
+        try:
+            with open(args[0], encoding=options['encoding'], newline='') as price_list:
+                report = pricelist.import_price_list(
+                    price_list, options['delimiter'], options['disable_vanished'], options['dry_run'])
+        except (OSError, UnicodeDecodeError, pricelist.PriceListError) as error:
+            raise CommandError(error)
+
+        if int(options['verbosity']) > 1:
+            for title, names in (("New", report.new), ("Changed", report.changed),
+                                 ("Vanished", report.vanished)):
+                for name in names:
+                    self.stdout.write("{}: {}".format(title, name))
+        for line_number, error in report.errors:
+            self.stderr.write("Line {}: {}".format(line_number, error))
+        self.stdout.write(str(report))
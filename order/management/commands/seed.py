@@ -0,0 +1,29 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from order import seeding
+
+
+class Command(BaseCommand):
+    """
+    Fills the database with synthetic groups, units, products, bundles and
+    orders (see order.seeding).
+    """
+
+    help = "Creates synthetic data for development and benchmarks."
+    option_list = BaseCommand.option_list + (
+        make_option('--groups', type='int', default=10, help="Number of groups (default 10)."),
+        make_option('--units', type='int', default=3, help="Number of units (default 3)."),
+        make_option('--products', type='int', default=50, help="Number of products (default 50)."),
+        make_option('--bundles', type='int', default=1, help="Number of bundles (default 1)."),
+        make_option('--orders', type='int', default=None,
+                    help="Number of orders for each bundle (default: each group orders each product)."),
+        make_option('--seed', type='int', default=None, help="Seed for the random numbers."),
+    )
+
+    def handle(self, *args, **options):
+        data = seeding.seed(groups=options['groups'], units=options['units'], products=options['products'],
+                            bundles=options['bundles'], orders=options['orders'], random_seed=options['seed'])
+        self.stdout.write("Created {} groups, {} units, {} products and {} bundles.".format(
+            *(len(data[name]) for name in ('groups', 'units', 'products', 'bundles'))))
@@ -0,0 +1,97 @@
+"""
+Middleware to measure the database usage of each request and to invalidate the
+cached pages after the changes of a request are committed.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+from . import caching
+from .urls import get_query_budget
+
+logger = logging.getLogger('order.queries')
+
+
+def count_queries_enabled():
+    """
+    Returns True, if the queries of the requests are counted: if
+    settings.ORDER_COUNT_QUERIES is True or, if it is not set, if DEBUG is True.
+    """
+    return getattr(settings, 'ORDER_COUNT_QUERIES', settings.DEBUG)
+
+
+class QueryCountMiddleware:
+    """
+    Counts the queries of each request and measures the time for the database
+    and for the whole request.
+
+    The values are added to the response as the headers X-DB-Queries,
+    X-DB-Time and X-Render-Time (times in milliseconds) and written to the log
+    'order.queries'. If the url has a query budget (see order.urls.QUERY_BUDGETS)
+    and the request needs more queries, a warning is logged.
+
+    Django only logs the queries, while they are captured, so the middleware
+    does nothing, unless count_queries_enabled() is True.
+
+    The time of streaming responses only contains the time until the response
+    starts.
+    """
+
+    def process_request(self, request):
+        if not count_queries_enabled():
+            return
+        request._query_count_contexts = [CaptureQueriesContext(connection) for connection in connections.all()]
+        for context in request._query_count_contexts:
+            context.__enter__()
+        request._query_count_time = time.time()
+
+    def process_response(self, request, response):
+        contexts = getattr(request, '_query_count_contexts', None)
+        if contexts is None:
+            return response
+
+        duration = time.time() - request._query_count_time
+        for context in contexts:
+            context.__exit__(None, None, None)
+        count = sum(len(context) for context in contexts)
+        seconds = sum(float(query['time']) for context in contexts for query in context.captured_queries)
+
+        response['X-DB-Queries'] = count
+        response['X-DB-Time'] = "{:.1f}".format(seconds * 1000)
+        response['X-Render-Time'] = "{:.1f}".format(duration * 1000)
+
+        url_name = getattr(request.resolver_match, 'url_name', None)
+        budget = get_query_budget(url_name, request.method)
+        if budget is not None:
+            response['X-DB-Query-Budget'] = budget
+        logger.info("%s %s %s: %d queries, %.1f ms db, %.1f ms total",
+                    request.method, request.path, url_name, count, seconds * 1000, duration * 1000)
+        if budget is not None and count > budget:
+            logger.warning("%s %s %s: %d queries exceed the budget of %d queries",
+                           request.method, request.path, url_name, count, budget)
+        return response
+
+
+class CacheGenerationMiddleware:
+    """
+    Replaces the cache generations, that were replaced in a transaction of the
+    request, again after the request (see order.caching.bump_deferred). The
+    generations, that the thread replaced in a transaction outside of a
+    request, are replaced before the request.
+
+    It has to be the first middleware, so it runs after the transactions of
+    the view and of all other middleware.
+    """
+
+    def process_request(self, request):
+        caching.bump_deferred()
+
+    def process_response(self, request, response):
+        caching.bump_deferred()
+        return response
+
+    def process_exception(self, request, exception):
+        caching.bump_deferred()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def fill_totals(apps, schema_editor):
+    """
+    Calculates the totals for all existing orders.
+    """
+    Order = apps.get_model('order', 'Order')
+    places = Decimal('0.000001')
+    totals = {
+        'BundleTotal': defaultdict(lambda: defaultdict(int)),
+        'GroupTotal': defaultdict(lambda: defaultdict(int)),
+        'ProductTotal': defaultdict(lambda: defaultdict(int)),
+    }
+    for order in Order.objects.select_related('product__unit'):
+        product = order.product
+        multiplier = 0 if product.price is None else product.price / product.unit.divisor
+        delivered = order.delivered if order.delivered is not None else order.amount
+        price = Decimal(multiplier * order.amount).quantize(places)
+        price_delivered = Decimal(multiplier * delivered).quantize(places)
+        product_values = totals['ProductTotal'][(('bundle_id', order.bundle_id), ('product_id', product.pk))]
+        for values in (totals['BundleTotal'][(('bundle_id', order.bundle_id),)],
+                       totals['GroupTotal'][(('bundle_id', order.bundle_id), ('group_id', order.group_id))],
+                       product_values):
+            values['price'] += price
+            values['price_delivered'] += price_delivered
+        product_values['amount'] += order.amount
+        product_values['delivered'] += delivered
+
+    for model_name, model_totals in totals.items():
+        model = apps.get_model('order', model_name)
+        model.objects.bulk_create(model(**dict(key, **values)) for key, values in model_totals.items())
+
+
+def noop(apps, schema_editor):
+    """
+    The totals are deleted with their tables.
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0002_auto_20141223_0937'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BundleTotal',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('price', models.DecimalField(default=0, max_digits=16, decimal_places=6)),
+                ('price_delivered', models.DecimalField(default=0, max_digits=16, decimal_places=6)),
+                ('bundle', models.OneToOneField(related_name='total', to='order.Bundle')),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='GroupTotal',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('price', models.DecimalField(default=0, max_digits=16, decimal_places=6)),
+                ('price_delivered', models.DecimalField(default=0, max_digits=16, decimal_places=6)),
+                ('bundle', models.ForeignKey(related_name='group_totals', to='order.Bundle')),
+                ('group', models.ForeignKey(related_name='totals', to='order.Group')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='ProductTotal',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('price', models.DecimalField(default=0, max_digits=16, decimal_places=6)),
+                ('price_delivered', models.DecimalField(default=0, max_digits=16, decimal_places=6)),
+                ('amount', models.IntegerField(default=0)),
+                ('delivered', models.IntegerField(default=0)),
+                ('bundle', models.ForeignKey(related_name='product_totals', to='order.Bundle')),
+                ('product', models.ForeignKey(related_name='totals', to='order.Product')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='producttotal',
+            unique_together=set([('bundle', 'product')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='grouptotal',
+            unique_together=set([('bundle', 'group')]),
+        ),
+        migrations.RunPython(fill_totals, noop),
+    ]
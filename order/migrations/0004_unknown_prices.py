@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def count_unknown_prices(apps, schema_editor):
+    """
+    Counts the existing orders of products without a price.
+    """
+    Order = apps.get_model('order', 'Order')
+    BundleTotal = apps.get_model('order', 'BundleTotal')
+    GroupTotal = apps.get_model('order', 'GroupTotal')
+    ProductTotal = apps.get_model('order', 'ProductTotal')
+    for order in Order.objects.filter(product__price=None):
+        delivered = order.delivered if order.delivered is not None else order.amount
+        update = {'unknown': F('unknown') + int(order.amount > 0),
+                  'unknown_delivered': F('unknown_delivered') + int(delivered > 0)}
+        BundleTotal.objects.filter(bundle_id=order.bundle_id).update(**update)
+        GroupTotal.objects.filter(bundle_id=order.bundle_id, group_id=order.group_id).update(**update)
+        ProductTotal.objects.filter(bundle_id=order.bundle_id, product_id=order.product_id).update(**update)
+
+
+def noop(apps, schema_editor):
+    """
+    The counts are deleted with their fields.
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0003_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bundletotal',
+            name='unknown',
+            field=models.IntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='bundletotal',
+            name='unknown_delivered',
+            field=models.IntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='grouptotal',
+            name='unknown',
+            field=models.IntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='grouptotal',
+            name='unknown_delivered',
+            field=models.IntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='producttotal',
+            name='unknown',
+            field=models.IntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='producttotal',
+            name='unknown_delivered',
+            field=models.IntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.RunPython(count_unknown_prices, noop),
+    ]
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def set_closed(apps, schema_editor):
+    """
+    Bundles that were closed before the time of closing was saved count as
+    closed since their start.
+    """
+    Bundle = apps.get_model('order', 'Bundle')
+    Bundle.objects.filter(open=False).update(closed=F('start'))
+
+
+def noop(apps, schema_editor):
+    """
+    The time is deleted with its field.
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0004_unknown_prices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('amount', models.PositiveIntegerField(default=0)),
+                ('delivered', models.PositiveIntegerField(null=True)),
+                ('bundle', models.ForeignKey(related_name='archived_orders', to='order.Bundle')),
+                ('group', models.ForeignKey(related_name='archived_orders', to='order.Group')),
+                ('product', models.ForeignKey(related_name='archived_orders', to='order.Product')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivedorder',
+            unique_together=set([('group', 'product', 'bundle')]),
+        ),
+        migrations.AddField(
+            model_name='bundle',
+            name='archived',
+            field=models.BooleanField(default=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='bundle',
+            name='closed',
+            field=models.DateTimeField(blank=True, null=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='producttotal',
+            name='divisor',
+            field=models.PositiveIntegerField(blank=True, null=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='producttotal',
+            name='unit_price',
+            field=models.DecimalField(blank=True, null=True, max_digits=10, decimal_places=2),
+            preserve_default=True,
+        ),
+        migrations.RunPython(set_closed, noop),
+    ]
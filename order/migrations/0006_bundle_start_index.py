@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0005_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bundle',
+            name='start',
+            field=models.DateTimeField(db_index=True, auto_now_add=True),
+            preserve_default=True,
+        ),
+    ]
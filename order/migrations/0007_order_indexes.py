@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0006_bundle_start_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='order',
+            index_together=set([('bundle', 'product'), ('bundle', 'group', 'product', 'amount', 'delivered')]),
+        ),
+    ]
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+
+import order.fields
+
+TOTALS = ('BundleTotal', 'GroupTotal', 'ProductTotal')
+
+
+def to_integer(value, places):
+    if value is None:
+        return None
+    return int((value * 10 ** places).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def prices_to_integers(apps, schema_editor):
+    """
+    Copies the prices in cents and the totals in millionths of euros to the new
+    integer fields.
+    """
+    Product = apps.get_model('order', 'Product')
+    for pk, price in Product.objects.values_list('pk', 'price'):
+        Product.objects.filter(pk=pk).update(price_cents=to_integer(price, 2))
+
+    for model_name in TOTALS:
+        model = apps.get_model('order', model_name)
+        for pk, price, price_delivered in model.objects.values_list('pk', 'price', 'price_delivered'):
+            model.objects.filter(pk=pk).update(
+                price_micros=to_integer(price, 6), price_delivered_micros=to_integer(price_delivered, 6))
+
+    ProductTotal = apps.get_model('order', 'ProductTotal')
+    for pk, unit_price in ProductTotal.objects.exclude(unit_price=None).values_list('pk', 'unit_price'):
+        ProductTotal.objects.filter(pk=pk).update(unit_price_cents=to_integer(unit_price, 2))
+
+
+def prices_to_decimals(apps, schema_editor):
+    """
+    Copies the integer prices back to the decimal fields.
+    """
+    Product = apps.get_model('order', 'Product')
+    for pk, cents in Product.objects.exclude(price_cents=None).values_list('pk', 'price_cents'):
+        Product.objects.filter(pk=pk).update(price=Decimal(cents).scaleb(-2))
+
+    for model_name in TOTALS:
+        model = apps.get_model('order', model_name)
+        for pk, price, price_delivered in model.objects.values_list('pk', 'price_micros', 'price_delivered_micros'):
+            model.objects.filter(pk=pk).update(
+                price=Decimal(price).scaleb(-6), price_delivered=Decimal(price_delivered).scaleb(-6))
+
+    ProductTotal = apps.get_model('order', 'ProductTotal')
+    for pk, cents in ProductTotal.objects.exclude(unit_price_cents=None).values_list('pk', 'unit_price_cents'):
+        ProductTotal.objects.filter(pk=pk).update(unit_price=Decimal(cents).scaleb(-2))
+
+
+def total_fields(model_name):
+    return [
+        migrations.AddField(
+            model_name=model_name,
+            name='price_micros',
+            field=models.BigIntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name=model_name,
+            name='price_delivered_micros',
+            field=models.BigIntegerField(default=0),
+            preserve_default=True,
+        ),
+    ]
+
+
+def replace_total_fields(model_name):
+    return [
+        migrations.RemoveField(
+            model_name=model_name,
+            name='price',
+        ),
+        migrations.RemoveField(
+            model_name=model_name,
+            name='price_delivered',
+        ),
+        migrations.RenameField(
+            model_name=model_name,
+            old_name='price_micros',
+            new_name='price',
+        ),
+        migrations.RenameField(
+            model_name=model_name,
+            old_name='price_delivered_micros',
+            new_name='price_delivered',
+        ),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0007_order_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='price_cents',
+            field=order.fields.PriceField(null=True, verbose_name='Preis', blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='producttotal',
+            name='unit_price_cents',
+            field=order.fields.PriceField(null=True, blank=True),
+            preserve_default=True,
+        ),
+    ] + [operation for model_name in TOTALS for operation in total_fields(model_name.lower())] + [
+        migrations.RunPython(prices_to_integers, prices_to_decimals),
+        migrations.RemoveField(
+            model_name='product',
+            name='price',
+        ),
+        migrations.RemoveField(
+            model_name='producttotal',
+            name='unit_price',
+        ),
+        migrations.RenameField(
+            model_name='producttotal',
+            old_name='unit_price_cents',
+            new_name='unit_price',
+        ),
+    ] + [operation for model_name in TOTALS for operation in replace_total_fields(model_name.lower())]
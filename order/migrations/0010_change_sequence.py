@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0009_order_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bundle',
+            name='sequence',
+            field=models.BigIntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='sequence',
+            field=models.BigIntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AlterIndexTogether(
+            name='order',
+            index_together=set([
+                ('bundle', 'product'), ('bundle', 'group', 'product', 'amount', 'delivered', 'version'),
+                ('bundle', 'sequence')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0010_change_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bundle',
+            name='deleted_sequence',
+            field=models.BigIntegerField(default=0),
+            preserve_default=True,
+        ),
+    ]
@@ -1,5 +1,10 @@
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import F
+
+from . import database
+from .fields import PriceField, from_cents, from_micros, line_price, to_cents
 
 
 class Group(models.Model):
@@ -34,6 +39,15 @@ class Group(models.Model):
         """
         return reverse('order_group_update', args=[self.pk])
 
+    def delete(self, *args, **kwargs):
+        """
+        Deletes the group and rebuilds the totals of all bundles where the group
+        has ordered something.
+        """
+        from . import totals
+        with totals.rebuild_after(Bundle.objects.filter(orders__group=self)):
+            super().delete(*args, **kwargs)
+
 
 class Unit(models.Model):
     """
@@ -66,6 +80,18 @@ class Unit(models.Model):
     Integer used to calculate the price for a order
     """
 
+    saved_divisor = None
+    """
+    The divisor as it was saved in the database before the last save(). Used
+    to find out, if the totals have to be recalculated.
+    """
+
+    def save(self, *args, **kwargs):
+        self.saved_divisor = None
+        if self.pk is not None:
+            self.saved_divisor = Unit.objects.filter(pk=self.pk).values_list('divisor', flat=True).first()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -106,10 +132,10 @@ class Product(models.Model):
     The unit in which the product is ordered.
     """
 
-    price = models.DecimalField(max_digits=10, decimal_places=2, null=True,
-                                blank=True, verbose_name="Preis")  # TODO: use a custom Integerfield
+    price_cents = PriceField(null=True, blank=True, verbose_name="Preis")
     """
-    Price of one unit of the product.
+    Price of one unit of the product in cents. Use the attribute price for the
+    price in euros.
     """
 
     available = models.BooleanField(default=True, verbose_name="Verfügbar")
@@ -121,9 +147,30 @@ class Product(models.Model):
     class Meta:
         ordering = ['name']
 
+    saved_price = None
+    """
+    The price and the unit as they were saved in the database before the last
+    save(). Used to find out, if the totals have to be recalculated.
+    """
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.saved_price = None
+        if self.pk is not None:
+            self.saved_price = Product.objects.filter(pk=self.pk).values_list('price_cents', 'unit').first()
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        """
+        Deletes the product and rebuilds the totals of all bundles where the
+        product was ordered.
+        """
+        from . import totals
+        with totals.rebuild_after(Bundle.objects.filter(orders__product=self)):
+            super().delete(*args, **kwargs)
+
     def get_absolute_url(self):
         """
         Returns the UpdateView for a product, because there is no DetailView
@@ -132,15 +179,24 @@ class Product(models.Model):
         return reverse('order_product_update', args=[self.pk])
 
     @property
-    def multiplier(self):
+    def price(self):
         """
-        Returns a value to calculate the price for the order.
+        Price of one unit of the product as Decimal in euros or None.
+        """
+        return from_cents(self.price_cents)
+
+    @price.setter
+    def price(self, value):
+        self.price_cents = to_cents(value)
 
-        For example by a price of 1 EUR for a KG, it returns 0.001 (EUR for Gram)
+    def get_line_price(self, amount):
         """
-        if self.price is None:
-            return 0
-        return self.price / self.unit.divisor
+        Returns the price for an amount of the product in millionths of euros
+        (see order.fields.line_price).
+
+        For example by a price of 1 EUR for a KG, 500 (Gram) cost 500000.
+        """
+        return line_price(self.price_cents, self.unit.divisor, amount)
 
 
 class Bundle(models.Model):
@@ -148,7 +204,7 @@ class Bundle(models.Model):
     Model to represent all orders from each group for a specific time.
     """
 
-    start = models.DateTimeField(auto_now_add=True)
+    start = models.DateTimeField(auto_now_add=True, db_index=True)
     """
     Time of the order/bundle.
 
@@ -161,15 +217,92 @@ class Bundle(models.Model):
     finished. If open == False, no more orders can be added.
     """
 
+    closed = models.DateTimeField(null=True, blank=True)
+    """
+    Time when the bundle was closed. None, if the bundle is open.
+    """
+
+    archived = models.BooleanField(default=False)
+    """
+    Flag to show, if the bundle is archived (see order.archive). The totals of an
+    archived bundle are not changed anymore and contain the prices of the time
+    when it was archived.
+    """
+
+    sequence = models.BigIntegerField(default=0)
+    """
+    Number of the last change of the orders of the bundle. It is only increased
+    by next_sequence and mark_deleted.
+    """
+
+    deleted_sequence = models.BigIntegerField(default=0)
+    """
+    The sequence of the last deletion of an order of the bundle. Clients, that
+    have seen an older sequence, have to load the bundle again (see
+    order.api.bundle_changes).
+    """
+
     class Meta:
         get_latest_by = 'start'
 
+    def save(self, *args, **kwargs):
+        # The sequences are only changed with updates in the database, so an old
+        # instance does not set them back.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in ('sequence', 'deleted_sequence')]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return "Bestellung vom {}".format(self.start.strftime('%d.%m.%Y'))
 
     def get_absolute_url(self):
         return reverse('order_bundle_detail', args=[self.pk])
 
+    def delete(self, *args, **kwargs):
+        """
+        Deletes the bundle.
+
+        The totals of the bundle are deleted with it, so they do not have to be
+        updated for each deleted order.
+        """
+        from . import totals
+        with totals.paused():
+            super().delete(*args, **kwargs)
+
+    def get_order_values(self, *fields):
+        """
+        Returns a list of tuples with the given fields of all orders, including
+        the orders that were moved to the archive (see ArchivedOrder).
+        """
+        values = list(self.orders.values_list(*fields))
+        if self.archived:
+            values.extend(self.archived_orders.values_list(*fields))
+        return values
+
+    def get_settled_prices(self):
+        """
+        Returns a dict with the tuple (price in cents, divisor) for each product
+        of an archived bundle, as it was saved when the bundle was archived.
+        """
+        return dict((product, (price, divisor)) for product, price, divisor
+                    in self.product_totals.values_list('product', 'unit_price', 'divisor'))
+
+    def get_total(self, group=None):
+        """
+        Returns the running totals (see order.totals) of the bundle.
+
+        If group is set to a group, the totals for this group are returned. The
+        returned object contains the prices and the information about unknown
+        prices, so all of them can be read with one query.
+        """
+        try:
+            if group is None:
+                return BundleTotal.objects.get(bundle=self)
+            return self.group_totals.get(group=group)
+        except ObjectDoesNotExist:
+            return BundleTotal(bundle=self) if group is None else GroupTotal(bundle=self, group=group)
+
     def has_unknown_price(self, group=None, delivered=False):
         """
         Returns True or False, if there is a relevant product in the bundle,
@@ -180,12 +313,7 @@ class Bundle(models.Model):
 
         if delivered is True, products where nothing was delivered are ignored
         """
-        kwargs = {'delivered': 0} if delivered else {'amount': 0}
-        query = self.orders.exclude(**kwargs).filter(product__price=None)
-        if group is None:
-            return query.exists()
-        else:
-            return query.filter(group=group).exists()
+        return self.get_total(group).has_unknown_price(delivered)
 
     def has_unknown_price_delivered(self):
         """
@@ -201,13 +329,15 @@ class Bundle(models.Model):
         products that are actual delivered. If the attribute delivered is False,
         the order-price is returned. If delivered is True, the price is shouwn,
         that the group has to pay.
+
+        The price is read from the running totals (see GroupTotal) and returned
+        as Decimal in euros.
         """
-        # TODO: Maybe this has to be done in JS, so the method can be deleted.
-        query = self.orders.filter(group=group).select_related('product__unit')
-        if delivered:
-            return sum(order.product.multiplier * order.get_delivered() for order in query)
-        else:
-            return sum(order.product.multiplier * order.amount for order in query)
+        try:
+            total = self.group_totals.get(group=group)
+        except GroupTotal.DoesNotExist:
+            return 0
+        return total.get_price(delivered)
 
     def price_for_all(self, delivered=False):
         """
@@ -215,12 +345,59 @@ class Bundle(models.Model):
 
         For the attribute delivered, see the method price_for_group.
         """
-        # TODO: Maybe this has to be done in JS
-        query = self.orders.select_related('product__unit')
-        if delivered:
-            return sum(order.product.multiplier * order.get_delivered() for order in query)
-        else:
-            return sum(order.product.multiplier * order.amount for order in query)
+        try:
+            total = BundleTotal.objects.get(bundle=self)
+        except BundleTotal.DoesNotExist:
+            return 0
+        return total.get_price(delivered)
+
+    def delivered_for_product(self, product):
+        """
+        Returns the amount of a product, that is delivered to all groups.
+        """
+        try:
+            return self.product_totals.get(product=product).delivered
+        except ProductTotal.DoesNotExist:
+            return 0
+
+
+def next_sequence(bundle_id, using=None):
+    """
+    Increases the sequence of the bundle and returns the new value.
+
+    Has to be called in the transaction, that changes the orders, so the
+    sequence of the bundle is locked until the changes are saved. So a client,
+    that has seen a sequence, has also seen all changes up to this sequence
+    (see BundleChangesView). To hold the lock as short as possible, it is
+    called after the orders and the totals are saved. The writers of a bundle
+    wait for each other at the update of the BundleTotal before anyway.
+    """
+    using = using or router.db_for_write(Bundle)
+    connection = connections[using]
+    if database.supports(connection, database.RETURNING_SQLITE_VERSION, database.RETURNING_POSTGRESQL_VERSION):
+        quote = connection.ops.quote_name
+        cursor = connection.cursor()
+        cursor.execute('UPDATE {table} SET {sequence} = {sequence} + 1 WHERE {pk} = %s RETURNING {sequence}'.format(
+            table=quote(Bundle._meta.db_table), sequence=quote('sequence'), pk=quote(Bundle._meta.pk.column)),
+            [bundle_id])
+        row = cursor.fetchone()
+        return row[0] if row is not None else 0
+
+    # The update locks the bundle (SQLite the whole database) until the end of
+    # the transaction, so the sequence can be read afterwards. Reading it first
+    # (with select_for_update) could let two SQLite writers wait for each other.
+    bundles = Bundle.objects.using(using).filter(pk=bundle_id)
+    bundles.update(sequence=F('sequence') + 1)
+    return bundles.values_list('sequence', flat=True).first() or 0
+
+
+def mark_deleted(bundle_id, using=None):
+    """
+    Increases the sequence of the bundle after an order was deleted and saves
+    it as deleted_sequence.
+    """
+    Bundle.objects.using(using or router.db_for_write(Bundle)).filter(pk=bundle_id).update(
+        sequence=F('sequence') + 1, deleted_sequence=F('sequence') + 1)
 
 
 class Order(models.Model):
@@ -242,8 +419,53 @@ class Order(models.Model):
     get_delivered.
     """
 
+    version = models.PositiveIntegerField(default=0)
+    """
+    Number of the changes of the order. It is increased by each save() and by
+    order.writes.upsert_order, so a client can send the version it has seen
+    and changes of other clients are detected (see BundleOutputView.ajax).
+    """
+
+    sequence = models.BigIntegerField(default=0)
+    """
+    The sequence of the bundle (see next_sequence) at the last change of the
+    order.
+    """
+
     class Meta:
         unique_together = ('group', 'product', 'bundle')
+        # Indexes for the queries of one bundle (see order.explain). The first
+        # one also covers the queries for all orders of a bundle.
+        index_together = [('bundle', 'group', 'product', 'amount', 'delivered', 'version'), ('bundle', 'product'),
+                          ('bundle', 'sequence')]
+
+    saved_state = None
+    """
+    The state of the order (see get_state) as it was saved in the database
+    before the last save() or None for a new order. Used to update the totals
+    with the difference to the new state.
+    """
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(Order, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            # The saved order is read and locked in the same transaction, so
+            # concurrent saves do not subtract the same old values twice.
+            saved = None
+            if self.pk is not None:
+                saved = (Order.objects.using(using).select_for_update().filter(pk=self.pk)
+                         .values_list('bundle', 'group', 'product', 'amount', 'delivered', 'version').first())
+            self.saved_state = None
+            if saved is not None:
+                bundle_id, group_id, product_id, amount, delivered, version = saved
+                self.saved_state = (bundle_id, group_id, product_id, amount,
+                                    delivered if delivered is not None else amount)
+                self.version = version + 1
+            # The totals are updated by the signal post_save, so the sequence
+            # is taken afterwards (see next_sequence).
+            super().save(*args, **kwargs)
+            self.sequence = next_sequence(self.bundle_id, using)
+            Order.objects.using(using).filter(pk=self.pk).update(sequence=self.sequence)
 
     def __str__(self):
         # TODO: nicht auf foreignkeys verweisen
@@ -255,3 +477,127 @@ class Order(models.Model):
         amount.
         """
         return self.delivered if self.delivered is not None else self.amount
+
+    def get_state(self):
+        """
+        Returns a tuple with all values of the order that are relevant for the
+        totals.
+        """
+        return (self.bundle_id, self.group_id, self.product_id, self.amount, self.get_delivered())
+
+
+class ArchivedOrder(models.Model):
+    """
+    An order of an archived bundle, that was moved out of the table of the orders
+    (see order.archive).
+
+    Archived orders are not changed anymore and do not update the totals.
+    """
+
+    group = models.ForeignKey(Group, related_name='archived_orders')
+    product = models.ForeignKey(Product, related_name='archived_orders')
+    bundle = models.ForeignKey(Bundle, related_name='archived_orders')
+
+    amount = models.PositiveIntegerField(default=0)
+    delivered = models.PositiveIntegerField(null=True)
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('group', 'product', 'bundle')
+
+
+class Total(models.Model):
+    """
+    Abstract base for the running totals.
+
+    The totals are updated each time an order is changed (see order.totals), so
+    the price of a bundle does not have to be calculated from all its orders.
+    """
+
+    price = models.BigIntegerField(default=0)
+    """
+    The price for the ordered amounts in millionths of euros.
+    """
+
+    price_delivered = models.BigIntegerField(default=0)
+    """
+    The price for the delivered amounts in millionths of euros.
+    """
+
+    unknown = models.IntegerField(default=0)
+    """
+    Number of orders with an ordered amount, where the product has no price.
+    """
+
+    unknown_delivered = models.IntegerField(default=0)
+    """
+    Number of orders with a delivered amount, where the product has no price.
+    """
+
+    class Meta:
+        abstract = True
+
+    def get_price(self, delivered=False):
+        """
+        Returns the price for the ordered or, if delivered is True, for the
+        delivered amounts as Decimal in euros.
+        """
+        return from_micros(self.price_delivered if delivered else self.price)
+
+    def has_unknown_price(self, delivered=False):
+        """
+        Returns True, if at least one of the products has no price.
+
+        If delivered is True, products where nothing was delivered are ignored.
+        """
+        return (self.unknown_delivered if delivered else self.unknown) > 0
+
+
+class BundleTotal(Total):
+    """
+    Totals for all orders of a bundle.
+    """
+
+    bundle = models.OneToOneField(Bundle, related_name='total')
+
+
+class GroupTotal(Total):
+    """
+    Totals for all orders of one group in a bundle.
+    """
+
+    bundle = models.ForeignKey(Bundle, related_name='group_totals')
+    group = models.ForeignKey(Group, related_name='totals')
+
+    class Meta:
+        unique_together = ('bundle', 'group')
+
+
+class ProductTotal(Total):
+    """
+    Totals for all orders of one product in a bundle.
+    """
+
+    bundle = models.ForeignKey(Bundle, related_name='product_totals')
+    product = models.ForeignKey(Product, related_name='totals')
+
+    amount = models.IntegerField(default=0)
+    """
+    The ordered amount of the product from all groups.
+    """
+
+    delivered = models.IntegerField(default=0)
+    """
+    The delivered amount of the product to all groups. Like in Order.get_delivered
+    the ordered amount is used, if no delivered amount is set.
+    """
+
+    unit_price = PriceField(null=True, blank=True)
+    divisor = models.PositiveIntegerField(null=True, blank=True)
+    """
+    The price in cents and the divisor of the unit of the product, when the
+    bundle was archived. Both are None, if the bundle is not archived.
+    """
+
+    class Meta:
+        unique_together = ('bundle', 'product')
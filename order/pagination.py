@@ -0,0 +1,91 @@
+"""
+Keyset pagination for lists, that are ordered descending by a datetime field.
+
+Instead of an offset, the url of the next page contains a cursor with the values
+of the last object of the current page (the datetime and, to make it unique,
+the primary key). The next page is selected with a WHERE clause on these values,
+so the database can use an index and does not have to count or skip the rows of
+the previous pages.
+
+The same way, keyset_rows reads large results (e.g. for the exports) in chunks,
+so only one chunk is in memory. QuerySet.iterator() does not help for this,
+because psycopg2 fetches the whole result of a query at once.
+"""
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+
+CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+CHUNK_SIZE = 1000
+
+
+def encode_cursor(value, pk):
+    """
+    Returns the cursor for an object with the datetime value and the primary key
+    pk.
+    """
+    return "{}-{}".format(value.astimezone(timezone.utc).strftime(CURSOR_FORMAT), pk)
+
+
+def decode_cursor(cursor):
+    """
+    Returns the tuple (datetime, pk) for a cursor or None, if the cursor is not
+    valid.
+    """
+    try:
+        value, pk = cursor.split('-')
+        return datetime.strptime(value, CURSOR_FORMAT).replace(tzinfo=timezone.utc), int(pk)
+    except ValueError:
+        return None
+
+
+def keyset_page(queryset, field, cursor, size):
+    """
+    Returns the tuple (objects, next_cursor) with the objects of one page.
+
+    The queryset is ordered descending by field and pk. cursor is the cursor of
+    the previous page or None for the first page. next_cursor is None on the
+    last page.
+    """
+    queryset = queryset.order_by('-' + field, '-pk')
+    position = decode_cursor(cursor) if cursor else None
+    if position is not None:
+        value, pk = position
+        queryset = queryset.filter(Q(**{field + '__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+
+    # Read one more object to find out, if there is a next page
+    objects = list(queryset[:size + 1])
+    if len(objects) <= size:
+        return objects, None
+    objects = objects[:size]
+    return objects, encode_cursor(getattr(objects[-1], field), objects[-1].pk)
+
+
+def after(keys, values):
+    """
+    Returns the condition for the rows after the row with the values of the
+    keys in ascending order.
+    """
+    condition = Q(**{keys[-1] + '__gt': values[-1]})
+    for key, value in reversed(list(zip(keys[:-1], values[:-1]))):
+        condition = Q(**{key + '__gt': value}) | (Q(**{key: value}) & condition)
+    return condition
+
+
+def keyset_rows(queryset, keys, fields, size=CHUNK_SIZE):
+    """
+    Yields the tuples of values_list(*fields) for all rows of the queryset,
+    ordered ascending by keys, which have to be unique together. The rows are
+    read in chunks of size rows.
+    """
+    queryset = queryset.order_by(*keys).values_list(*(tuple(keys) + tuple(fields)))
+    chunk = queryset
+    while True:
+        rows = list(chunk[:size])
+        for row in rows:
+            yield row[len(keys):]
+        if len(rows) < size:
+            return
+        chunk = queryset.filter(after(keys, rows[-1][:len(keys)]))
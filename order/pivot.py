@@ -0,0 +1,102 @@
+"""
+Dense table of all orders of a bundle.
+"""
+from collections import defaultdict
+
+from .fields import from_micros
+from .models import Group, Product
+
+
+def settle(products, settled_prices):
+    """
+    Replaces the price and the divisor of each product with the values from
+    settled_prices (see Bundle.get_settled_prices).
+    """
+    for product in products:
+        price, divisor = settled_prices.get(product.pk, (None, None))
+        product.price_cents = price
+        if divisor is not None:
+            product.unit.divisor = divisor
+
+
+class OutputTable:
+    """
+    Table of all orders of a bundle with one row for each ordered product and
+    one column for each group that has an order.
+
+    The table is build from plain values instead of order-objects. The cells are
+    saved in the lists of lists amounts, delivered and versions (see
+    Order.version), which are indexed with the position of the product and the
+    position of the group. The dicts product_index and group_index map the
+    primary keys to these positions. A cell is None, if there is no order for
+    the product and the group.
+
+    The sums of the rows and columns are calculated once:
+    * product_delivered: the delivered amount of each product
+    * group_prices: the price, each group has to pay
+    * price_for_all: the price for the whole bundle
+
+    The prices are summed as integers (see order.fields.line_price) and
+    returned as Decimals in euros.
+
+    For archived bundles (see order.archive), the archived orders and the prices
+    of the settlement are used.
+    """
+
+    def __init__(self, bundle):
+        orders = bundle.get_order_values('group', 'product', 'amount', 'delivered', 'version')
+
+        ordered = defaultdict(int)
+        for __, product_id, amount, __, __ in orders:
+            ordered[product_id] += amount
+
+        self.groups = list(Group.objects.filter(pk__in=set(order[0] for order in orders)))
+        all_products = list(Product.objects.filter(pk__in=list(ordered)).select_related('unit'))
+        if bundle.archived:
+            settle(all_products, bundle.get_settled_prices())
+        self.products = [product for product in all_products if ordered[product.pk] > 0]
+        self.group_index = dict((group.pk, i) for i, group in enumerate(self.groups))
+        self.product_index = dict((product.pk, i) for i, product in enumerate(self.products))
+
+        self.amounts = [[None] * len(self.groups) for __ in self.products]
+        self.delivered = [[None] * len(self.groups) for __ in self.products]
+        self.versions = [[None] * len(self.groups) for __ in self.products]
+        self.product_delivered = [0] * len(self.products)
+        self.group_prices = [0] * len(self.groups)
+
+        products = dict((product.pk, product) for product in all_products)
+        for group_id, product_id, amount, delivered, version in orders:
+            if delivered is None:
+                delivered = amount
+            group_position = self.group_index[group_id]
+            self.group_prices[group_position] += products[product_id].get_line_price(delivered)
+
+            product_position = self.product_index.get(product_id)
+            if product_position is not None:
+                self.amounts[product_position][group_position] = amount
+                self.delivered[product_position][group_position] = delivered
+                self.versions[product_position][group_position] = version
+                self.product_delivered[product_position] += delivered
+
+        self.price_for_all = from_micros(sum(self.group_prices))
+        self.group_prices = [from_micros(price) for price in self.group_prices]
+
+    def columns(self):
+        """
+        Returns a list of tuples (group, price) for each group.
+        """
+        return list(zip(self.groups, self.group_prices))
+
+    def rows(self):
+        """
+        Returns a list of tuples (product, delivered, cells) for each product.
+
+        cells is a list of tuples (group_pk, amount, delivered, version) for each
+        group, where amount, delivered and version are None, if the group has
+        not ordered the product.
+        """
+        group_pks = [group.pk for group in self.groups]
+        return [
+            (product, product_delivered, list(zip(group_pks, amounts, delivered, versions)))
+            for product, product_delivered, amounts, delivered, versions
+            in zip(self.products, self.product_delivered, self.amounts, self.delivered, self.versions)]
@@ -0,0 +1,234 @@
+"""
+Import of price lists from suppliers.
+
+A price list is a csv-file with a header and one row for each product. The
+columns are found by their names in the header (see COLUMNS); name, unit and
+price are needed, available is optional. The rows are matched to the products
+by the name. Missing units are created.
+
+The file is read row by row and the products are updated in batches of
+BATCH_SIZE rows, so only the names of the products have to be kept in memory.
+"""
+import csv
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from . import caching, totals
+from .fields import to_cents
+from .models import Bundle, Product, Unit
+
+BATCH_SIZE = 500
+
+COLUMNS = {
+    'name': 'name', 'produkt': 'name',
+    'unit': 'unit', 'einheit': 'unit',
+    'price': 'price', 'preis': 'price',
+    'available': 'available', 'verfügbar': 'available',
+}
+"""
+Maps the names in the header of the file to the fields.
+"""
+
+FALSE_VALUES = ('0', 'false', 'no', 'nein', 'n')
+
+
+class PriceListError(Exception):
+    """
+    The file can not be imported.
+    """
+
+
+class Report:
+    """
+    Result of an import, with the names of the products for each kind of
+    change.
+
+    * new: products that were created
+    * changed: products with a new price, unit or availability
+    * vanished: products that are not in the file
+    * unchanged: products that are the same as in the file
+    * errors: tuples (line number, message) for rows that were skipped
+    """
+
+    def __init__(self):
+        self.new = []
+        self.changed = []
+        self.vanished = []
+        self.unchanged = []
+        self.errors = []
+
+    def __str__(self):
+        return "{} new, {} changed, {} vanished, {} unchanged, {} errors".format(
+            len(self.new), len(self.changed), len(self.vanished), len(self.unchanged), len(self.errors))
+
+
+def parse_price(value):
+    """
+    Returns the price as Decimal or None for an empty value. Accepts a comma as
+    decimal separator.
+    """
+    value = value.strip().replace(',', '.')
+    if not value:
+        return None
+    price = Decimal(value).quantize(Decimal('0.01'))
+    if price < 0:
+        raise InvalidOperation()
+    return price
+
+
+def parse_available(value):
+    return value.strip().lower() not in FALSE_VALUES
+
+
+def read_rows(lines, delimiter=None):
+    """
+    Yields tuples (line number, name, unit, price, available) for each row of
+    a price list or tuples (line number, error) for invalid rows.
+
+    lines is an iterable of strings, e.g. an open file.
+    """
+    lines = iter(lines)
+    try:
+        header = next(lines)
+    except StopIteration:
+        raise PriceListError("The file is empty.")
+    header = header.lstrip('\ufeff')
+    if delimiter is None:
+        delimiter = max(';\t,', key=header.count)
+
+    columns = [COLUMNS.get(column.strip().lower()) for column in next(csv.reader([header], delimiter=delimiter))]
+    missing = set(['name', 'unit', 'price']) - set(columns)
+    if missing:
+        raise PriceListError("Missing columns: {}".format(", ".join(sorted(missing))))
+
+    for line_number, row in enumerate(csv.reader(lines, delimiter=delimiter), start=2):
+        if not any(value.strip() for value in row):
+            continue
+        values = dict((column, value) for column, value in zip(columns, row) if column is not None)
+        name = values.get('name', '').strip()
+        unit = values.get('unit', '').strip()
+        if not name or not unit:
+            yield line_number, "Name and unit are required"
+            continue
+        try:
+            price = parse_price(values.get('price', ''))
+        except InvalidOperation:
+            yield line_number, "Invalid price: {}".format(values['price'])
+            continue
+        yield line_number, name, unit, price, parse_available(values.get('available', ''))
+
+
+class Importer:
+    """
+    Imports the rows of a price list in batches.
+
+    If disable_vanished is True, products that are not in the price list are
+    set to not available.
+    """
+
+    def __init__(self, disable_vanished=False):
+        self.disable_vanished = disable_vanished
+        self.report = Report()
+        self.units = dict(Unit.objects.values_list('name', 'pk'))
+        self.seen = set()
+        self.repriced = []
+
+    def get_unit(self, name):
+        if name not in self.units:
+            self.units[name] = Unit.objects.create(name=name).pk
+        return self.units[name]
+
+    def import_rows(self, rows):
+        """
+        Imports all rows (see read_rows) and returns the report.
+        """
+        with transaction.atomic():
+            batch = []
+            for row in rows:
+                if len(row) == 2:
+                    self.report.errors.append(row)
+                    continue
+                line_number, name = row[:2]
+                if name in self.seen:
+                    self.report.errors.append((line_number, "Duplicate product: {}".format(name)))
+                    continue
+                self.seen.add(name)
+                batch.append(row)
+                if len(batch) >= BATCH_SIZE:
+                    self.import_batch(batch)
+                    batch = []
+            self.import_batch(batch)
+            self.finish()
+        # update() and bulk_create() do not send signals
+        caching.catalog_changed()
+        return self.report
+
+    def import_batch(self, batch):
+        """
+        Creates and updates the products of one batch of rows.
+        """
+        if not batch:
+            return
+        existing = dict(
+            (name, (pk, unit, price, available)) for pk, name, unit, price, available
+            in Product.objects.filter(name__in=[row[1] for row in batch])
+                              .values_list('pk', 'name', 'unit', 'price_cents', 'available'))
+        new_products = []
+        updates = {}
+        for __, name, unit_name, price, available in batch:
+            unit = self.get_unit(unit_name)
+            price = to_cents(price)
+            if name not in existing:
+                new_products.append(Product(name=name, unit_id=unit, price_cents=price, available=available))
+                self.report.new.append(name)
+                continue
+            pk, old_unit, old_price, old_available = existing[name]
+            if (old_unit, old_price, old_available) == (unit, price, available):
+                self.report.unchanged.append(name)
+                continue
+            # Products with the same new values are updated with one query
+            updates.setdefault((unit, price, available), []).append(pk)
+            if (old_unit, old_price) != (unit, price):
+                self.repriced.append(pk)
+            self.report.changed.append(name)
+
+        Product.objects.bulk_create(new_products)
+        for (unit, price, available), pks in updates.items():
+            Product.objects.filter(pk__in=pks).update(unit=unit, price_cents=price, available=available)
+
+    def finish(self):
+        """
+        Finds the vanished products and rebuilds the totals of all bundles with
+        changed prices.
+        """
+        vanished = []
+        for pk, name, available in Product.objects.values_list('pk', 'name', 'available').iterator():
+            if name not in self.seen:
+                self.report.vanished.append(name)
+                if available:
+                    vanished.append(pk)
+        if self.disable_vanished:
+            for start in range(0, len(vanished), BATCH_SIZE):
+                Product.objects.filter(pk__in=vanished[start:start + BATCH_SIZE]).update(available=False)
+
+        bundle_ids = set()
+        for start in range(0, len(self.repriced), BATCH_SIZE):
+            bundles = Bundle.objects.filter(orders__product__in=self.repriced[start:start + BATCH_SIZE])
+            bundle_ids.update(bundles.values_list('pk', flat=True).distinct())
+        totals.rebuild(bundle_ids)
+
+
+def import_price_list(lines, delimiter=None, disable_vanished=False, dry_run=False):
+    """
+    Imports a price list and returns a Report.
+
+    lines is an iterable of strings, e.g. an open file. If dry_run is True, the
+    changes are rolled back, so only the report is created.
+    """
+    with transaction.atomic():
+        report = Importer(disable_vanished).import_rows(read_rows(lines, delimiter))
+        if dry_run:
+            transaction.set_rollback(True)
+    caching.bump_deferred()
+    return report
@@ -0,0 +1,63 @@
+"""
+Generator for synthetic data, used for development and benchmarks.
+"""
+import random
+
+from django.db import transaction
+
+from . import caching, totals
+from .models import Bundle, Group, Order, Product, Unit
+
+
+def seed(groups=10, units=3, products=50, bundles=1, orders=None, random_seed=None):
+    """
+    Creates groups, units, products and bundles with random orders.
+
+    orders is the number of orders for each bundle. If it is None, each group
+    orders each product (groups * products orders). The orders are distributed
+    randomly over all groups and products.
+
+    Returns a dict with the created objects.
+    """
+    rand = random.Random(random_seed)
+    max_orders = groups * products
+    orders = max_orders if orders is None else min(orders, max_orders)
+
+    with transaction.atomic():
+        offset = Group.objects.count()
+        Group.objects.bulk_create(
+            Group(name="Gruppe {}".format(offset + i), enclosure=rand.random() < 0.9) for i in range(groups))
+        created_groups = list(Group.objects.order_by('-pk')[:groups])
+
+        offset = Unit.objects.count()
+        Unit.objects.bulk_create(
+            Unit(name="Einheit {}".format(offset + i), divisor=rand.choice([1, 1, 10, 100, 1000]))
+            for i in range(units))
+        created_units = list(Unit.objects.order_by('-pk')[:units])
+
+        offset = Product.objects.count()
+        Product.objects.bulk_create(
+            Product(name="Produkt {}".format(offset + i), unit=rand.choice(created_units),
+                    price_cents=rand.randint(10, 2000) if rand.random() < 0.98 else None)
+            for i in range(products))
+        created_products = list(Product.objects.select_related('unit').order_by('-pk')[:products])
+
+        created_bundles = []
+        for __ in range(bundles):
+            bundle = Bundle.objects.create()
+            cells = rand.sample(range(max_orders), orders)
+            Order.objects.bulk_create(
+                Order(bundle=bundle,
+                      group=created_groups[cell // products],
+                      product=created_products[cell % products],
+                      amount=rand.randint(0, 20) * created_products[cell % products].unit.divisor,
+                      delivered=rand.choice([None, None, rand.randint(0, 20)]))
+                for cell in cells)
+            created_bundles.append(bundle)
+
+        totals.rebuild(bundle.pk for bundle in created_bundles)
+    # bulk_create does not send signals
+    caching.catalog_changed()
+
+    return {'groups': created_groups, 'units': created_units, 'products': created_products,
+            'bundles': created_bundles}
@@ -0,0 +1,69 @@
+"""
+Signal handlers to keep the running totals (see order.totals) up to date and to
+invalidate the cached pages (see order.caching). Deleted orders are marked in
+the sequence of their bundle (see order.models.mark_deleted), while the totals
+are paused only once for each bundle (see order.totals.paused).
+
+New SQLite connections are configured by order.database.configure_sqlite.
+"""
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import caching, database, totals
+from .models import Bundle, Group, Order, Product, Unit, mark_deleted
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        totals.order_saved(instance)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, using=None, **kwargs):
+    if totals.is_paused():
+        # Many orders are deleted at once, the bundle is marked only once
+        totals.deleted_while_paused(instance.bundle_id, using)
+        return
+    totals.order_deleted(instance)
+    mark_deleted(instance.bundle_id, using)
+    caching.bundle_changed(instance.bundle_id)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        totals.product_saved(instance)
+
+
+@receiver(post_save, sender=Unit)
+def unit_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        totals.unit_saved(instance)
+
+
+@receiver(post_save, sender=Bundle)
+@receiver(post_delete, sender=Bundle)
+def bundle_changed(sender, instance, **kwargs):
+    caching.bundle_changed(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def order_changed(sender, instance, **kwargs):
+    caching.bundle_changed(instance.bundle_id)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Unit)
+@receiver(post_delete, sender=Unit)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def catalog_changed(sender, **kwargs):
+    caching.catalog_changed()
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    database.configure_sqlite(connection)
@@ -46,6 +46,15 @@ $(function() {
   });
 
   // Output Table
+  // Each cell sends the version of the order, that it shows. If someone else
+  // has changed the order in the meantime, the cell shows the current value.
+  // An unknown version is stored as '' (and not removed), because jQuery
+  // would fall back to the data-version attribute of the page. The server
+  // does not check an empty version.
+  function setVersion(input, version) {
+    input.data('version', version === undefined || version === null ? '' : version);
+  }
+
   $('.output-input').change(function() {
     var self = $(this);
     var group = self.parent().children('.group').html();
@@ -58,8 +67,17 @@ $(function() {
         group: group,
         product: product,
         delivered: self.val(),
+        version: self.data('version'),
       },
       success: function(data) {
+        if (data['conflict']) {
+          self.val(data['conflict']['delivered']);
+          setVersion(self, data['conflict']['version']);
+          self.parent().addClass('danger').attr('title', data['error']);
+          return;
+        }
+        self.parent().removeClass('danger');
+        setVersion(self, data['version']);
         $('#price-' + group).html(data['price_for_group']);
         $('#order_costs').html(data['price_for_all']);
         $('#product-delivered-' + product).html(data['product_delivered']);
@@ -67,4 +85,78 @@ $(function() {
     });
   });
 
+  // Product editor: only send the changed rows
+  $('.bulk-row :input').change(function() {
+    $(this).closest('.bulk-row').find('.bulk-row-changed').prop('disabled', false);
+  });
+
+  // Changes of the output table from other clients
+  // After missed events, only the changes since the sequence of the page are
+  // loaded. The page is only loaded again, if a changed cell is not shown.
+  function applyChanges(data) {
+    var missing = false;
+    $.each(data['cells'], function(i, cell) {
+      var input = $('#cell-' + cell[0] + '-' + cell[1]);
+      if (!input.length) {
+        missing = true;
+      } else if (!input.is(':focus')) {
+        input.val(cell[3]);
+        setVersion(input, cell[4]);
+      }
+    });
+    $.each(data['groups'], function(group, total) {
+      $('#price-' + group).html(total['price_delivered']);
+    });
+    $.each(data['products'], function(product, total) {
+      $('#product-delivered-' + product).html(total['delivered']);
+    });
+    $('#order_costs').html(data['price_delivered']);
+    return !missing;
+  }
+
+  function listenOutputEvents() {
+    var source = new EventSource(OUTPUT_EVENTS_URL);
+    source.addEventListener('change', function(event) {
+      var data = JSON.parse(event.data);
+      $.each(data['cells'], function(i, cell) {
+        var input = $('#cell-' + cell[0] + '-' + cell[1]);
+        // Do not overwrite a cell, that is edited at the moment
+        if (input.length && !input.is(':focus')) {
+          input.val(cell[2]);
+          setVersion(input, cell[3]);
+        }
+      });
+      $.each(data['price_for_group'], function(group, price) {
+        $('#price-' + group).html(price);
+      });
+      $.each(data['product_delivered'], function(product, delivered) {
+        $('#product-delivered-' + product).html(delivered);
+      });
+      $('#order_costs').html(data['price_for_all']);
+    });
+    source.addEventListener('reload', function() {
+      source.close();
+      $.ajax({
+        url: OUTPUT_CHANGES_URL,
+        dataType: 'json',
+        data: {since: OUTPUT_SEQUENCE},
+        success: function(data) {
+          if (data['reload'] || data['error'] || !applyChanges(data)) {
+            window.location.reload();
+          } else {
+            OUTPUT_SEQUENCE = data['sequence'];
+            listenOutputEvents();
+          }
+        },
+        error: function() {
+          window.location.reload();
+        }
+      });
+    });
+  }
+
+  if (typeof OUTPUT_EVENTS_URL !== 'undefined' && window.EventSource) {
+    listenOutputEvents();
+  }
+
 });
@@ -0,0 +1,164 @@
+import gzip
+import json
+
+import pytest
+from django.core.cache import cache
+from django.test import Client
+
+from order import api, archive
+from order.models import Bundle
+
+
+@pytest.mark.django_db
+class TestBundleData:
+    def test_bundle_data(self, bundle_db):
+        data = api.bundle_data(bundle_db['bundle'])
+
+        assert data['products'] == {
+            'id': [bundle_db['milk'].pk, bundle_db['rice'].pk],
+            'name': ['milk', 'rice'],
+            'unit': ['Liter', 'Kilo'],
+            'price': ['1.53', '0.78'],
+            'amount': [7, 2600],
+            'order_price': ['10.71', '2.03'],
+            'delivered': [7, 2000]}
+        assert data['groups'] == {
+            'id': [bundle_db['me'].pk, bundle_db['other'].pk],
+            'name': ['My Group', 'Other Group'],
+            'price': ['4.98', '7.29']}
+        assert data['orders'] == {
+            'product': [0, 0, 1, 1],
+            'group': [0, 1, 0, 1],
+            'amount': [3, 4, 800, 1800],
+            'delivered': [3, 4, 500, 1500]}
+        assert (data['order_price'], data['price_for_all']) == ('12.74', '12.27')
+        assert data['bundle']['open'] is True
+
+    def test_archived_bundle(self, bundle_db):
+        bundle = bundle_db['bundle']
+        bundle.open = False
+        bundle.save()
+        archive.archive(bundle, move_orders=True)
+        bundle_db['milk'].price = 9
+        bundle_db['milk'].save()
+
+        data = api.bundle_data(bundle)
+
+        assert data['products']['price'] == ['1.53', '0.78']
+        assert data['price_for_all'] == '12.27'
+
+
+@pytest.mark.django_db
+class TestBundleDataView:
+    def test_json(self, bundle_db):
+        response = Client().get('/bundle/{}/data.json'.format(bundle_db['bundle'].pk))
+
+        assert response['Content-Type'] == 'application/json'
+        assert json.loads(response.content.decode('utf-8')) == json.loads(
+            json.dumps(api.bundle_data(bundle_db['bundle'])))
+
+    def test_gzip(self, seeded_bundle):
+        url = '/bundle/{}/data.json'.format(seeded_bundle['bundle'].pk)
+        response = Client().get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+        assert response['Content-Encoding'] == 'gzip'
+        data = json.loads(gzip.decompress(response.content).decode('utf-8'))
+        assert len(data['orders']['amount']) == 4 + 10 * 19
+
+    def test_not_modified(self, bundle_db):
+        client = Client()
+        url = '/bundle/{}/data.json'.format(bundle_db['bundle'].pk)
+        etag = client.get(url)['ETag']
+
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+        order = bundle_db['bundle'].orders.get(group=bundle_db['me'], product=bundle_db['milk'])
+        order.amount = 5
+        order.save()
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    def test_not_modified_gzip(self, seeded_bundle):
+        client = Client()
+        url = '/bundle/{}/data.json'.format(seeded_bundle['bundle'].pk)
+        etag = client.get(url, HTTP_ACCEPT_ENCODING='gzip')['ETag']
+
+        assert etag.endswith(';gzip"')
+        assert client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    def test_closed_bundle_cached(self, bundle_db):
+        cache.clear()
+        bundle_db['bundle'].open = False
+        bundle_db['bundle'].save()
+        url = '/bundle/{}/data.json'.format(bundle_db['bundle'].pk)
+        first = Client().get(url)
+
+        second = Client().get(url)
+
+        assert second.content == first.content
+        assert second['Content-Type'] == 'application/json'
+
+
+@pytest.mark.django_db
+class TestBundleChanges:
+    def get_bundle(self, bundle_db):
+        return Bundle.objects.get(pk=bundle_db['bundle'].pk)
+
+    def test_changes_since(self, bundle_db):
+        order = bundle_db['bundle'].orders.get(group=bundle_db['other'], product=bundle_db['rice'])
+        order.delivered = 2000
+        order.save()
+
+        data = api.bundle_changes(self.get_bundle(bundle_db), 4)
+
+        assert data == {
+            'sequence': 5,
+            'cells': [[bundle_db['other'].pk, bundle_db['rice'].pk, 1800, 2000, 1]],
+            'groups': {bundle_db['other'].pk: {'price': '7.52', 'price_delivered': '7.68'}},
+            'products': {bundle_db['rice'].pk: {'amount': 2600, 'delivered': 2500}},
+            'price': '12.74',
+            'price_delivered': '12.66'}
+
+    def test_no_changes(self, bundle_db):
+        data = api.bundle_changes(self.get_bundle(bundle_db), 4)
+
+        assert (data['sequence'], data['cells'], data['groups'], data['products']) == (4, [], {}, {})
+
+    def test_all_orders(self, bundle_db):
+        data = api.bundle_changes(self.get_bundle(bundle_db), 0)
+
+        assert [cell[2:4] for cell in data['cells']] == [[3, 3], [800, 500], [4, 4], [1800, 1500]]
+
+    def test_reload(self, bundle_db):
+        bundle = self.get_bundle(bundle_db)
+
+        assert api.bundle_changes(bundle, 5) == {'sequence': 4, 'reload': True}
+        bundle_db['bundle'].orders.get(group=bundle_db['me'], product=bundle_db['milk']).delete()
+        bundle = self.get_bundle(bundle_db)
+        assert api.bundle_changes(bundle, 4) == {'sequence': 5, 'reload': True}
+        assert len(api.bundle_changes(bundle, 0)['cells']) == 3
+        assert api.bundle_changes(bundle, 5)['cells'] == []
+        bundle.open = False
+        bundle.save()
+        archive.archive(bundle)
+        assert api.bundle_changes(bundle, 5) == {'sequence': 5, 'reload': True}
+
+
+@pytest.mark.django_db
+class TestBundleChangesView:
+    def test_json(self, bundle_db):
+        url = '/bundle/{}/changes.json'.format(bundle_db['bundle'].pk)
+        Client().post('/bundle/{}/output/'.format(bundle_db['bundle'].pk),
+                      {'group': bundle_db['me'].pk, 'product': bundle_db['milk'].pk, 'delivered': 2},
+                      HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        response = Client().get(url, {'since': 4})
+
+        assert response['Content-Type'] == 'application/json'
+        data = json.loads(response.content.decode('utf-8'))
+        assert data['sequence'] == 5
+        assert data['cells'] == [[bundle_db['me'].pk, bundle_db['milk'].pk, 3, 2, 1]]
+
+    def test_since_not_integer(self, bundle_db):
+        response = Client().get('/bundle/{}/changes.json'.format(bundle_db['bundle'].pk), {'since': 'x'})
+
+        assert json.loads(response.content.decode('utf-8')) == {'error': "Since has to be an integer"}
@@ -0,0 +1,124 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.core.cache import cache
+from django.test import Client
+from django.utils import timezone
+
+from order import archive, export
+from order.models import ArchivedOrder, Bundle, Order, Product
+
+
+@pytest.fixture
+def closed_bundle(bundle_db):
+    cache.clear()
+    bundle = bundle_db['bundle']
+    bundle.open = False
+    bundle.closed = timezone.now() - timedelta(days=40)
+    bundle.save()
+    return bundle_db
+
+
+@pytest.mark.django_db
+class TestArchive:
+    def test_open_bundle(self, bundle_db):
+        with pytest.raises(ValueError):
+            archive.archive(bundle_db['bundle'])
+
+    def test_archivable(self, closed_bundle):
+        assert list(archive.archivable(30)) == [closed_bundle['bundle']]
+        assert list(archive.archivable(50)) == []
+
+    def test_zero_orders(self, closed_bundle):
+        bundle = closed_bundle['bundle']
+        unused = Product.objects.create(name='unused', price=1, unit=closed_bundle['kilo'])
+        bundle.orders.create(group=closed_bundle['me'], product=unused, amount=0)
+
+        archive.archive(bundle)
+
+        assert bundle.orders.count() == 4
+        assert not bundle.product_totals.filter(product=unused).exists()
+        assert Bundle.objects.get(pk=bundle.pk).archived
+
+    def test_frozen_prices(self, closed_bundle):
+        bundle = closed_bundle['bundle']
+        archive.archive(bundle)
+
+        milk = closed_bundle['milk']
+        milk.price = 2
+        milk.save()
+
+        assert bundle.price_for_all() == Decimal('12.738')
+        assert bundle.product_totals.get(product=milk).unit_price == 153
+
+    def test_move_orders(self, closed_bundle):
+        bundle = closed_bundle['bundle']
+        archive.archive(bundle, move_orders=True)
+
+        assert not Order.objects.filter(bundle=bundle).exists()
+        assert ArchivedOrder.objects.filter(bundle=bundle).count() == 4
+        assert bundle.price_for_group(closed_bundle['other'], delivered=True) == Decimal('7.29')
+
+    def test_export(self, closed_bundle):
+        bundle = closed_bundle['bundle']
+        rows = list(export.output_rows(bundle, delivered=True))
+
+        archive.archive(bundle, move_orders=True)
+        closed_bundle['milk'].price = 2
+        closed_bundle['milk'].save()
+
+        assert list(export.output_rows(bundle, delivered=True)) == rows
+
+
+@pytest.mark.django_db
+class TestArchivedViews:
+    def get(self, url):
+        return Client().get(url).content.decode('utf-8')
+
+    def get_content(self, url):
+        # Without the javascript, which has no event stream for archived bundles
+        return self.get(url).split('<script')[0]
+
+    def test_pages(self, closed_bundle):
+        bundle = closed_bundle['bundle']
+        urls = ['/bundle/{}/order/'.format(bundle.pk), '/bundle/{}/output/'.format(bundle.pk)]
+        pages = [self.get_content(url) for url in urls]
+
+        archive.archive(bundle, move_orders=True)
+        closed_bundle['milk'].price = 2
+        closed_bundle['milk'].save()
+
+        assert [self.get_content(url) for url in urls] == pages
+
+    def test_detail(self, closed_bundle):
+        bundle = closed_bundle['bundle']
+        closed_bundle['other'].enclosure = True
+        closed_bundle['other'].save()
+        archive.archive(bundle, move_orders=True)
+
+        content = self.get('/bundle/{}/?group={}'.format(bundle.pk, closed_bundle['other'].pk))
+
+        assert '1800' in content
+        assert '7.52' in content
+
+    def test_no_changes(self, closed_bundle):
+        bundle = closed_bundle['bundle']
+        archive.archive(bundle)
+        client = Client()
+
+        assert client.get('/bundle/{}/open/'.format(bundle.pk)).status_code == 403
+        assert client.post('/bundle/{}/output/'.format(bundle.pk), {}, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+                           ).status_code == 403
+
+
+@pytest.mark.django_db
+def test_close_view(bundle_db):
+    bundle = bundle_db['bundle']
+    client = Client()
+
+    client.get('/bundle/{}/close/'.format(bundle.pk))
+    assert Bundle.objects.get(pk=bundle.pk).closed is not None
+
+    client.get('/bundle/{}/open/'.format(bundle.pk))
+    assert Bundle.objects.get(pk=bundle.pk).closed is None
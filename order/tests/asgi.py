@@ -0,0 +1,156 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+
+from order import asgi, loadtest, seeding, writes
+from order.asgi import ASGIHandler, environ_from_scope
+
+
+@pytest.fixture
+def inline_executor(inline_executor):
+    """
+    Runs the threads of the ASGI handler and of the load test in the test
+    thread.
+    """
+    with patch('order.asgi.ThreadPoolExecutor', inline_executor), \
+            patch('order.loadtest.ThreadPoolExecutor', inline_executor):
+        yield inline_executor
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_environ_from_scope():
+    scope = {'type': 'http', 'method': 'POST', 'path': '/bundle/1/', 'query_string': b'group=2',
+             'headers': [(b'content-type', b'text/plain'), (b'x-requested-with', b'XMLHttpRequest'),
+                         (b'accept', b'text/html'), (b'accept', b'*/*')],
+             'client': ('127.0.0.1', 1234)}
+
+    environ = environ_from_scope(scope, b'body')
+
+    assert environ['REQUEST_METHOD'] == 'POST'
+    assert environ['PATH_INFO'] == '/bundle/1/'
+    assert environ['QUERY_STRING'] == 'group=2'
+    assert environ['CONTENT_TYPE'] == 'text/plain'
+    assert environ['CONTENT_LENGTH'] == '4'
+    assert environ['HTTP_X_REQUESTED_WITH'] == 'XMLHttpRequest'
+    assert environ['HTTP_ACCEPT'] == 'text/html,*/*'
+    assert environ['REMOTE_ADDR'] == '127.0.0.1'
+    assert environ['wsgi.input'].read() == b'body'
+
+
+def test_lifespan(inline_executor):
+    messages = [{'type': 'lifespan.shutdown'}, {'type': 'lifespan.startup'}]
+    sent = []
+
+    async def receive():
+        return messages.pop()
+
+    async def send(message):
+        sent.append(message['type'])
+
+    run(ASGIHandler()({'type': 'lifespan'}, receive, send))
+
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+
+def test_commit():
+    buffer = writes.WriteBuffer(delay=0.05)
+    batches = [buffer.add(1, 1, writes.AMOUNT, product, product) for product in range(3)]
+    loop = asyncio.new_event_loop()
+
+    with patch('order.writes.save_pending') as save_pending:
+        results = loop.run_until_complete(asyncio.gather(
+            *(asgi.commit(buffer, batch) for batch in batches), loop=loop))
+    loop.close()
+
+    assert results == [True] * 3
+    save_pending.assert_called_once_with({(1, 1, writes.AMOUNT): {0: 0, 1: 1, 2: 2}})
+
+
+def test_commit_saved_batch():
+    buffer = writes.WriteBuffer(delay=60)
+    batch = buffer.add(1, 1, writes.AMOUNT, 1, 1)
+    with patch('order.writes.save_pending'):
+        buffer.flush()
+
+    assert run(asgi.commit(buffer, batch)) is True
+
+
+def test_run_in_thread():
+    with patch('order.asgi.close_old_connections') as close_old_connections:
+        assert asgi.run_in_thread(sum, [1, 2]) == 3
+        with pytest.raises(ValueError):
+            asgi.run_in_thread(int, 'x')
+
+    assert close_old_connections.call_count == 2
+
+
+@pytest.mark.django_db
+class TestASGIHandler:
+    def test_get(self, inline_executor):
+        scope = {'type': 'http', 'method': 'GET', 'path': '/', 'headers': []}
+
+        status, content = run(loadtest.asgi_client(ASGIHandler(), scope, b''))
+
+        assert status == 200
+        assert b'<html' in content
+
+    def test_closed_in_serving_thread(self, inline_executor):
+        scope = {'type': 'http', 'method': 'GET', 'path': '/', 'headers': []}
+        application = ASGIHandler()
+
+        with patch.object(application, 'run', wraps=application.run) as run_step:
+            status, content = run(loadtest.asgi_client(application, scope, b''))
+
+        assert status == 200
+        # The handler, the body and close() run in one step.
+        assert run_step.call_count == 1
+
+    def test_handler_error(self, inline_executor):
+        scope = {'type': 'http', 'method': 'GET', 'path': '/', 'headers': []}
+        application = ASGIHandler()
+
+        with patch.object(application, 'wsgi_handler', side_effect=ValueError("broken")):
+            with pytest.raises(ValueError) as error:
+                run(loadtest.asgi_client(application, scope, b''))
+
+        assert str(error.value) == "broken"
+
+    def test_ajax(self, inline_executor):
+        data = seeding.seed(groups=2, products=3, random_seed=1)
+        (detail, detail_body), (output, output_body) = loadtest.get_ajax_scopes(data, 2)
+        product = data['products'][0]
+        application = ASGIHandler()
+
+        status, content = run(loadtest.asgi_client(application, detail, detail_body))
+
+        assert status == 200
+        assert 'price_for_group' in json.loads(content.decode('utf-8'))
+        assert data['bundles'][0].orders.get(group=data['groups'][0], product=product).amount == 0
+
+        status, content = run(loadtest.asgi_client(application, output, output_body))
+
+        assert status == 200
+        assert json.loads(content.decode('utf-8'))['product_delivered'] == data['bundles'][0].delivered_for_product(
+            product)
+        assert data['bundles'][0].orders.get(group=data['groups'][0], product=product).delivered == 1
+
+
+@pytest.mark.django_db
+def test_compare_servers(inline_executor):
+    data = seeding.seed(groups=2, products=3, random_seed=1)
+
+    results = loadtest.compare_servers(data, requests=6, concurrency=2, threads=1)
+
+    assert set(results) == {'wsgi', 'asgi'}
+    for result in results.values():
+        assert result['errors'] == 0
+        assert set(result) == {'requests_per_second', 'p50_ms', 'p95_ms', 'errors'}
@@ -0,0 +1,72 @@
+import sys
+from unittest.mock import patch
+
+import pytest
+
+from order import benchmark, seeding
+from order.models import Bundle, Group, Order, Product, Unit
+from order.totals import compare
+
+
+@pytest.mark.django_db
+class TestSeed:
+    def test_counts(self):
+        seeding.seed(groups=3, units=2, products=4, bundles=2, orders=5, random_seed=1)
+
+        assert Group.objects.count() == 3
+        assert Unit.objects.count() == 2
+        assert Product.objects.count() == 4
+        assert Bundle.objects.count() == 2
+        assert Order.objects.count() == 10
+
+    def test_all_cells(self):
+        data = seeding.seed(groups=3, products=4, random_seed=1)
+
+        assert data['bundles'][0].orders.count() == 12
+
+    def test_totals(self):
+        data = seeding.seed(groups=3, products=4, random_seed=1)
+
+        assert compare(bundle.pk for bundle in data['bundles']) == []
+
+
+def test_percentile():
+    values = list(range(1, 101))
+
+    assert benchmark.percentile(values, 50) == 50
+    assert benchmark.percentile(values, 95) == 95
+    assert benchmark.percentile([7], 95) == 7
+
+
+@pytest.mark.skipif(sys.version_info < (3, 4), reason="tracemalloc needs Python 3.4")
+def test_peak_memory():
+    assert benchmark.peak_memory(bytearray, 1024 * 1024) >= 1024 * 1024
+
+
+def test_peak_memory_without_tracemalloc():
+    calls = []
+
+    with patch.dict('sys.modules', {'tracemalloc': None}):
+        assert benchmark.peak_memory(calls.append, 1) is None
+
+    assert calls == [1]
+
+
+@pytest.mark.django_db
+def test_run():
+    results = benchmark.run({'groups': 3, 'products': 5}, repeat=2)
+
+    assert benchmark.missing_url_names(results) == []
+    for name, result in results.items():
+        assert result['status'] in (200, 302), name
+        assert set(result) == {'url_name', 'status', 'p50_ms', 'p95_ms', 'queries', 'peak_memory_kb'}
+
+
+@pytest.mark.django_db
+def test_concurrent_orders(inline_executor):
+    data = seeding.seed(groups=3, products=5, random_seed=1)
+
+    result = benchmark.concurrent_orders(data, orders=2, threads=2)
+
+    assert result['errors'] == 0
+    assert Order.objects.filter(bundle=data['bundles'][0], amount__gt=0).count() >= 6
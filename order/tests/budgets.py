@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+
+@pytest.mark.django_db
+class TestQueryBudgets:
+    def test_bundle_list(self, seeded_bundle, query_budget):
+        assert query_budget('order_bundle_list').status_code == 200
+
+    def test_bundle_detail(self, seeded_bundle, query_budget):
+        group = seeded_bundle['groups'][0]
+        response = query_budget('order_bundle_detail', [seeded_bundle['bundle'].pk], data={'group': group.pk})
+
+        assert response.status_code == 200
+
+    def test_bundle_detail_ajax(self, seeded_bundle, client, query_budget):
+        group = seeded_bundle['groups'][0]
+        client.get('/bundle/{}/'.format(seeded_bundle['bundle'].pk), {'group': group.pk})
+        data = {'product': seeded_bundle['milk'].pk, 'amount': 5}
+        response = query_budget('order_bundle_detail', [seeded_bundle['bundle'].pk], 'POST', data,
+                                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        assert b'error' not in response.content
+
+    def test_bundle_detail_closed(self, seeded_bundle, query_budget):
+        seeded_bundle['bundle'].open = False
+        seeded_bundle['bundle'].save()
+
+        assert query_budget('order_bundle_detail', [seeded_bundle['bundle'].pk]).status_code == 200
+
+    def test_bundle_order(self, seeded_bundle, query_budget):
+        assert query_budget('order_bundle_order', [seeded_bundle['bundle'].pk]).status_code == 200
+
+    def test_bundle_output(self, seeded_bundle, query_budget):
+        assert query_budget('order_bundle_output', [seeded_bundle['bundle'].pk]).status_code == 200
+
+    def test_bundle_output_ajax(self, seeded_bundle, query_budget):
+        data = {'group': seeded_bundle['me'].pk, 'product': seeded_bundle['milk'].pk, 'delivered': 5}
+        response = query_budget('order_bundle_output', [seeded_bundle['bundle'].pk], 'POST', data,
+                                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        assert b'error' not in response.content
+
+    def test_bundle_output_events(self, seeded_bundle, query_budget):
+        response = query_budget('order_bundle_output_events', [seeded_bundle['bundle'].pk], data={'duration': 0})
+
+        assert response.content_bytes.startswith(b'retry:')
+
+    def test_bundle_data(self, seeded_bundle, query_budget):
+        response = query_budget('order_bundle_data', [seeded_bundle['bundle'].pk], HTTP_ACCEPT_ENCODING='gzip')
+
+        assert response['Content-Encoding'] == 'gzip'
+
+    def test_bundle_changes(self, seeded_bundle, query_budget):
+        response = query_budget('order_bundle_changes', [seeded_bundle['bundle'].pk], data={'since': 0})
+
+        assert len(json.loads(response.content.decode('utf-8'))['cells']) == 4 + 10 * 20
+
+    def test_bundle_output_export(self, seeded_bundle, query_budget):
+        response = query_budget('order_bundle_output_export', [seeded_bundle['bundle'].pk, 'delivered', 'csv'])
+
+        assert len(response.content_bytes.splitlines()) == 23
+
+    def test_product_formset(self, seeded_bundle, query_budget):
+        assert query_budget('order_product_formset').status_code == 200
+
+    def test_middleware_headers(self, seeded_bundle, client, settings):
+        settings.ORDER_COUNT_QUERIES = True
+        response = client.get('/bundle/{}/output/'.format(seeded_bundle['bundle'].pk))
+
+        assert int(response['X-DB-Queries']) <= int(response['X-DB-Query-Budget'])
+        assert float(response['X-DB-Time']) <= float(response['X-Render-Time'])
+
+    def test_middleware_disabled(self, seeded_bundle, client, settings):
+        settings.ORDER_COUNT_QUERIES = False
+        response = client.get('/bundle/{}/output/'.format(seeded_bundle['bundle'].pk))
+
+        assert 'X-DB-Queries' not in response
@@ -0,0 +1,32 @@
+import pytest
+
+from order import cacheprofiles
+
+
+class TestGetCaches:
+    def test_file(self):
+        caches = cacheprofiles.get_caches({}, '/srv/foodcoop')
+
+        assert caches['default']['BACKEND'] == 'django.core.cache.backends.filebased.FileBasedCache'
+        assert caches['default']['LOCATION'] == '/srv/foodcoop/cache'
+
+    def test_file_dir(self):
+        caches = cacheprofiles.get_caches({'FOODCOOP_CACHE_DIR': '/tmp/foodcoop-cache'})
+
+        assert caches['default']['LOCATION'] == '/tmp/foodcoop-cache'
+
+    def test_memcached(self):
+        caches = cacheprofiles.get_caches({'FOODCOOP_CACHE': 'memcached',
+                                           'FOODCOOP_CACHE_LOCATION': 'cache1:11211;cache2:11211'})
+
+        assert caches['default']['BACKEND'] == 'django.core.cache.backends.memcached.MemcachedCache'
+        assert caches['default']['LOCATION'] == ['cache1:11211', 'cache2:11211']
+
+    def test_locmem(self):
+        caches = cacheprofiles.get_caches({'FOODCOOP_CACHE': 'locmem'})
+
+        assert caches['default']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache'
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            cacheprofiles.get_caches({'FOODCOOP_CACHE': 'redis'})
@@ -0,0 +1,223 @@
+from unittest.mock import patch
+
+import pytest
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from order import caching
+from order.forms import GroupChooseForm
+from order.models import Bundle, Group, Order
+
+
+@pytest.fixture
+def closed_bundle(bundle_db):
+    cache.clear()
+    bundle_db['bundle'].open = False
+    bundle_db['bundle'].save()
+    return bundle_db
+
+
+@pytest.mark.django_db
+class TestClosedBundleCache:
+    def get_output(self, bundle):
+        return Client().get('/bundle/{}/output/'.format(bundle.pk)).content.decode('utf-8')
+
+    def test_cached(self, closed_bundle):
+        bundle = closed_bundle['bundle']
+        content = self.get_output(bundle)
+
+        # Changes without signals are not seen
+        Order.objects.filter(bundle=bundle).update(delivered=12345)
+
+        assert self.get_output(bundle) == content
+
+    def test_order_changed(self, closed_bundle):
+        bundle = closed_bundle['bundle']
+        self.get_output(bundle)
+
+        order = bundle.orders.get(group=closed_bundle['me'], product=closed_bundle['rice'])
+        order.delivered = 12345
+        order.save()
+
+        assert '12345' in self.get_output(bundle)
+
+    def test_product_changed(self, closed_bundle):
+        self.get_output(closed_bundle['bundle'])
+
+        closed_bundle['milk'].name = 'oat milk'
+        closed_bundle['milk'].save()
+
+        assert 'oat milk' in self.get_output(closed_bundle['bundle'])
+
+    def test_open_bundle_not_cached(self, bundle_db):
+        bundle = bundle_db['bundle']
+        self.get_output(bundle)
+
+        Order.objects.filter(bundle=bundle).update(delivered=12345)
+
+        assert '12345' in self.get_output(bundle)
+
+    def test_reopened(self, closed_bundle):
+        bundle = closed_bundle['bundle']
+        self.get_output(bundle)
+
+        Client().get('/bundle/{}/open/'.format(bundle.pk))
+        Order.objects.filter(bundle=bundle).update(delivered=12345)
+
+        assert Bundle.objects.get(pk=bundle.pk).open
+        assert '12345' in self.get_output(bundle)
+
+
+@pytest.mark.django_db
+class TestCatalog:
+    def test_catalog(self, bundle_db):
+        cache.clear()
+        assert [product.name for product in caching.get_catalog()['products']] == ['milk', 'rice']
+
+        bundle_db['rice'].available = False
+        bundle_db['rice'].save()
+
+        assert [product.name for product in caching.get_catalog()['products']] == ['milk']
+
+    def test_catalog_cached(self, bundle_db):
+        cache.clear()
+        caching.get_catalog()
+
+        Group.objects.filter(pk=bundle_db['me'].pk).update(enclosure=True)
+
+        assert caching.get_catalog()['groups'] == []
+
+    def test_group_choose_form(self, bundle_db):
+        cache.clear()
+        Group.objects.create(name='Paid Group', enclosure=True)
+
+        form = GroupChooseForm({'group': bundle_db['me'].pk})
+
+        assert not form.is_valid()
+        assert [name for __, name in form.fields['group'].choices] == ['---------', 'Paid Group']
+
+    def test_group_choose_form_valid(self, bundle_db):
+        cache.clear()
+        group = Group.objects.create(name='Paid Group', enclosure=True)
+
+        form = GroupChooseForm({'group': group.pk})
+
+        assert form.is_valid()
+        assert form.cleaned_data['group'] == group
+
+
+@pytest.mark.django_db
+class TestConditionalGet:
+    def get(self, client, url, response=None):
+        extra = {}
+        if response is not None:
+            extra = {'HTTP_IF_NONE_MATCH': response['ETag'], 'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']}
+        return client.get(url, **extra)
+
+    def test_not_modified(self, bundle_db):
+        cache.clear()
+        client = Client()
+        url = '/bundle/{}/output/'.format(bundle_db['bundle'].pk)
+        response = self.get(client, url)
+
+        with CaptureQueriesContext(connection) as queries:
+            not_modified = self.get(client, url, response)
+
+        assert response.status_code == 200
+        assert not_modified.status_code == 304
+        assert len(queries) == 0
+
+    def test_order_changed(self, bundle_db):
+        cache.clear()
+        client = Client()
+        url = '/bundle/{}/order/'.format(bundle_db['bundle'].pk)
+        response = self.get(client, url)
+
+        order = bundle_db['bundle'].orders.first()
+        order.amount += 1
+        order.save()
+
+        assert self.get(client, url, response).status_code == 200
+
+    def test_catalog_changed(self, bundle_db):
+        cache.clear()
+        client = Client()
+        url = '/bundle/{}/order/'.format(bundle_db['bundle'].pk)
+        response = self.get(client, url)
+
+        bundle_db['milk'].price = 2
+        bundle_db['milk'].save()
+
+        assert self.get(client, url, response).status_code == 200
+
+    def test_other_group(self, bundle_db):
+        cache.clear()
+        client = Client()
+        Group.objects.filter(pk__in=[bundle_db['me'].pk, bundle_db['other'].pk]).update(enclosure=True)
+        url = '/bundle/{}/'.format(bundle_db['bundle'].pk)
+        # The first response sets the csrf-cookie, which is part of the ETag
+        self.get(client, url)
+        response = self.get(client, url + '?group={}'.format(bundle_db['me'].pk))
+
+        assert self.get(client, url + '?group={}'.format(bundle_db['me'].pk), response).status_code == 304
+        assert self.get(client, url + '?group={}'.format(bundle_db['other'].pk), response).status_code == 200
+
+
+def test_generations_shared(tmpdir):
+    """
+    A process sees the changes of another process at once, if they share the
+    file cache.
+    """
+    first, second = (FileBasedCache(str(tmpdir), {}) for __ in range(2))
+    with patch('order.caching.cache', first):
+        generation, = caching.get_generations(caching.CATALOG)
+    with patch('order.caching.cache', second):
+        assert caching.get_generations(caching.CATALOG) == [generation]
+        caching.catalog_changed()
+    with patch('order.caching.cache', first):
+        assert caching.get_generations(caching.CATALOG) != [generation]
+
+
+def test_bump_generation():
+    generations = set()
+    for __ in range(100):
+        caching.catalog_changed()
+        generations.update(caching.get_generations(caching.CATALOG))
+
+    assert len(generations) == 100
+
+
+@pytest.mark.django_db
+class TestBumpAfterCommit:
+    """
+    The tests run in a transaction, so each bump is deferred.
+    """
+
+    def test_bump_deferred(self, bundle_db):
+        name = caching.bundle_generation_name(bundle_db['bundle'].pk)
+        bundle_db['bundle'].save()
+        # A concurrent request could cache data before the commit with this one
+        generations = caching.get_generations(name)
+
+        caching.bump_deferred()
+
+        assert caching.get_generations(name) != generations
+        generations = caching.get_generations(name)
+        caching.bump_deferred()
+        assert caching.get_generations(name) == generations
+
+    def test_middleware(self, bundle_db):
+        url = '/bundle/{}/output/'.format(bundle_db['bundle'].pk)
+        data = {'group': bundle_db['me'].pk, 'product': bundle_db['rice'].pk, 'delivered': 600}
+        name = caching.bundle_generation_name(bundle_db['bundle'].pk)
+        caching.bump_deferred()
+        generations = caching.get_generations(name)
+
+        with patch('order.caching.bump_deferred', wraps=caching.bump_deferred) as bump_deferred:
+            Client().post(url, data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        assert bump_deferred.call_count == 2
+        assert caching.get_generations(name) != generations
@@ -0,0 +1,99 @@
+import sys
+from concurrent.futures import Executor, Future
+from unittest.mock import patch
+
+import pytest
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from order.models import Bundle, Group, Order, Product, Unit
+from order.urls import get_query_budget
+
+# order.asgi needs Python 3.5
+collect_ignore = ['asgi.py'] if sys.version_info < (3, 5) else []
+
+
+@pytest.fixture
+def bundle_db():
+    db = {}
+    db['me'] = me = Group.objects.create(name='My Group')
+    db['other'] = other = Group.objects.create(name='Other Group')
+    liter = Unit.objects.create(name='Liter')
+    db['kilo'] = kilo = Unit.objects.create(name='Kilo', divisor=1000)
+    db['milk'] = milk = Product.objects.create(name='milk', price=1.53, unit=liter)
+    db['rice'] = rice = Product.objects.create(name='rice', price=0.78, unit=kilo)
+    db['bundle'] = bundle = Bundle.objects.create()
+    bundle.orders.create(group=me, product=milk, amount=3)
+    bundle.orders.create(group=me, product=rice, amount=800, delivered=500)
+    bundle.orders.create(group=other, product=milk, amount=4)
+    bundle.orders.create(group=other, product=rice, amount=1800, delivered=1500)
+    return db
+
+
+@pytest.fixture
+def seeded_bundle(bundle_db):
+    """
+    The bundle from bundle_db with 10 more groups, which order 20 more products.
+    """
+    units = [bundle_db['kilo'], Unit.objects.create(name='Stück')]
+    products = [Product.objects.create(name='product {:02}'.format(i), price=i, unit=units[i % 2])
+                for i in range(20)]
+    for i in range(10):
+        group = Group.objects.create(name='group {:02}'.format(i), enclosure=True)
+        Order.objects.bulk_create(
+            Order(group=group, product=product, bundle=bundle_db['bundle'], amount=i * j, delivered=j or None)
+            for j, product in enumerate(products))
+    from order import totals
+    totals.rebuild([bundle_db['bundle'].pk])
+    bundle_db['groups'] = Group.objects.filter(enclosure=True)
+    bundle_db['products'] = products
+    return bundle_db
+
+
+@pytest.fixture
+def query_budget(client):
+    """
+    Returns a function to request an url and to check, that the request does not
+    need more queries then the budget of the url (see order.urls.QUERY_BUDGETS).
+
+    The function returns the response.
+    """
+    def request(url_name, args=(), method='GET', data=None, **extra):
+        budget = get_query_budget(url_name, method)
+        assert budget is not None, "{} has no query budget for {}".format(url_name, method)
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method.lower())(reverse(url_name, args=args), data or {}, **extra)
+            if response.streaming:
+                response.content_bytes = b''.join(response.streaming_content)
+        assert len(queries) <= budget, "{} needs {} queries, the budget is {}:\n{}".format(
+            url_name, len(queries), budget, "\n".join(query['sql'] for query in queries))
+        return response
+    return request
+
+
+class InlineExecutor(Executor):
+    """
+    Executor, that runs the functions at once in the calling thread, so they
+    can use the test database.
+    """
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def submit(self, function, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(function(*args, **kwargs))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+
+@pytest.fixture
+def inline_executor():
+    """
+    Runs the threads of the benchmark in the test thread.
+    """
+    with patch('order.benchmark.ThreadPoolExecutor', InlineExecutor):
+        yield InlineExecutor
@@ -0,0 +1,84 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+
+from order import database
+
+
+class TestGetDatabases:
+    def test_sqlite(self):
+        databases = database.get_databases({}, '/srv/foodcoop')
+
+        assert databases['default']['ENGINE'] == 'django.db.backends.sqlite3'
+        assert databases['default']['NAME'] == '/srv/foodcoop/db.sqlite3'
+
+    def test_sqlite_path(self):
+        databases = database.get_databases({'FOODCOOP_SQLITE_PATH': '/tmp/order.sqlite3'})
+
+        assert databases['default']['NAME'] == '/tmp/order.sqlite3'
+
+    def test_postgresql(self):
+        databases = database.get_databases({'FOODCOOP_DATABASE': 'postgresql', 'FOODCOOP_DB_HOST': 'db',
+                                            'FOODCOOP_DB_CONN_MAX_AGE': '60'})
+
+        assert databases['default']['ENGINE'] == 'django.db.backends.postgresql_psycopg2'
+        assert databases['default']['NAME'] == 'foodcoop'
+        assert databases['default']['HOST'] == 'db'
+        assert databases['default']['CONN_MAX_AGE'] == 60
+        assert database.get_databases({'FOODCOOP_DATABASE': 'postgresql'})['default']['CONN_MAX_AGE'] == 600
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            database.get_databases({'FOODCOOP_DATABASE': 'oracle'})
+
+
+@pytest.mark.django_db
+def test_configure_sqlite(tmpdir):
+    wrapper = DatabaseWrapper(dict(connection.settings_dict, NAME=str(tmpdir.join('order.sqlite3'))), 'pragmas')
+    try:
+        cursor = wrapper.cursor()
+        cursor.execute('PRAGMA journal_mode')
+        assert cursor.fetchone()[0] == 'wal'
+        cursor.execute('PRAGMA busy_timeout')
+        assert cursor.fetchone()[0] == 20000
+    finally:
+        wrapper.close()
+
+
+@pytest.mark.django_db
+def test_configure_sqlite_settings(tmpdir, settings):
+    settings.ORDER_SQLITE_PRAGMAS = [('busy_timeout', 100)]
+    wrapper = DatabaseWrapper(dict(connection.settings_dict, NAME=str(tmpdir.join('order.sqlite3'))), 'pragmas')
+    try:
+        cursor = wrapper.cursor()
+        cursor.execute('PRAGMA journal_mode')
+        assert cursor.fetchone()[0] == 'delete'
+        cursor.execute('PRAGMA busy_timeout')
+        assert cursor.fetchone()[0] == 100
+    finally:
+        wrapper.close()
+
+
+class TestSupports:
+    def test_postgresql(self):
+        connection = MagicMock(vendor='postgresql', pg_version=90400)
+
+        assert not database.supports(connection, database.UPSERT_SQLITE_VERSION, database.UPSERT_POSTGRESQL_VERSION)
+        assert database.supports(connection, database.RETURNING_SQLITE_VERSION, database.RETURNING_POSTGRESQL_VERSION)
+        connection.pg_version = 90500
+        assert database.supports(connection, database.UPSERT_SQLITE_VERSION, database.UPSERT_POSTGRESQL_VERSION)
+
+    def test_sqlite(self):
+        connection = MagicMock(vendor='sqlite')
+
+        with patch('order.database.sqlite_version_info', return_value=(3, 24, 0)):
+            assert database.supports(connection, database.UPSERT_SQLITE_VERSION, database.UPSERT_POSTGRESQL_VERSION)
+            assert not database.supports(
+                connection, database.RETURNING_SQLITE_VERSION, database.RETURNING_POSTGRESQL_VERSION)
+
+    def test_other(self):
+        connection = MagicMock(vendor='mysql')
+
+        assert not database.supports(connection, database.UPSERT_SQLITE_VERSION, database.UPSERT_POSTGRESQL_VERSION)
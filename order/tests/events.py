@@ -0,0 +1,85 @@
+import json
+
+import pytest
+from django.test import Client
+
+from order import events
+
+
+class TestChannel:
+    def test_get_since(self):
+        channel = events.Channel()
+        channel.publish('a')
+        channel.publish('b')
+
+        assert channel.get_since(0) == [(1, 'a'), (2, 'b')]
+        assert channel.get_since(1) == [(2, 'b')]
+        assert channel.get_since(2) == []
+
+    def test_lost_events(self, monkeypatch):
+        monkeypatch.setattr(events, 'BUFFER_SIZE', 2)
+        channel = events.Channel()
+        for value in 'abc':
+            channel.publish(value)
+
+        assert channel.get_since(0) is None
+        assert channel.get_since(1) == [(2, 'b'), (3, 'c')]
+        # The client knows events from an older process
+        assert channel.get_since(7) is None
+
+    def test_wait_timeout(self):
+        channel = events.Channel()
+
+        assert channel.wait(0, 0) == []
+
+
+def test_stream():
+    events.publish(9999, {'cells': []})
+
+    content = ''.join(events.stream(9999, last_id=0, duration=0))
+
+    assert 'id: 1\nevent: change\ndata: {"cells": []}\n\n' in content
+
+
+@pytest.mark.django_db
+class TestBundleOutputEventsView:
+    def read(self, client, bundle, last_id):
+        response = client.get('/bundle/{}/output/events/'.format(bundle.pk), {'duration': 0},
+                              HTTP_LAST_EVENT_ID=last_id)
+        assert response['Content-Type'] == 'text/event-stream'
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_change(self, bundle_db):
+        bundle = bundle_db['bundle']
+        client = Client()
+        last_id = events.get_channel(bundle.pk).last_id
+
+        client.post('/bundle/{}/output/'.format(bundle.pk),
+                    {'group': bundle_db['me'].pk, 'product': bundle_db['rice'].pk, 'delivered': 600},
+                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        content = self.read(client, bundle, last_id)
+
+        data = json.loads(content.split('data: ')[1].split('\n')[0])
+        assert data['cells'] == [[bundle_db['me'].pk, bundle_db['rice'].pk, 600, 1]]
+        assert data['price_for_group'] == {str(bundle_db['me'].pk): "5.06"}
+        assert data['product_delivered'] == {str(bundle_db['rice'].pk): 2100}
+
+    def test_batch(self, bundle_db):
+        bundle = bundle_db['bundle']
+        client = Client()
+        last_id = events.get_channel(bundle.pk).last_id
+
+        client.post('/bundle/{}/output/batch/'.format(bundle.pk),
+                    {'group': [bundle_db['me'].pk], 'product': [bundle_db['rice'].pk], 'delivered': ['']},
+                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        content = self.read(client, bundle, last_id)
+
+        data = json.loads(content.split('data: ')[1].split('\n')[0])
+        assert data['cells'] == [[bundle_db['me'].pk, bundle_db['rice'].pk, 800, 1]]
+
+    def test_reload(self, bundle_db):
+        bundle = bundle_db['bundle']
+
+        content = self.read(Client(), bundle, events.get_channel(bundle.pk).last_id + 10)
+
+        assert 'event: reload' in content
@@ -0,0 +1,20 @@
+import pytest
+from django.core.management import call_command
+
+from order import explain
+
+
+def test_is_full_scan():
+    assert explain.is_full_scan('0 0 0 SCAN TABLE order_order', 'order_order')
+    assert not explain.is_full_scan('0 0 0 SCAN TABLE order_order_x', 'order_order')
+    assert not explain.is_full_scan('0 0 0 SEARCH TABLE order_order USING INDEX idx (bundle_id=?)', 'order_order')
+
+
+@pytest.mark.django_db
+def test_no_full_scans():
+    assert [name for name, __, full_scan in explain.full_scans() if full_scan] == []
+
+
+@pytest.mark.django_db
+def test_command():
+    call_command('explainqueries')
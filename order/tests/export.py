@@ -0,0 +1,61 @@
+from functools import partial
+from unittest.mock import patch
+
+import pytest
+from django.test import Client
+
+from order import export, pagination
+
+
+@pytest.mark.django_db
+class TestExport:
+    def test_order_rows(self, bundle_db):
+        rows = list(export.order_rows(bundle_db['bundle']))
+
+        assert rows == [
+            ["Produkt", "Menge", "Einheit", "Preis", "Gesamtpreis"],
+            ["milk", 7, "Liter", "1.53", "10.71"],
+            ["rice", 2600, "Kilo", "0.78", "2.03"],
+            ["Gesamtpreis", "", "", "", "12.74"]]
+
+    def test_order_rows_delivered(self, bundle_db):
+        rows = list(export.order_rows(bundle_db['bundle'], delivered=True))
+
+        assert rows[2] == ["rice", 2000, "Kilo", "0.78", "1.56"]
+        assert rows[-1][-1] == "12.27"
+
+    def test_output_rows(self, bundle_db):
+        rows = list(export.output_rows(bundle_db['bundle'], delivered=True))
+
+        assert rows == [
+            ["Produkt", "Einheit", "Summe", "My Group", "Other Group"],
+            ["milk", "Liter", 7, 3, 4],
+            ["rice", "Kilo", 2000, 500, 1500],
+            ["Gesamtpreis", "", "12.27", "4.98", "7.29"]]
+
+    def test_output_rows_ordered(self, bundle_db):
+        rows = list(export.output_rows(bundle_db['bundle']))
+
+        assert rows[2] == ["rice", "Kilo", 2600, 800, 1800]
+        assert rows[-1] == ["Gesamtpreis", "", "12.74", "5.21", "7.52"]
+
+    def test_rows_in_chunks(self, bundle_db):
+        bundle = bundle_db['bundle']
+        expected = list(export.order_rows(bundle)), list(export.output_rows(bundle))
+
+        with patch('order.export.keyset_rows', partial(pagination.keyset_rows, size=1)):
+            assert (list(export.order_rows(bundle)), list(export.output_rows(bundle))) == expected
+
+    def test_view(self, bundle_db):
+        bundle = bundle_db['bundle']
+        response = Client().get('/bundle/{}/output/delivered.csv'.format(bundle.pk))
+
+        assert b''.join(response.streaming_content).decode('utf-8').splitlines()[1] == 'milk,Liter,7,3,4'
+        assert response['Content-Disposition'] == 'attachment; filename="essensausgabe-{}-delivered.csv"'.format(
+            bundle.start.strftime('%Y-%m-%d'))
+
+    def test_streaming_response(self, bundle_db):
+        response = export.streaming_response(iter([["a", 1], ["b", 2]]), 'test', 'tsv')
+
+        assert b''.join(response.streaming_content) == b'a\t1\r\nb\t2\r\n'
+        assert response['Content-Disposition'] == 'attachment; filename="test.tsv"'
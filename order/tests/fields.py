@@ -0,0 +1,55 @@
+from decimal import Decimal
+
+import pytest
+
+from order import fields
+from order.forms import ProductForm
+from order.models import Product
+
+
+class TestPrices:
+    def test_to_cents(self):
+        assert fields.to_cents(Decimal('1.53')) == 153
+        assert fields.to_cents(1.53) == 153
+        assert fields.to_cents('0.005') == 1
+        assert fields.to_cents(None) is None
+
+    def test_from_cents(self):
+        assert str(fields.from_cents(300)) == '3.00'
+        assert fields.from_cents(None) is None
+
+    def test_line_price(self):
+        # 800 Gramm for 0.78 EUR per Kilo
+        assert fields.line_price(78, 1000, 800) == 624000
+        assert fields.line_price(None, 1000, 800) == 0
+        # One third of a millionth is rounded, half of it is rounded up
+        assert fields.line_price(1, 3, 1) == 3333
+        assert fields.line_price(1, 20000, 1) == 1
+
+    def test_sum_is_rounded_once(self):
+        # Each line costs 0.4 cents, which would be 0 when rounded to cents.
+        total = sum(fields.line_price(1, 1000, 400) for __ in range(10))
+
+        assert "{:.2f}".format(fields.from_micros(total)) == '0.04'
+
+
+@pytest.mark.django_db
+class TestPriceField:
+    def test_product_price(self, bundle_db):
+        product = Product.objects.get(pk=bundle_db['milk'].pk)
+
+        assert product.price_cents == 153
+        assert product.price == Decimal('1.53')
+
+    def test_form(self, bundle_db):
+        form = ProductForm(instance=bundle_db['milk'])
+
+        assert 'value="1.53"' in str(form['price_cents'])
+
+    def test_form_clean(self, bundle_db):
+        data = {'name': 'milk', 'unit': bundle_db['milk'].unit_id, 'price_cents': '1.53', 'available': 'on'}
+        form = ProductForm(data, instance=bundle_db['milk'])
+
+        assert form.is_valid()
+        assert form.cleaned_data['price_cents'] == 153
+        assert not form.has_changed()
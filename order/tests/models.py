@@ -1,23 +1,11 @@
-import pytest
-
-from order.models import Bundle, Group, Product, Unit
+from unittest.mock import call, patch
 
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-@pytest.fixture
-def bundle_db():
-    db = {}
-    db['me'] = me = Group.objects.create(name='My Group')
-    other = Group.objects.create(name='Other Group')
-    liter = Unit.objects.create(name='Liter')
-    db['kilo'] = kilo = Unit.objects.create(name='Kilo', divisor=1000)
-    milk = Product.objects.create(name='milk', price=1.53, unit=liter)
-    rice = Product.objects.create(name='rice', price=0.78, unit=kilo)
-    db['bundle'] = bundle = Bundle.objects.create()
-    bundle.orders.create(group=me, product=milk, amount=3)
-    bundle.orders.create(group=me, product=rice, amount=800, delivered=500)
-    bundle.orders.create(group=other, product=milk, amount=4)
-    bundle.orders.create(group=other, product=rice, amount=1800, delivered=1500)
-    return db
+from order import caching, totals
+from order.models import Bundle, Group, Product, Unit, next_sequence
 
 
 @pytest.mark.django_db
@@ -61,6 +49,77 @@ class TestBundle:
         bundle_db['bundle'].orders.create(group=bundle_db['me'], product=apple, amount=3)
         assert bundle_db['bundle'].has_unknown_price(bundle_db['me'])
 
+    def test_sequence(self, bundle_db):
+        bundle = bundle_db['bundle']
+        order = bundle.orders.get(group=bundle_db['me'], product=bundle_db['milk'])
+        order.amount = 5
+        order.save()
+
+        assert Bundle.objects.get(pk=bundle.pk).sequence == order.sequence == 5
+
+    def test_save_keeps_sequence(self, bundle_db):
+        """
+        The instance of the bundle was loaded before the orders were created,
+        but saving it does not reset the sequence.
+        """
+        bundle = bundle_db['bundle']
+        bundle.open = False
+        bundle.save()
+
+        assert bundle.sequence == 0
+        assert Bundle.objects.get(pk=bundle.pk).sequence == 4
+
+    def test_sequence_without_returning(self, bundle_db):
+        """
+        SQLite before 3.35 has no UPDATE ... RETURNING.
+        """
+        bundle = bundle_db['bundle']
+
+        with patch('order.database.sqlite_version_info', return_value=(3, 22, 0)):
+            assert next_sequence(bundle.pk, using='default') == 5
+            order = bundle.orders.get(group=bundle_db['me'], product=bundle_db['milk'])
+            order.save()
+
+        assert Bundle.objects.get(pk=bundle.pk).sequence == order.sequence == 6
+
+    def test_deleted_sequence(self, bundle_db):
+        bundle = bundle_db['bundle']
+        bundle.orders.get(group=bundle_db['me'], product=bundle_db['rice']).delete()
+
+        bundle = Bundle.objects.get(pk=bundle.pk)
+        assert (bundle.sequence, bundle.deleted_sequence) == (5, 5)
+
+    def test_deleted_sequence_once(self, bundle_db):
+        """
+        The orders of a deleted product are deleted while the totals are
+        paused, so the bundle is only marked once.
+        """
+        bundle = bundle_db['bundle']
+        name = caching.bundle_generation_name(bundle.pk)
+
+        with CaptureQueriesContext(connection) as queries, \
+                patch('order.caching.bump_generation', wraps=caching.bump_generation) as bump_generation:
+            bundle_db['rice'].delete()
+
+        bundle = Bundle.objects.get(pk=bundle.pk)
+        assert (bundle.sequence, bundle.deleted_sequence) == (5, 5)
+        assert len([query for query in queries.captured_queries
+                    if 'UPDATE "order_bundle" ' in query['sql']]) == 1
+        assert [args for args in bump_generation.call_args_list if args[0] == (name,)] == [call(name)]
+
+    def test_not_marked_after_error(self, bundle_db):
+        bundle = bundle_db['bundle']
+
+        with pytest.raises(ValueError):
+            with totals.paused():
+                bundle.orders.get(group=bundle_db['me'], product=bundle_db['rice']).delete()
+                raise ValueError()
+
+        assert Bundle.objects.get(pk=bundle.pk).deleted_sequence == 0
+        with totals.paused():
+            pass
+        assert Bundle.objects.get(pk=bundle.pk).deleted_sequence == 0
+
 
 @pytest.mark.django_db
 class TestUnit:
@@ -77,3 +136,29 @@ class TestUnit:
         assert str(test_unit) == 'MyTestName'
         assert test_unit.price == 'MyTestName'
         assert test_unit.order == 'OtherName'
+
+
+@pytest.mark.django_db
+class TestTotal:
+    def test_get_total(self, bundle_db):
+        total = bundle_db['bundle'].get_total(bundle_db['me'])
+
+        assert "{:.2f}".format(total.get_price()) == '5.21'
+        assert "{:.2f}".format(total.get_price(delivered=True)) == '4.98'
+        assert not total.has_unknown_price()
+
+    def test_get_total_group_without_orders(self, bundle_db):
+        group = Group.objects.create(name='New Group')
+
+        total = bundle_db['bundle'].get_total(group)
+
+        assert total.get_price() == 0
+        assert not total.has_unknown_price()
+
+    def test_unknown_price_set(self, bundle_db):
+        apple = Product.objects.create(name='apple', unit=bundle_db['kilo'])
+        bundle_db['bundle'].orders.create(group=bundle_db['me'], product=apple, amount=3)
+        apple.price = 1
+        apple.save()
+
+        assert not bundle_db['bundle'].has_unknown_price()
@@ -0,0 +1,96 @@
+from datetime import datetime
+
+import pytest
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from order import pagination
+from order.models import Bundle
+from order.views import BundleListView
+
+
+def test_cursor():
+    value = datetime(2015, 1, 2, 3, 4, 5, 678, tzinfo=timezone.utc)
+
+    assert pagination.decode_cursor(pagination.encode_cursor(value, 12)) == (value, 12)
+    assert pagination.decode_cursor('invalid') is None
+
+
+@pytest.mark.django_db
+class TestKeysetPage:
+    def test_pages(self):
+        bundles = [Bundle.objects.create() for __ in range(5)]
+        # Two bundles with the same start
+        Bundle.objects.filter(pk=bundles[3].pk).update(start=bundles[2].start)
+
+        first, cursor = pagination.keyset_page(Bundle.objects.all(), 'start', None, 2)
+        second, cursor = pagination.keyset_page(Bundle.objects.all(), 'start', cursor, 2)
+        third, cursor = pagination.keyset_page(Bundle.objects.all(), 'start', cursor, 2)
+
+        assert [bundle.pk for bundle in first + second + third] == [
+            bundles[4].pk, bundles[3].pk, bundles[2].pk, bundles[1].pk, bundles[0].pk]
+        assert cursor is None
+
+
+@pytest.mark.django_db
+class TestKeysetRows:
+    def test_chunks(self, bundle_db):
+        orders = bundle_db['bundle'].orders.all()
+        keys = ('product__name', 'product', 'group')
+        expected = list(orders.order_by(*keys).values_list('product__name', 'group', 'amount'))
+
+        for size in (1, 2, 3, 4, 1000):
+            assert list(pagination.keyset_rows(orders, keys, ('product__name', 'group', 'amount'), size)) == expected
+
+    def test_queries(self, bundle_db):
+        rows = pagination.keyset_rows(bundle_db['bundle'].orders.all(), ('product', 'group'), ('amount',), 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            assert len(list(rows)) == 4
+
+        # two full chunks and an empty one
+        assert len(queries) == 3
+
+
+@pytest.mark.django_db
+class TestBundleListView:
+    def test_annotations(self, bundle_db):
+        from order import totals
+        totals.rebuild([bundle_db['bundle'].pk])
+        Bundle.objects.create()
+
+        bundles = list(BundleListView(kwargs={}).get_queryset().order_by('-start', '-pk'))
+
+        assert [(bundle.group_count, bundle.product_count) for bundle in bundles] == [(0, 0), (2, 2)]
+        assert bundles[0].ordered_total is None
+        assert bundles[1].ordered_total == 12738000
+
+    def test_annotations_without_ordered_amount(self, bundle_db):
+        """
+        Totals, whose ordered amount went back to 0, are not counted.
+        """
+        bundle = bundle_db['bundle']
+        for order in bundle.orders.filter(group=bundle_db['me']):
+            order.amount = 0
+            order.save()
+        order = bundle.orders.get(group=bundle_db['other'], product=bundle_db['rice'])
+        order.amount = 0
+        order.save()
+
+        bundle = BundleListView(kwargs={}).get_queryset().get(pk=bundle.pk)
+
+        assert (bundle.group_count, bundle.product_count) == (1, 1)
+
+    def test_next_page(self, bundle_db, monkeypatch):
+        monkeypatch.setattr(BundleListView, 'page_size', 1)
+        Bundle.objects.create()
+
+        response = Client().get('/')
+
+        assert len(response.context['bundle_list']) == 1
+        assert response.context['next_cursor'] is not None
+        response = Client().get('/', {'before': response.context['next_cursor']})
+        assert response.context['bundle_list'] == [bundle_db['bundle']]
+        assert response.context['next_cursor'] is None
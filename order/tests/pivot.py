@@ -0,0 +1,29 @@
+import pytest
+
+from order.models import Group, Product
+from order.pivot import OutputTable
+
+
+@pytest.mark.django_db
+class TestOutputTable:
+    def test_missing_cells(self, bundle_db):
+        apple = Product.objects.create(name='apple', price=1, unit=bundle_db['kilo'])
+        bundle_db['bundle'].orders.create(group=bundle_db['me'], product=apple, amount=2000)
+
+        table = OutputTable(bundle_db['bundle'])
+
+        assert table.products == [apple, bundle_db['milk'], bundle_db['rice']]
+        assert table.amounts[table.product_index[apple.pk]] == [2000, None]
+        assert table.delivered[table.product_index[apple.pk]] == [2000, None]
+        assert table.product_delivered == [2000, 7, 2000]
+
+    def test_products_without_amount(self, bundle_db):
+        apple = Product.objects.create(name='apple', price=1, unit=bundle_db['kilo'])
+        group = Group.objects.create(name='Third Group')
+        bundle_db['bundle'].orders.create(group=group, product=apple, amount=0, delivered=1000)
+
+        table = OutputTable(bundle_db['bundle'])
+
+        assert apple not in table.products
+        assert table.groups == [bundle_db['me'], bundle_db['other'], group]
+        assert table.group_prices[table.group_index[group.pk]] == 1
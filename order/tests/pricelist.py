@@ -0,0 +1,96 @@
+import io
+import time
+from decimal import Decimal
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client
+
+from order import pricelist
+from order.models import Product, Unit
+
+
+def lines(text):
+    return io.StringIO(text)
+
+
+class TestReadRows:
+    def test_rows(self):
+        rows = list(pricelist.read_rows(lines("Produkt;Einheit;Preis;Verfügbar\nmilk;Liter;1,53;ja\nrice;Kilo;;0\n")))
+
+        assert rows == [(2, 'milk', 'Liter', Decimal('1.53'), True), (3, 'rice', 'Kilo', None, False)]
+
+    def test_errors(self):
+        rows = list(pricelist.read_rows(lines("name,unit,price\nmilk,Liter,abc\n,Kilo,1\n")))
+
+        assert rows == [(2, "Invalid price: abc"), (3, "Name and unit are required")]
+
+    def test_missing_column(self):
+        with pytest.raises(pricelist.PriceListError):
+            list(pricelist.read_rows(lines("name,price\nmilk,1\n")))
+
+
+@pytest.mark.django_db
+class TestImport:
+    def test_report(self, bundle_db):
+        Product.objects.create(name='bread', price=2, unit=bundle_db['kilo'])
+
+        report = pricelist.import_price_list(lines(
+            "name,unit,price,available\nmilk,Liter,2.00,1\nrice,Kilo,0.78,1\noat,Gramm,3,1\noat,Gramm,4,1\n"))
+
+        assert report.new == ['oat']
+        assert report.changed == ['milk']
+        assert report.unchanged == ['rice']
+        assert report.vanished == ['bread']
+        assert report.errors == [(5, "Duplicate product: oat")]
+        assert Unit.objects.get(name='Gramm').product_set.get().price == Decimal('3.00')
+        assert Product.objects.get(name='bread').available
+        # The totals use the new price
+        assert bundle_db['bundle'].price_for_all() == Decimal('16.028')
+
+    def test_disable_vanished(self, bundle_db):
+        pricelist.import_price_list(lines("name,unit,price\nmilk,Liter,1.53\n"), disable_vanished=True)
+
+        assert not Product.objects.get(name='rice').available
+
+    def test_dry_run(self, bundle_db):
+        report = pricelist.import_price_list(lines("name,unit,price\nmilk,Liter,2\n"), dry_run=True)
+
+        assert report.changed == ['milk']
+        assert Product.objects.get(name='milk').price == Decimal('1.53')
+
+    def test_large_file(self, bundle_db):
+        text = "name,unit,price\n" + "".join(
+            "product {},Unit {},{}.{:02}\n".format(i, i % 7, i % 50, i % 100) for i in range(10000))
+        start = time.time()
+
+        report = pricelist.import_price_list(lines(text))
+
+        assert len(report.new) == 10000
+        assert time.time() - start < 10
+        assert Product.objects.get(name='product 1234').price == Decimal('34.34')
+
+    def test_command(self, bundle_db, tmpdir):
+        path = tmpdir.join('prices.csv')
+        path.write_text("name;unit;price\nmilk;Liter;2\n", encoding='utf-8')
+
+        call_command('importprices', str(path), disable_vanished=True)
+
+        assert Product.objects.get(name='milk').price == Decimal('2.00')
+        assert not Product.objects.get(name='rice').available
+
+    def test_view(self, bundle_db):
+        upload = SimpleUploadedFile('prices.csv', "name,unit,price\nmilk,Liter,2\n".encode('utf-8'))
+
+        response = Client().post('/product/import/', {'file': upload})
+
+        assert response.status_code == 200
+        assert response.context['report'].changed == ['milk']
+
+    def test_view_invalid_file(self, bundle_db):
+        upload = SimpleUploadedFile('prices.csv', b"name,price\nmilk,2\n")
+
+        response = Client().post('/product/import/', {'file': upload})
+
+        assert response.context['form'].errors['file']
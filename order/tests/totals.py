@@ -0,0 +1,97 @@
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.utils.six import StringIO
+
+from order import totals
+from order.models import BundleTotal, GroupTotal, Product
+
+
+@pytest.mark.django_db
+class TestTotals:
+    def test_order_changed(self, bundle_db):
+        order = bundle_db['bundle'].orders.get(group=bundle_db['me'], product=bundle_db['rice'])
+        order.amount = 1000
+        order.delivered = None
+        order.save()
+
+        total = GroupTotal.objects.get(bundle=bundle_db['bundle'], group=bundle_db['me'])
+        assert total.price == total.price_delivered == 5370000
+        assert bundle_db['bundle'].delivered_for_product(bundle_db['rice']) == 2500
+        assert totals.compare([bundle_db['bundle'].pk]) == []
+
+    def test_stale_order_saved(self, bundle_db):
+        """
+        Two requests change the same order. The second one subtracts the values
+        of the first one and not the values it has read.
+        """
+        orders = bundle_db['bundle'].orders.filter(group=bundle_db['me'], product=bundle_db['rice'])
+        first, second = orders.get(), orders.get()
+        first.amount = 1000
+        first.save()
+        second.amount = 1200
+        second.save()
+
+        assert (orders.get().amount, orders.get().version) == (1200, 2)
+        assert totals.compare([bundle_db['bundle'].pk]) == []
+
+    def test_instances_without_state(self, bundle_db):
+        order = bundle_db['bundle'].orders.get(group=bundle_db['me'], product=bundle_db['rice'])
+        rice = Product.objects.get(pk=bundle_db['rice'].pk)
+
+        assert order.saved_state is rice.saved_price is rice.unit.saved_divisor is None
+
+    def test_order_deleted(self, bundle_db):
+        bundle_db['bundle'].orders.get(group=bundle_db['me'], product=bundle_db['milk']).delete()
+
+        assert bundle_db['bundle'].price_for_all() == Decimal('8.148')
+        assert totals.compare([bundle_db['bundle'].pk]) == []
+
+    def test_product_price_changed(self, bundle_db):
+        rice = Product.objects.get(pk=bundle_db['rice'].pk)
+        rice.price = 1
+        rice.save()
+
+        assert bundle_db['bundle'].price_for_all() == Decimal('13.31')
+
+    def test_stale_product_saved(self, bundle_db):
+        """
+        The price is compared with the saved price and not with the price of
+        the instance, when it was loaded.
+        """
+        rice, stale = Product.objects.get(pk=bundle_db['rice'].pk), Product.objects.get(pk=bundle_db['rice'].pk)
+        rice.price = 1
+        rice.save()
+        stale.save()
+
+        assert totals.compare([bundle_db['bundle'].pk]) == []
+
+    def test_unit_divisor_changed(self, bundle_db):
+        bundle_db['kilo'].divisor = 100
+        bundle_db['kilo'].save()
+
+        assert bundle_db['bundle'].price_for_group(bundle_db['me']) == Decimal('10.83')
+
+    def test_group_deleted(self, bundle_db):
+        bundle_db['other'].delete()
+
+        assert bundle_db['bundle'].price_for_all() == Decimal('5.214')
+        assert bundle_db['bundle'].delivered_for_product(bundle_db['milk']) == 3
+
+    def test_compare_and_rebuild(self, bundle_db):
+        BundleTotal.objects.filter(bundle=bundle_db['bundle']).update(price=1)
+
+        assert totals.compare([bundle_db['bundle'].pk]) == [
+            (BundleTotal, (bundle_db['bundle'].pk,), 'price', 1, 12738000)]
+        totals.rebuild([bundle_db['bundle'].pk])
+        assert totals.compare([bundle_db['bundle'].pk]) == []
+
+    def test_checktotals_command(self, bundle_db):
+        GroupTotal.objects.filter(bundle=bundle_db['bundle']).delete()
+        out = StringIO()
+
+        call_command('checktotals', fix=True, stdout=out)
+
+        assert "GroupTotal" in out.getvalue()
+        assert totals.compare([bundle_db['bundle'].pk]) == []
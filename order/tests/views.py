@@ -1,11 +1,12 @@
 import json
+from decimal import Decimal
 from unittest.mock import MagicMock, patch
 
 import pytest
 from django.core.exceptions import PermissionDenied
 
-from order import views
-from order.models import Product
+from order import caching, views, writes
+from order.models import Group, Product
 
 
 class TestBundleDetailView:
@@ -22,18 +23,60 @@ class TestBundleDetailView:
 
     def test_get_active_group_session(self, rf):
         """
-        Test with group data in session.
+        Test with group data of an older version in session.
         """
         request = rf.get('/')
-        request.session = MagicMock()
-        request.session.get.return_value = 1
+        request.session = {'active_group': 1}
         view = views.BundleDetailView()
 
         with patch('order.models.Group.objects') as group_manager:
-            group_manager.get.return_value = 'My test group'
+            group_manager.get.return_value = group = Group(pk=1, name='My test group')
 
-            assert view.get_active_group(request) == 'My test group'
+            assert view.get_active_group(request) == group
             group_manager.get.assert_called_once_with(pk=1)
+        assert request.session['active_group']['name'] == 'My test group'
+
+    def test_get_active_group_session_cached(self, rf):
+        """
+        Test that the group is not loaded, as long as the catalog is the same.
+        """
+        request = rf.get('/')
+        request.session = {}
+        view = views.BundleDetailView()
+        view.save_session_group(request, Group(pk=1, name='My test group', enclosure=True))
+
+        with patch('order.models.Group.objects') as group_manager:
+            active_group = view.get_active_group(request)
+
+            assert not group_manager.get.called
+        assert (active_group.pk, active_group.name, active_group.enclosure) == (1, 'My test group', True)
+
+    def test_get_active_group_session_catalog_changed(self, rf):
+        """
+        Test that the group is loaded again after a change of the catalog.
+        """
+        request = rf.get('/')
+        request.session = {}
+        view = views.BundleDetailView()
+        view.save_session_group(request, Group(pk=1, name='Old name'))
+        caching.catalog_changed()
+
+        with patch('order.models.Group.objects') as group_manager:
+            group_manager.get.return_value = Group(pk=1, name='New name')
+
+            assert view.get_active_group(request).name == 'New name'
+        assert request.session['active_group']['name'] == 'New name'
+
+    def test_get_active_group_session_deleted(self, rf):
+        request = rf.get('/')
+        request.session = {'active_group': 1}
+        view = views.BundleDetailView()
+
+        with patch('order.models.Group.objects') as group_manager:
+            group_manager.get.side_effect = Group.DoesNotExist
+
+            assert view.get_active_group(request) is None
+        assert 'active_group' not in request.session
 
     def test_get_active_group_GET(self, rf):
         """
@@ -53,15 +96,14 @@ class TestBundleDetailView:
             assert view.get_active_group(request) == group_mock
             # TODO: test 99 in session
 
-    @patch('order.models.Order.objects')
+    @patch('order.views.writes.upsert_order')
     @patch('order.models.Product.objects')
-    def test_ajax(self, product_manager, order_manager, rf):
+    def test_ajax(self, product_manager, upsert_order, rf):
         """
         Test to send order data via ajax
         """
-        order_mock = MagicMock()
-        order_manager.get_or_create.return_value = (order_mock, None)
-        product_manager.get.return_value = 'My test product'
+        upsert_order.return_value = 1
+        product_manager.get.return_value = product = MagicMock(pk=1)
         request = rf.post('/?group=1', {'product': 1, 'amount': 300})
         view = views.BundleDetailView()
         view.object = bundle_mock = MagicMock()
@@ -72,10 +114,7 @@ class TestBundleDetailView:
 
         assert response.status_code == 200
         assert json.loads(response.content.decode('utf-8')) == {'price_for_group': '666.67'}
-        assert order_mock.amount == 300
-        order_mock.save.assert_called_with()
-        order_manager.get_or_create.assert_called_with(
-            product='My test product', bundle=bundle_mock, group=group_mock)
+        upsert_order.assert_called_with(bundle_mock.pk, group_mock.pk, product, writes.AMOUNT, 300)
 
     @patch('order.models.Product.objects')
     def test_ajax_no_product(self, product_manager, rf):
@@ -104,29 +143,60 @@ class TestBundleDetailView:
         assert response.status_code == 200
         assert json.loads(response.content.decode('utf-8')) == {'error': 'no product data in request'}
 
+    @pytest.mark.parametrize('data, error', [
+        ({'product': 1}, "no amount data in request"),
+        ({'product': 1, 'amount': 'abc'}, "amount has to be an integer"),
+        ({'product': 1, 'amount': -1}, "amount has to be positive"),
+    ])
+    @patch('order.views.writes.upsert_order')
+    @patch('order.models.Product.objects')
+    def test_ajax_wrong_amount(self, product_manager, upsert_order, data, error, rf):
+        view = views.BundleDetailView()
+        view.active_group = MagicMock()
+
+        response = view.ajax(rf.post('/', data))
+
+        assert response.status_code == 200
+        assert json.loads(response.content.decode('utf-8')) == {'error': error}
+        assert not upsert_order.called
+
+    @patch('order.views.writes.upsert_order')
+    @patch('order.models.Product.objects')
+    def test_ajax_no_group(self, product_manager, upsert_order, rf):
+        view = views.BundleDetailView()
+        view.active_group = None
+
+        response = view.ajax(rf.post('/', {'product': 1, 'amount': 300}))
+
+        assert json.loads(response.content.decode('utf-8')) == {'error': "no active group"}
+        assert not upsert_order.called
+
+    @pytest.mark.django_db
     def test_get(self, rf):
         """
         Test the normal get method.
         """
         view = views.BundleDetailView()
         view.request = request = rf.get('/')
+        view.kwargs = {'pk': 1}
         request.session = MagicMock()
         request.session.get.return_value = False
-        bundle_mock = MagicMock()
-        bundle_mock.price_for_group.return_value = 333.333
+        bundle_mock = MagicMock(archived=False)
+        bundle_mock.get_total().get_price.return_value = 333.333
         view.get_object = MagicMock(return_value=bundle_mock)
 
         response = view.get(request)
 
         assert response.status_code == 200
 
+    @pytest.mark.django_db
     def test_post(self, rf):
         view = views.BundleDetailView()
         view.request = request = rf.post('/', {})
         request.session = MagicMock()
         request.session.get.return_value = False
-        bundle_mock = MagicMock()
-        bundle_mock.price_for_group.return_value = 333.333
+        bundle_mock = MagicMock(archived=False)
+        bundle_mock.get_total().get_price.return_value = 333.333
         view.get_object = MagicMock(return_value=bundle_mock)
 
         response = view.post(request)
@@ -153,10 +223,11 @@ class TestBundleOrderView:
         order3.product = product2
         order1.amount, order2.amount, order3.amount = (1, 2, 4)
         product1.name, product2.name = ('zzz', 'aaa')
-        product1.multiplier, product2.multiplier = (2, 4)
+        product1.get_line_price.side_effect = lambda amount: amount * 2000000
+        product2.get_line_price.side_effect = lambda amount: amount * 4000000
         view = views.BundleOrderView()
         view.request = rf.get('/')
-        view.object = MagicMock()
+        view.object = MagicMock(archived=False)
         view.object.orders.all().select_related.return_value = [order1, order2, order3]
 
         products = view.get_products()
@@ -169,23 +240,23 @@ class TestBundleOrderView:
 
 
 class TestBundleOutputView:
+    @patch('order.views.events')
     @patch('order.models.Group.objects')
-    @patch('order.models.Order.objects')
+    @patch('order.views.writes.upsert_order')
     @patch('order.models.Product.objects')
-    def test_ajax(self, product_manager, order_manager, group_manager, rf):
+    def test_ajax(self, product_manager, upsert_order, group_manager, events, rf):
         """
         Test to send order data via ajax
         """
-        order_mock = MagicMock()
-        product_manager.get.return_value = 'My test product'
-        group_manager.get.return_value = 'My test group'
-        order_manager.get_or_create.return_value = (order_mock, None)
-        order_manager.filter().aggregate.return_value = {'delivered': 999}
+        upsert_order.return_value = 4
+        product_manager.select_related().get.return_value = product = MagicMock(pk=1)
+        group_manager.get.return_value = group = MagicMock(pk=2)
         request = rf.post('/', {'product': 1, 'group': 1, 'delivered': 300})
         view = views.BundleOutputView()
         view.object = MagicMock()
         view.object.price_for_group.return_value = 500
         view.object.price_for_all.return_value = 1000
+        view.object.delivered_for_product.return_value = 999
 
         response = view.ajax(request)
 
@@ -193,18 +264,17 @@ class TestBundleOutputView:
         assert json.loads(response.content.decode('utf-8')) == {
             'price_for_group': '500.00',
             'price_for_all': '1000.00',
-            'product_delivered': 999}
-        assert order_mock.delivered == '300'
-        order_mock.save.assert_called_with()
-        order_manager.get_or_create.assert_called_with(
-            product='My test product', bundle=view.object, group='My test group')
+            'product_delivered': 999,
+            'version': 4}
+        upsert_order.assert_called_with(view.object.pk, group.pk, product, writes.DELIVERED, 300)
+        assert events.publish.call_args[0][1]['cells'] == [[2, 1, 300, 4]]
 
     @patch('order.models.Product.objects')
     def test_ajax_no_product(self, product_manager, rf):
         """
         Test to send order data via ajax, unkonwn product.
         """
-        product_manager.get.side_effect = Product.DoesNotExist('Product does not exist')
+        product_manager.select_related().get.side_effect = Product.DoesNotExist('Product does not exist')
         view = views.BundleOutputView()
         request = rf.post('/', {'product': 1, 'group': 1, 'delivered': 300})
 
@@ -225,37 +295,146 @@ class TestBundleOutputView:
         assert response.status_code == 200
         assert json.loads(response.content.decode('utf-8')) == {'error': 'No product or group data in request'}
 
-    def test_get_context_data(self, rf):
-        product = [MagicMock(name='p0'), MagicMock(name='p1'), MagicMock(name='p2')]
-        order = [MagicMock(name='o0'), MagicMock(name='o1'), MagicMock(name='o2')]
-        # Group1 orders product0 and 1
-        # Group2 orders product0
-        # Noone orders product2
-        order[0].group = order[1].group = 'Group1'
-        order[2].group = 'Group2'
-        order[0].product = order[2].product = product[0]
-        order[1].product = product[1]
-        for i in range(3):
-            order[i].get_delivered.return_value = (i + 1) * 2
-            order[i].amount = (i + 1) * 2
-            order[i].product.multiplier = 1
-            product[i].name = 'product%d' % i
-
+    @pytest.mark.django_db
+    def test_get_context_data(self, bundle_db):
         view = views.BundleOutputView()
-        view.object = MagicMock()
-        view.object.orders.all().select_related.return_value = order
+        view.object = bundle_db['bundle']
 
         context = view.get_context_data()
 
-        assert context == {
-            'groups': {'Group1': [{product[1]: order[1],
-                                   product[0]: order[0]},
-                                  6],
-                       'Group2': [{product[0]: order[2]},
-                                  6]},
-            'object': view.object,
-            'price_for_all': 12,
-            'products': [product[0], product[1]],
-            'view': view}
-        assert context['products'][0].delivered == 8
-        assert context['products'][1].delivered == 4
+        me, other, milk, rice = (bundle_db[key] for key in ('me', 'other', 'milk', 'rice'))
+        assert [(group, "{:.2f}".format(price)) for group, price in context['columns']] == [
+            (me, '4.98'), (other, '7.29')]
+        assert context['rows'] == [
+            (milk, 7, [(me.pk, 3, 3, 0), (other.pk, 4, 4, 0)]),
+            (rice, 2000, [(me.pk, 800, 500, 0), (other.pk, 1800, 1500, 0)])]
+        assert "{:.2f}".format(context['price_for_all']) == '12.27'
+        assert not context['price_unknown']
+
+
+@pytest.mark.django_db
+class TestBundleDetailViewBatch:
+    def post_batch(self, rf, bundle_db, data):
+        request = rf.post('/', data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.session = {'active_group': bundle_db['me'].pk}
+        response = views.BundleDetailView.as_view(batch=True)(request, pk=bundle_db['bundle'].pk)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_ajax_batch(self, rf, bundle_db):
+        apple = Product.objects.create(name='apple', price=2, unit=bundle_db['kilo'])
+        data = {'product': [bundle_db['milk'].pk, bundle_db['rice'].pk, apple.pk],
+                'amount': [1, 1000, 500]}
+
+        response = self.post_batch(rf, bundle_db, data)
+
+        assert response == {'price_for_group': '3.31'}
+        orders = bundle_db['bundle'].orders.filter(group=bundle_db['me'])
+        assert dict(orders.values_list('product__name', 'amount')) == {'milk': 1, 'rice': 1000, 'apple': 500}
+
+    def test_ajax_batch_unknown_product(self, rf, bundle_db):
+        data = {'product': [bundle_db['milk'].pk, 999], 'amount': [1, 1]}
+
+        response = self.post_batch(rf, bundle_db, data)
+
+        assert response == {'error': 'product 999 not found'}
+        assert bundle_db['bundle'].orders.get(group=bundle_db['me'], product=bundle_db['milk']).amount == 3
+
+    def test_ajax_batch_wrong_data(self, rf, bundle_db):
+        response = self.post_batch(rf, bundle_db, {'product': [1, 2], 'amount': [1]})
+
+        assert response == {'error': 'no product data in request'}
+
+
+@pytest.mark.django_db
+class TestBundleOutputViewBatch:
+    def post_batch(self, rf, bundle_db, data):
+        request = rf.post('/', data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        response = views.BundleOutputView.as_view(batch=True)(request, pk=bundle_db['bundle'].pk)
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_ajax_batch(self, rf, bundle_db):
+        me, other, milk, rice = (bundle_db[key] for key in ('me', 'other', 'milk', 'rice'))
+        data = {'group': [me.pk, me.pk, other.pk],
+                'product': [milk.pk, rice.pk, rice.pk],
+                'delivered': [2, '', 1000]}
+
+        response = self.post_batch(rf, bundle_db, data)
+
+        assert response == {
+            'price_for_group': {str(me.pk): '3.68', str(other.pk): '6.90'},
+            'product_delivered': {str(milk.pk): 6, str(rice.pk): 1800},
+            'price_for_all': '10.58'}
+        assert bundle_db['bundle'].orders.get(group=me, product=rice).delivered is None
+
+    def test_ajax_batch_unknown_group(self, rf, bundle_db):
+        data = {'group': [999], 'product': [bundle_db['milk'].pk], 'delivered': [2]}
+
+        response = self.post_batch(rf, bundle_db, data)
+
+        assert response == {'error': 'Group or product not found'}
+
+    def test_ajax_batch_wrong_data(self, rf, bundle_db):
+        response = self.post_batch(rf, bundle_db, {'group': [1], 'product': [1]})
+
+        assert response == {'error': 'No product or group data in request'}
+
+
+@pytest.mark.django_db
+class TestProductBulkEditView:
+    def row(self, product, **values):
+        data = {'name': product.name, 'unit': product.unit_id, 'price_cents': product.price, 'available': 'on'}
+        data.update(values)
+        prefix = 'p{}'.format(product.pk)
+        return dict(('{}-{}'.format(prefix, key), value) for key, value in data.items()), prefix
+
+    def post(self, client, *rows, **data):
+        data.setdefault('rows', [])
+        for values, prefix in rows:
+            data.update(values)
+            data['rows'].append(prefix)
+        return client.post('/product/edit/', data)
+
+    def test_filter(self, client, bundle_db):
+        response = client.get('/product/edit/', {'name': 'ric'})
+
+        assert list(response.context['object_list']) == [bundle_db['rice']]
+        assert len(response.context['rows']) == 1 + views.ProductBulkEditView.extra
+
+    def test_update_price(self, client, bundle_db):
+        response = self.post(client, self.row(bundle_db['milk'], price_cents='2.00'))
+
+        assert response.status_code == 302
+        assert Product.objects.get(pk=bundle_db['milk'].pk).price == Decimal('2.00')
+        assert bundle_db['bundle'].price_for_all() == Decimal('16.028')
+
+    def test_only_listed_rows(self, client, bundle_db):
+        values, __ = self.row(bundle_db['milk'], price_cents='2.00')
+
+        self.post(client, **values)
+
+        assert Product.objects.get(pk=bundle_db['milk'].pk).price == Decimal('1.53')
+
+    def test_create_and_delete(self, client, bundle_db):
+        data = {'new0-name': 'bread', 'new0-unit': bundle_db['kilo'].pk, 'new0-price_cents': '3.10',
+                'p{}-delete'.format(bundle_db['milk'].pk): 'on'}
+        __, milk = self.row(bundle_db['milk'])
+
+        response = self.post(client, rows=['new0', milk], **data)
+
+        assert response.status_code == 302
+        assert sorted(Product.objects.values_list('name', flat=True)) == ['bread', 'rice']
+        assert bundle_db['bundle'].price_for_all() == Decimal('2.028')
+
+    def test_duplicate_names(self, client, bundle_db):
+        response = self.post(client, self.row(bundle_db['milk'], name='bread'),
+                             self.row(bundle_db['rice'], name='bread'))
+
+        assert response.status_code == 200
+        assert response.context['error']
+        assert sorted(Product.objects.values_list('name', flat=True)) == ['milk', 'rice']
+
+    def test_invalid(self, client, bundle_db):
+        response = self.post(client, self.row(bundle_db['milk'], price_cents='abc'))
+
+        assert response.status_code == 200
+        assert response.context['rows'][0].errors
@@ -0,0 +1,290 @@
+import json
+import threading
+import time
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from order import writes
+from order.models import Order, Product
+from order.totals import compare
+
+
+@pytest.mark.django_db
+class TestWriteBuffer:
+    def test_merge(self, bundle_db):
+        buffer = writes.WriteBuffer(delay=0.01)
+        bundle, me, milk = bundle_db['bundle'].pk, bundle_db['me'].pk, bundle_db['milk'].pk
+        buffer.add(bundle, me, writes.AMOUNT, milk, 5)
+        batch = buffer.add(bundle, me, writes.AMOUNT, milk, 7)
+
+        assert buffer.size == 1
+        assert buffer.commit(batch)
+        assert Order.objects.get(bundle=bundle, group=me, product=milk).amount == 7
+        assert buffer.pending == {}
+
+    def test_delivered_and_new_orders(self, bundle_db):
+        buffer = writes.WriteBuffer(delay=0.01)
+        bundle, other = bundle_db['bundle'], bundle_db['other']
+        apple = Product.objects.create(name='apple', price=2, unit=bundle_db['kilo'])
+        buffer.add(bundle.pk, other.pk, writes.DELIVERED, bundle_db['milk'].pk, 2)
+        batch = buffer.add(bundle.pk, other.pk, writes.DELIVERED, apple.pk, 500)
+
+        assert buffer.commit(batch)
+        assert dict(bundle.orders.filter(group=other).values_list('product__name', 'delivered')) == {
+            'milk': 2, 'rice': 1500, 'apple': 500}
+        # One sequence for all orders of the batch
+        assert dict(bundle.orders.filter(sequence__gt=4).values_list('product__name', 'sequence')) == {
+            'milk': 5, 'apple': 5}
+        assert bundle.price_for_group(other, delivered=True) == Decimal('5.23')
+
+    def test_save_pending_queries(self, bundle_db):
+        """
+        A batch needs the same number of queries for one and for many orders.
+        """
+        bundle, me, other = bundle_db['bundle'], bundle_db['me'], bundle_db['other']
+        milk, rice = bundle_db['milk'], bundle_db['rice']
+        apple = Product.objects.create(name='apple', price=2, unit=bundle_db['kilo'])
+        pending = {
+            (bundle.pk, me.pk, writes.AMOUNT): {milk.pk: 5, rice.pk: 900, apple.pk: 300},
+            (bundle.pk, me.pk, writes.DELIVERED): {rice.pk: None, apple.pk: 200},
+            (bundle.pk, other.pk, writes.DELIVERED): {milk.pk: 2, rice.pk: 1500},
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            writes.save_pending(pending)
+
+        updates = [query['sql'] for query in queries.captured_queries if 'UPDATE "order_order"' in query['sql']]
+        assert len(updates) == 1, updates
+        assert dict(((group, product), (amount, delivered, version)) for group, product, amount, delivered, version
+                    in bundle.orders.values_list('group', 'product__name', 'amount', 'delivered', 'version')) == {
+            (me.pk, 'milk'): (5, None, 1), (me.pk, 'rice'): (900, None, 1), (me.pk, 'apple'): (300, 200, 0),
+            (other.pk, 'milk'): (4, 2, 1), (other.pk, 'rice'): (1800, 1500, 0)}
+        assert set(bundle.orders.exclude(group=other, product=rice).values_list('sequence', flat=True)) == {5}
+        assert compare([bundle.pk]) == []
+
+    def test_update_in_chunks(self, bundle_db):
+        bundle, me, other = bundle_db['bundle'], bundle_db['me'], bundle_db['other']
+        cells = dict(((group.pk, product.pk), {writes.DELIVERED: 100})
+                     for group in (me, other) for product in (bundle_db['milk'], bundle_db['rice']))
+
+        with patch('order.writes.UPDATE_CHUNK_SIZE', 3):
+            assert len(writes.save_cells(bundle.pk, cells, Product.objects.select_related('unit').in_bulk(
+                [bundle_db['milk'].pk, bundle_db['rice'].pk]))) == 4
+
+        assert set(bundle.orders.values_list('delivered', 'version', 'sequence')) == {(100, 1, 5)}
+        assert compare([bundle.pk]) == []
+
+    def test_max_size(self, bundle_db):
+        buffer = writes.WriteBuffer(delay=60, max_size=2)
+        bundle, me = bundle_db['bundle'].pk, bundle_db['me'].pk
+        buffer.add(bundle, me, writes.AMOUNT, bundle_db['milk'].pk, 1)
+        batch = buffer.add(bundle, me, writes.AMOUNT, bundle_db['rice'].pk, 1)
+
+        start = time.time()
+        assert buffer.commit(batch)
+        assert time.time() - start < 10
+
+    def test_one_transaction_for_concurrent_writes(self):
+        buffer = writes.WriteBuffer(delay=0.5)
+        results = []
+
+        def write(product):
+            results.append(buffer.write(1, 1, writes.AMOUNT, product, product * 10))
+
+        with patch('order.writes.save_pending') as save_pending:
+            threads = [threading.Thread(target=write, args=(product,)) for product in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert results == [True] * 5
+        save_pending.assert_called_once_with({(1, 1, writes.AMOUNT): {0: 0, 1: 10, 2: 20, 3: 30, 4: 40}})
+
+    def test_failed(self):
+        buffer = writes.WriteBuffer(delay=0.01)
+
+        with patch('order.writes.save_pending', side_effect=ValueError):
+            assert not buffer.write(1, 1, writes.AMOUNT, 1, 1)
+        with patch('order.writes.save_pending'):
+            assert buffer.write(1, 1, writes.AMOUNT, 1, 1)
+
+
+@pytest.mark.django_db
+class TestUpsertOrder:
+    @pytest.fixture(autouse=True, params=[(3, 24, 0), (3, 22, 0)], ids=['upsert', 'orm'])
+    def sqlite_version(self, request):
+        """
+        Runs each test with INSERT ... ON CONFLICT and with the ORM.
+        """
+        with patch('order.database.sqlite_version_info', return_value=request.param):
+            yield request.param
+
+    def test_create(self, bundle_db):
+        bundle, apple = bundle_db['bundle'], Product.objects.create(name='apple', price=2, unit=bundle_db['kilo'])
+
+        version = writes.upsert_order(bundle.pk, bundle_db['me'].pk, apple, writes.DELIVERED, 500)
+
+        order = bundle.orders.get(group=bundle_db['me'], product=apple)
+        assert (version, order.version, order.amount, order.delivered) == (0, 0, 0, 500)
+        assert compare([bundle.pk]) == []
+
+    def test_update_one_field(self, bundle_db):
+        bundle, me, rice = bundle_db['bundle'], bundle_db['me'], bundle_db['rice']
+
+        assert writes.upsert_order(bundle.pk, me.pk, rice, writes.AMOUNT, 900) == 1
+        assert writes.upsert_order(bundle.pk, me.pk, rice, writes.DELIVERED, 700, version=1) == 2
+
+        order = bundle.orders.get(group=me, product=rice)
+        assert (order.amount, order.delivered, order.version, order.sequence) == (900, 700, 2, 6)
+        assert compare([bundle.pk]) == []
+
+    def test_conflict(self, bundle_db):
+        bundle, me, rice = bundle_db['bundle'], bundle_db['me'], bundle_db['rice']
+        order = bundle.orders.get(group=me, product=rice)
+        order.delivered = 600
+        order.save()
+
+        with pytest.raises(writes.Conflict) as conflict:
+            writes.upsert_order(bundle.pk, me.pk, rice, writes.DELIVERED, 700, version=0)
+
+        assert (conflict.value.value, conflict.value.version) == (600, 1)
+        assert bundle.orders.get(group=me, product=rice).delivered == 600
+
+    def test_changed_while_saved(self, bundle_db):
+        """
+        The order is changed by someone else after it was read, so it is read
+        again and the totals are still right.
+        """
+        bundle, me, rice = bundle_db['bundle'], bundle_db['me'], bundle_db['rice']
+        insert_or_update = writes.insert_or_update
+        calls = []
+
+        def changed_insert_or_update(*args):
+            if not calls:
+                order = bundle.orders.get(group=me, product=rice)
+                order.amount = 1000
+                order.save()
+            calls.append(args[4])
+            return insert_or_update(*args)
+
+        with patch('order.writes.insert_or_update', changed_insert_or_update):
+            version = writes.upsert_order(bundle.pk, me.pk, rice, writes.DELIVERED, 700)
+
+        order = bundle.orders.get(group=me, product=rice)
+        assert (version, order.amount, order.delivered) == (2, 1000, 700)
+        assert calls == [writes.DELIVERED, writes.DELIVERED]
+        assert compare([bundle.pk]) == []
+
+    def test_created_while_saved(self, bundle_db):
+        bundle, me, apple = bundle_db['bundle'], bundle_db['me'], Product.objects.create(
+            name='apple', price=2, unit=bundle_db['kilo'])
+        insert_or_update = writes.insert_or_update
+        calls = []
+
+        def created_insert_or_update(*args):
+            calls.append(args[-1])
+            if len(calls) == 1:
+                writes.upsert_order(bundle.pk, me.pk, apple, writes.AMOUNT, 300)
+            return insert_or_update(*args)
+
+        with patch('order.writes.insert_or_update', created_insert_or_update):
+            version = writes.upsert_order(bundle.pk, me.pk, apple, writes.DELIVERED, 200)
+
+        order = bundle.orders.get(group=me, product=apple)
+        assert (version, order.amount, order.delivered) == (1, 300, 200)
+        assert calls == [None, None, 0]
+        assert compare([bundle.pk]) == []
+
+    def test_attempts(self, bundle_db):
+        """
+        An order, that is changed all the time, is not saved forever.
+        """
+        bundle, me, rice = bundle_db['bundle'], bundle_db['me'], bundle_db['rice']
+
+        with patch('order.writes.insert_or_update', return_value=0) as insert_or_update:
+            with pytest.raises(writes.Conflict) as conflict:
+                writes.upsert_order(bundle.pk, me.pk, rice, writes.DELIVERED, 700)
+
+        assert insert_or_update.call_count == writes.UPSERT_ATTEMPTS
+        assert (conflict.value.value, conflict.value.version) == (500, 0)
+        assert compare([bundle.pk]) == []
+
+    def test_output_ajax_conflict(self, bundle_db):
+        url = '/bundle/{}/output/'.format(bundle_db['bundle'].pk)
+        data = {'group': bundle_db['me'].pk, 'product': bundle_db['rice'].pk, 'delivered': 600, 'version': 0}
+        client = Client()
+
+        first = client.post(url, data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        second = client.post(url, dict(data, delivered=700), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        assert json.loads(first.content.decode('utf-8'))['version'] == 1
+        assert json.loads(second.content.decode('utf-8')) == {
+            'error': "The amount was changed by someone else", 'conflict': {'delivered': 600, 'version': 1}}
+
+    def test_output_ajax_empty_version(self, bundle_db):
+        """
+        A cell, that does not know the version, sends an empty version.
+        """
+        url = '/bundle/{}/output/'.format(bundle_db['bundle'].pk)
+        data = {'group': bundle_db['me'].pk, 'product': bundle_db['rice'].pk, 'delivered': 600, 'version': ''}
+
+        response = Client().post(url, data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        assert json.loads(response.content.decode('utf-8'))['version'] == 1
+        assert bundle_db['bundle'].orders.get(group=bundle_db['me'], product=bundle_db['rice']).delivered == 600
+
+
+@pytest.mark.django_db
+class TestCoalescedViews:
+    @pytest.fixture(autouse=True)
+    def coalesce(self, settings):
+        settings.ORDER_COALESCE_DELAY = 0.01
+
+    def test_get_buffer(self, settings):
+        assert writes.get_buffer().delay == 0.01
+        settings.ORDER_COALESCE_DELAY = 0
+        assert writes.get_buffer() is None
+
+    def test_order_ajax(self, bundle_db):
+        bundle_db['me'].enclosure = True
+        bundle_db['me'].save()
+        client = Client()
+        url = '/bundle/{}/'.format(bundle_db['bundle'].pk)
+        client.get(url, {'group': bundle_db['me'].pk})
+
+        response = client.post(url, {'product': bundle_db['milk'].pk, 'amount': 10},
+                               HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        assert json.loads(response.content.decode('utf-8')) == {'price_for_group': '15.92'}
+        assert bundle_db['bundle'].orders.get(group=bundle_db['me'], product=bundle_db['milk']).amount == 10
+
+    def test_deferred(self, rf, bundle_db):
+        request = rf.post('/')
+        request.META[writes.DEFER_WRITES] = True
+        change = writes.Change(bundle_db['bundle'].pk, bundle_db['me'].pk, writes.AMOUNT, bundle_db['milk'].pk, 9)
+        respond = MagicMock(return_value=HttpResponse('saved'))
+
+        response = writes.write_change(request, change, None, respond)
+
+        assert isinstance(response, writes.DeferredResponse)
+        assert not respond.called
+        assert response.buffer.commit(response.batch)
+        response.complete(True)
+        assert response.content == b'saved'
+        assert bundle_db['bundle'].orders.get(group=bundle_db['me'], product=bundle_db['milk']).amount == 9
+
+    def test_output_ajax(self, bundle_db):
+        data = {'group': bundle_db['other'].pk, 'product': bundle_db['milk'].pk, 'delivered': 2}
+
+        response = Client().post('/bundle/{}/output/'.format(bundle_db['bundle'].pk), data,
+                                 HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        assert json.loads(response.content.decode('utf-8')) == {
+            'price_for_group': '4.23', 'price_for_all': '9.21', 'product_delivered': 5}
@@ -0,0 +1,291 @@
+"""
+Running totals for bundles.
+
+The prices and amounts of a bundle are saved per bundle, per group and per
+product in the models BundleTotal, GroupTotal and ProductTotal. They are updated
+with the difference of each changed order (see order.signals), so the views can
+read them without looking at all orders of a bundle.
+
+The prices are integers in millionths of euros (see order.fields.line_price),
+so the running totals are always exactly the same as totals calculated from
+scratch.
+
+The totals of archived bundles (see order.archive) are never rebuilt or
+compared, because they contain the prices of the time of archiving.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import caching
+from .models import Bundle, BundleTotal, GroupTotal, Order, Product, ProductTotal, mark_deleted
+
+_local = threading.local()
+
+
+class Changes:
+    """
+    Collects differences for the totals, so they can be saved together.
+
+    Each attribute is a dict, where the key is a tuple of ids and the value is a
+    dict with the difference for each field of the total.
+    """
+
+    def __init__(self):
+        self.bundles = defaultdict(lambda: defaultdict(int))
+        self.groups = defaultdict(lambda: defaultdict(int))
+        self.products = defaultdict(lambda: defaultdict(int))
+
+    def add(self, bundle_id, group_id, product, amount, delivered, sign=1):
+        """
+        Adds the values of one order. Use sign=-1 to remove them.
+        """
+        price = sign * product.get_line_price(amount)
+        price_delivered = sign * product.get_line_price(delivered)
+        unknown = sign * (product.price_cents is None and amount > 0)
+        unknown_delivered = sign * (product.price_cents is None and delivered > 0)
+        for values in (self.bundles[(bundle_id,)],
+                       self.groups[(bundle_id, group_id)],
+                       self.products[(bundle_id, product.pk)]):
+            values['price'] += price
+            values['price_delivered'] += price_delivered
+            values['unknown'] += unknown
+            values['unknown_delivered'] += unknown_delivered
+        self.products[(bundle_id, product.pk)]['amount'] += sign * amount
+        self.products[(bundle_id, product.pk)]['delivered'] += sign * delivered
+
+    def add_order(self, order, sign=1):
+        """
+        Adds the values of an order-object.
+        """
+        self.add(order.bundle_id, order.group_id, order.product,
+                 order.amount, order.get_delivered(), sign)
+
+    def models(self):
+        """
+        Returns tuples in the form (model, key_names, fields, dict) for each kind
+        of total.
+        """
+        prices = ('price', 'price_delivered', 'unknown', 'unknown_delivered')
+        return ((BundleTotal, ('bundle_id',), prices, self.bundles),
+                (GroupTotal, ('bundle_id', 'group_id'), prices, self.groups),
+                (ProductTotal, ('bundle_id', 'product_id'), prices + ('amount', 'delivered'), self.products))
+
+    def save(self):
+        """
+        Adds the differences to the saved totals.
+        """
+        # An error is raised, so no savepoint is needed inside of a transaction.
+        with transaction.atomic(savepoint=False):
+            for model, key_names, __, changes in self.models():
+                for key, values in changes.items():
+                    values = dict((field, value) for field, value in values.items() if value)
+                    if values:
+                        _add_to_total(model, dict(zip(key_names, key)), values)
+
+
+def _add_to_total(model, keys, values):
+    """
+    Adds values to the total with the given keys. Creates the total, if it does
+    not exist.
+    """
+    update = dict((field, F(field) + value) for field, value in values.items())
+    if model.objects.filter(**keys).update(**update):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**dict(keys, **values))
+    except IntegrityError:
+        # Someone else has created the total in the meantime
+        model.objects.filter(**keys).update(**update)
+
+
+def is_paused():
+    return getattr(_local, 'paused', 0) > 0
+
+
+@contextmanager
+def paused():
+    """
+    Contextmanager in which changed orders do not update the totals.
+
+    Deleted orders are not marked in the sequence of their bundle one by one
+    either (see deleted_while_paused). When the outermost block exits without
+    an error, each of their bundles is marked once and its cached pages are
+    invalidated.
+    """
+    _local.paused = getattr(_local, 'paused', 0) + 1
+    completed = False
+    try:
+        yield
+        completed = True
+    finally:
+        _local.paused -= 1
+        if not _local.paused:
+            deleted, _local.deleted = getattr(_local, 'deleted', set()), set()
+            for bundle_id, using in (deleted if completed else ()):
+                mark_deleted(bundle_id, using)
+                caching.bundle_changed(bundle_id)
+
+
+def deleted_while_paused(bundle_id, using=None):
+    """
+    Remembers, that an order of the bundle was deleted in a paused() block.
+    """
+    if not hasattr(_local, 'deleted'):
+        _local.deleted = set()
+    _local.deleted.add((bundle_id, using))
+
+
+@contextmanager
+def rebuild_after(bundles):
+    """
+    Contextmanager to change many orders of the given bundles at once.
+
+    The totals are not updated for each order but rebuild at the end.
+    """
+    bundle_ids = list(bundles.values_list('pk', flat=True).distinct())
+    with paused():
+        yield
+    rebuild(bundle_ids)
+
+
+def order_saved(order):
+    """
+    Updates the totals after an order was saved with the difference to the
+    state, that was read from the database in the same transaction (see
+    Order.save).
+    """
+    if is_paused():
+        return
+    state = order.get_state()
+    if state == order.saved_state:
+        return
+
+    changes = Changes()
+    if order.saved_state is not None:
+        bundle_id, group_id, product_id, amount, delivered = order.saved_state
+        if product_id == order.product_id:
+            product = order.product
+        else:
+            product = Product.objects.select_related('unit').get(pk=product_id)
+        changes.add(bundle_id, group_id, product, amount, delivered, sign=-1)
+    changes.add_order(order)
+    changes.save()
+
+
+def order_changed(bundle_id, group_id, product, old, new):
+    """
+    Updates the totals for an order, that was changed without save() (see
+    order.writes.upsert_order).
+
+    old and new are tuples (amount, delivered) of the order before and after
+    the change, old is None for a new order.
+    """
+    if is_paused():
+        return
+    changes = Changes()
+    if old is not None:
+        amount, delivered = old
+        changes.add(bundle_id, group_id, product, amount, delivered if delivered is not None else amount, sign=-1)
+    amount, delivered = new
+    changes.add(bundle_id, group_id, product, amount, delivered if delivered is not None else amount)
+    changes.save()
+
+
+def order_deleted(order):
+    """
+    Updates the totals after an order was deleted.
+    """
+    if is_paused():
+        return
+    changes = Changes()
+    changes.add_order(order, sign=-1)
+    changes.save()
+
+
+def orders_created(orders):
+    """
+    Updates the totals for orders that where created without calling save(), for
+    example with bulk_create().
+    """
+    changes = Changes()
+    for order in orders:
+        changes.add_order(order)
+    changes.save()
+
+
+def product_saved(product):
+    """
+    Rebuilds the totals of all bundles with the product, if its price has changed.
+    """
+    if product.saved_price is not None and product.saved_price != (product.price_cents, product.unit_id):
+        rebuild(Bundle.objects.filter(orders__product=product).values_list('pk', flat=True).distinct())
+
+
+def unit_saved(unit):
+    """
+    Rebuilds the totals of all bundles with products of the unit, if its divisor
+    has changed.
+    """
+    if unit.saved_divisor is not None and unit.saved_divisor != unit.divisor:
+        bundles = Bundle.objects.filter(orders__product__unit=unit)
+        rebuild(bundles.values_list('pk', flat=True).distinct())
+
+
+def _not_archived(bundle_ids):
+    return list(Bundle.objects.filter(pk__in=list(bundle_ids), archived=False).values_list('pk', flat=True))
+
+
+def calculate(bundle_ids):
+    """
+    Calculates the totals for the given bundles from all their orders.
+
+    Returns a Changes-object, which contains the full totals.
+    """
+    changes = Changes()
+    for order in Order.objects.filter(bundle__in=list(bundle_ids)).select_related('product__unit'):
+        changes.add_order(order)
+    return changes
+
+
+def rebuild(bundle_ids):
+    """
+    Replaces the saved totals of the given bundles with totals calculated from
+    their orders.
+    """
+    bundle_ids = _not_archived(bundle_ids)
+    if not bundle_ids:
+        return
+    changes = calculate(bundle_ids)
+    with transaction.atomic():
+        for model, key_names, __, totals in changes.models():
+            model.objects.filter(bundle__in=bundle_ids).delete()
+            model.objects.bulk_create(
+                model(**dict(zip(key_names, key), **values)) for key, values in totals.items())
+
+
+def compare(bundle_ids):
+    """
+    Compares the saved totals of the given bundles with totals calculated from
+    their orders.
+
+    Returns a list of tuples in the form (model, key, field, saved, calculated)
+    for each value that differs.
+    """
+    bundle_ids = _not_archived(bundle_ids)
+    differences = []
+    for model, key_names, fields, calculated in calculate(bundle_ids).models():
+        saved = dict(
+            (tuple(getattr(total, name) for name in key_names), total)
+            for total in model.objects.filter(bundle__in=bundle_ids))
+        for key in sorted(set(saved) | set(calculated)):
+            for field in fields:
+                saved_value = getattr(saved[key], field) if key in saved else 0
+                calculated_value = calculated[key][field] if key in calculated else 0
+                if saved_value != calculated_value:
+                    differences.append((model, key, field, saved_value, calculated_value))
+    return differences
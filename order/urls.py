@@ -1,6 +1,6 @@
 from django.conf.urls import patterns, url
 
-from . import views
+from . import export, views
 
 urlpatterns = patterns(
     '',
@@ -8,17 +8,66 @@ urlpatterns = patterns(
     url(r'^bundle/newest/$', views.NewestBundleView.as_view(), name='order_bundle_newest'),
     url(r'^bundle/new/$', views.BundleCreateView.as_view(), name='order_bundle_create'),
     url(r'^bundle/(?P<pk>\d+)/$', views.BundleDetailView.as_view(), name='order_bundle_detail'),
+    url(r'^bundle/(?P<pk>\d+)/batch/$', views.BundleDetailView.as_view(batch=True), name='order_bundle_detail_batch'),
     url(r'^bundle/(?P<pk>\d+)/del/$', views.BundleDeleteView.as_view(), name='order_bundle_delete'),
     url(r'^bundle/(?P<pk>\d+)/close/$', views.BundleCloseView.as_view(open=False), name='order_bundle_close'),
     url(r'^bundle/(?P<pk>\d+)/open/$', views.BundleCloseView.as_view(open=True), name='order_bundle_open'),
     url(r'^bundle/(?P<pk>\d+)/order/$', views.BundleOrderView.as_view(), name='order_bundle_order'),
     url(r'^bundle/(?P<pk>\d+)/output/$', views.BundleOutputView.as_view(), name='order_bundle_output'),
+    url(r'^bundle/(?P<pk>\d+)/output/batch/$', views.BundleOutputView.as_view(batch=True),
+        name='order_bundle_output_batch'),
+    url(r'^bundle/(?P<pk>\d+)/output/events/$', views.BundleOutputEventsView.as_view(),
+        name='order_bundle_output_events'),
+    url(r'^bundle/(?P<pk>\d+)/data\.json$', views.BundleDataView.as_view(), name='order_bundle_data'),
+    url(r'^bundle/(?P<pk>\d+)/changes\.json$', views.BundleChangesView.as_view(), name='order_bundle_changes'),
+    url(r'^bundle/(?P<pk>\d+)/order/(?P<flavor>ordered|delivered)\.(?P<format>csv|tsv)$',
+        views.BundleExportView.as_view(rows=export.order_rows, filename='bestelluebersicht'),
+        name='order_bundle_order_export'),
+    url(r'^bundle/(?P<pk>\d+)/output/(?P<flavor>ordered|delivered)\.(?P<format>csv|tsv)$',
+        views.BundleExportView.as_view(rows=export.output_rows, filename='essensausgabe'),
+        name='order_bundle_output_export'),
 
     url(r'^product/(?P<pk>\d+)/$', views.ProductUpdateView.as_view(), name='order_product_update'),
-    url(r'^product/edit/$', views.ProductFormSetView.as_view(), name='order_product_formset'),
+    url(r'^product/edit/$', views.ProductBulkEditView.as_view(), name='order_product_formset'),
+    url(r'^product/import/$', views.ProductImportView.as_view(), name='order_product_import'),
 
     url(r'^group/$', views.GroupListView.as_view(), name='order_group_list'),
     url(r'^group/new/$', views.GroupCreateView.as_view(), name='order_group_create'),
     url(r'^group/(?P<pk>\d+)/edit/$', views.GroupUpdateView.as_view(), name='order_group_update'),
     url(r'^group/(?P<pk>\d+)/del/$', views.GroupDeleteView.as_view(), name='order_group_delete'),
 )
+
+QUERY_BUDGETS = {
+    'order_bundle_list': 2,
+    'order_bundle_newest': 1,
+    'order_bundle_detail': {'GET': 10, 'POST': 16},
+    'order_bundle_order': 4,
+    'order_bundle_output': {'GET': 6, 'POST': 14},
+    'order_bundle_output_events': {'GET': 1},
+    'order_bundle_data': {'GET': 4},
+    'order_bundle_changes': {'GET': 5},
+    'order_bundle_order_export': 3,
+    'order_bundle_output_export': 3,
+    'order_product_update': {'GET': 3},
+    'order_product_formset': {'GET': 4},
+    'order_group_list': 2,
+    'order_group_update': {'GET': 2},
+}
+"""
+Maximum number of queries for each url name. The value is either a number or a
+dict with a number for each http-method. Urls, that need one query for each
+object by design (e.g. saving a formset) have no budget.
+
+Used by order.middleware.QueryCountMiddleware and by the tests to find views,
+that need more queries then expected (e.g. one query per order).
+"""
+
+
+def get_query_budget(url_name, method):
+    """
+    Returns the query budget for an url name and a http-method or None.
+    """
+    budget = QUERY_BUDGETS.get(url_name)
+    if isinstance(budget, dict):
+        return budget.get(method.upper())
+    return budget
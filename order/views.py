@@ -1,28 +1,167 @@
+import codecs
+import hashlib
 import json
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from functools import partial
 
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
 from django.core.urlresolvers import reverse, reverse_lazy
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.views.generic import (CreateView, DeleteView, DetailView, ListView, RedirectView,
-                                  UpdateView)
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+from django.views.generic import (CreateView, DeleteView, DetailView, FormView, ListView,
+                                  RedirectView, UpdateView, View)
 from django.views.generic.detail import SingleObjectMixin
-from extra_views import ModelFormSetView
 
-from .forms import GroupChooseForm, OrderForm
-from .models import Bundle, Group, Order, Product
+from . import api, caching, events, export, pagination, pricelist, totals, writes
+from .fields import from_micros
+from .forms import GroupChooseForm, OrderForm, PriceListForm, ProductFilterForm, ProductForm
+from .models import Bundle, BundleTotal, Group, GroupTotal, Order, Product, ProductTotal, Unit
+from .pivot import OutputTable, settle
+
+
+class ClosedBundleCacheMixin:
+    """
+    Mixin for a DetailView of a bundle, that caches the rendered page, if the
+    bundle is closed.
+
+    See order.caching for the invalidation of the cache.
+    """
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        if self.object.open:
+            return self.render_to_response(self.get_context_data(object=self.object))
+
+        key = caching.page_key(self.object, type(self).__name__, self.get_cache_key_extra())
+        page = caching.get_page(key)
+        if page is None:
+            response = self.render_to_response(self.get_context_data(object=self.object))
+            # Template responses are rendered lazy
+            if hasattr(response, 'render'):
+                response.render()
+            caching.set_page(key, response)
+            return response
+
+        # The javascript needs the csrf-cookie, which is set with get_token
+        get_token(request)
+        content, content_type = page
+        return HttpResponse(content, content_type=content_type)
+
+    def get_cache_key_extra(self):
+        """
+        Returns a string that is added to the cache key. Has to be used, if the
+        page is not the same for all requests.
+        """
+        return ''
+
+
+class ConditionalBundleMixin:
+    """
+    Mixin for a DetailView of a bundle, that answers conditional get-requests
+    with 304 Not Modified.
+
+    The ETag and the Last-Modified header are built from the version of the
+    bundle (see caching.bundle_version), which changes with every order of the
+    bundle and with the catalog. If the client has the current version, the
+    response only needs one lookup in the cache.
+
+    Uses get_cache_key_extra of ClosedBundleCacheMixin for pages, that are not
+    the same for all requests.
+
+    GZipMiddleware and gzip_page add ';gzip' to the ETag of compressed
+    responses, so the suffix is removed from If-None-Match before it is
+    compared.
+    """
+
+    def get(self, request, *args, **kwargs):
+        get = super().get
+        if request.method not in ('GET', 'HEAD'):
+            # BundleDetailView renders the page for post-requests with get()
+            return get(request, *args, **kwargs)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            request.META['HTTP_IF_NONE_MATCH'] = if_none_match.replace(';gzip"', '"')
+        return condition(etag_func=self.get_etag, last_modified_func=self.get_last_modified)(get)(
+            request, *args, **kwargs)
+
+    def get_version(self):
+        if not hasattr(self, '_version'):
+            self._version = caching.bundle_version(self.kwargs['pk'])
+        return self._version
+
+    def get_etag(self, request, *args, **kwargs):
+        generations, __ = self.get_version()
+        # The page contains the csrf-token of the client
+        value = "{}:{}:{}:{}:{}:{}".format(
+            type(self).__name__, self.kwargs['pk'], generations[0], generations[1], self.get_cache_key_extra(),
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''))
+        return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+    def get_last_modified(self, request, *args, **kwargs):
+        __, modified = self.get_version()
+        return modified
 
 
 class BundleListView(ListView):
     """
-    View to show all Bundles.
+    View to show all Bundles, the newest first.
+
+    The list is split into pages with keyset pagination (see order.pagination).
+    The get-argument 'before' contains the cursor of the page.
     """
 
     model = Bundle
+    context_object_name = 'bundle_list'
+    page_size = 20
 
+    def get_queryset(self):
+        """
+        Returns all bundles with the extra columns:
+        * group_count: number of groups with an ordered amount
+        * product_count: number of products with an ordered amount
+        * ordered_total: price of the ordered amounts
+
+        The columns are correlated subqueries on the totals, so they are only
+        calculated for the bundles of the page (after the keyset filter and the
+        limit) and the totals are not joined.
+        """
+        quote = connection.ops.quote_name
+        tables = dict((name, quote(model._meta.db_table)) for name, model in (
+            ('bundle', Bundle), ('bundle_total', BundleTotal), ('group_total', GroupTotal),
+            ('product_total', ProductTotal)))
+        return super().get_queryset().extra(select=OrderedDict([
+            ('group_count', 'SELECT COUNT(*) FROM {group_total} WHERE {group_total}.bundle_id = {bundle}.id '
+                            'AND ({group_total}.price > 0 OR {group_total}.unknown > 0)'.format(**tables)),
+            ('product_count', 'SELECT COUNT(*) FROM {product_total} '
+                              'WHERE {product_total}.bundle_id = {bundle}.id AND {product_total}.amount > 0'.format(
+                                  **tables)),
+            ('ordered_total', 'SELECT {bundle_total}.price FROM {bundle_total} '
+                              'WHERE {bundle_total}.bundle_id = {bundle}.id'.format(**tables)),
+        ]))
 
-class BundleDetailView(DetailView):
+    def get_context_data(self, **context):
+        """
+        Returns the bundles of the page as bundle_list and the cursor of the next
+        page as next_cursor.
+        """
+        bundles, next_cursor = pagination.keyset_page(
+            self.object_list, 'start', self.request.GET.get('before'), self.page_size)
+        for bundle in bundles:
+            bundle.ordered_total = from_micros(bundle.ordered_total)
+        return super().get_context_data(
+            object_list=bundles,
+            next_cursor=next_cursor,
+            is_first_page='before' not in self.request.GET,
+            **context)
+
+
+class BundleDetailView(ConditionalBundleMixin, ClosedBundleCacheMixin, DetailView):
     """
     View to show one Bundle.
 
@@ -31,6 +170,10 @@ class BundleDetailView(DetailView):
     """
 
     model = Bundle
+    batch = False
+    """
+    If True, ajax-requests are handled by ajax_batch instead of ajax.
+    """
 
     def get(self, request, *args, **kwargs):
         """
@@ -53,12 +196,20 @@ class BundleDetailView(DetailView):
             raise PermissionDenied()
 
         self.active_group = self.get_active_group(request)
-        if request.is_ajax():
+        if request.is_ajax() and self.batch:
+            return self.ajax_batch(request, *args, **kwargs)
+        elif request.is_ajax():
             return self.ajax(request, *args, **kwargs)
         else:
             # Call super().get() because a DetailView does not have a post-method.
             return super().get(request, *args, **kwargs)
 
+    def get_cache_key_extra(self):
+        """
+        The page depends on the active group.
+        """
+        return self.active_group.pk if self.active_group is not None else ''
+
     def get_active_group(self, request):
         """
         Get the active_group.
@@ -67,23 +218,54 @@ class BundleDetailView(DetailView):
         Returns the active Group or None.
         """
         # Try to use the GET-Data
-        group_form = GroupChooseForm(request.GET)
-        if group_form.is_valid():
+        group_form = GroupChooseForm(request.GET) if 'group' in request.GET else None
+        if group_form is not None and group_form.is_valid():
             active_group = group_form.cleaned_data.get('group')
-            request.session['active_group'] = active_group.pk
+            self.save_session_group(request, active_group)
 
         # Try to use the session
         elif request.session.get('active_group', None):
-            try:
-                active_group = Group.objects.get(pk=request.session.get('active_group'))
-            except Group.DoesNotExist:
-                active_group = None
+            active_group = self.get_session_group(request)
 
         # There are no data about the active group
         else:
             active_group = None
         return active_group
 
+    def save_session_group(self, request, group):
+        """
+        Saves the id, the name and the enclosure of the group in the session,
+        together with the generation of the catalog.
+        """
+        catalog_generation, = caching.get_generations(caching.CATALOG)
+        request.session['active_group'] = {
+            'pk': group.pk,
+            'name': group.name,
+            'enclosure': group.enclosure,
+            'catalog': catalog_generation}
+
+    def get_session_group(self, request):
+        """
+        Returns the group saved in the session or None.
+
+        As long as the catalog has not changed, the group is created from the
+        data in the session without a query. Otherwise it is loaded again.
+        """
+        data = request.session.get('active_group')
+        catalog_generation, = caching.get_generations(caching.CATALOG)
+        if isinstance(data, dict) and data.get('catalog') == catalog_generation:
+            return Group(pk=data['pk'], name=data['name'], enclosure=data['enclosure'])
+
+        # The session of older versions only contains the id
+        pk = data['pk'] if isinstance(data, dict) else data
+        try:
+            group = Group.objects.get(pk=pk)
+        except Group.DoesNotExist:
+            del request.session['active_group']
+            return None
+        self.save_session_group(request, group)
+        return group
+
     def ajax(self, request, *args, **kwargs):
         """
         Receives the data via ajax.
@@ -93,6 +275,9 @@ class BundleDetailView(DetailView):
 
         The response is json in the form:
         {'price_for_group': 5.49}
+
+        or, if the data is not valid or there is no active group:
+        {'error': "..."}
         """
         try:
             product = Product.objects.get(pk=request.POST['product'])
@@ -101,33 +286,105 @@ class BundleDetailView(DetailView):
         except KeyError:
             return_data = {'error': "no product data in request"}
         else:
-            # Create the Order-object if necessary
-            order, __ = Order.objects.get_or_create(product=product, bundle=self.object, group=self.active_group)
-            order.amount = int(request.POST['amount'])
-            order.save()
+            try:
+                amount = int(request.POST['amount'])
+            except KeyError:
+                return_data = {'error': "no amount data in request"}
+            except ValueError:
+                return_data = {'error': "amount has to be an integer"}
+            else:
+                if amount < 0:
+                    return_data = {'error': "amount has to be positive"}
+                elif self.active_group is None:
+                    return_data = {'error': "no active group"}
+                else:
+                    change = writes.Change(self.object.pk, self.active_group.pk, writes.AMOUNT, product.pk, amount)
+                    return writes.write_change(
+                        request, change, partial(self.save_amount, product, amount), self.ajax_response)
+
+        return HttpResponse(json.dumps(return_data))
+
+    def save_amount(self, product, amount):
+        """
+        Saves the amount of a product for the active group. Returns the new
+        version of the order.
+        """
+        return writes.upsert_order(self.object.pk, self.active_group.pk, product, writes.AMOUNT, amount)
+
+    def ajax_response(self, saved, version=None):
+        """
+        Returns the response of ajax with the price for the active group.
+        """
+        if saved:
             return_data = {'price_for_group': "{:.2f}".format(self.object.price_for_group(self.active_group))}
+        else:
+            return_data = {'error': "the amount could not be saved"}
+        return HttpResponse(json.dumps(return_data))
 
+    def ajax_batch(self, request, *args, **kwargs):
+        """
+        Receives the amounts for many products at once via ajax.
+
+        The expected data are the lists 'product' and 'amount' (send with
+        jQuery.ajax(traditional=true)), where the n-th amount belongs to the
+        n-th product. All orders are saved in one transaction and the price for
+        the group is only calculated once.
+
+        The response is json in the same form as the response of ajax.
+        """
+        product_pks = request.POST.getlist('product')
+        amounts = request.POST.getlist('amount')
+        if not product_pks or len(product_pks) != len(amounts):
+            return HttpResponse(json.dumps({'error': "no product data in request"}))
+        if self.active_group is None:
+            return HttpResponse(json.dumps({'error': "no active group"}))
+
+        try:
+            amounts = dict(zip(map(int, product_pks), map(int, amounts)))
+        except ValueError:
+            return HttpResponse(json.dumps({'error': "product and amount have to be integers"}))
+        if any(amount < 0 for amount in amounts.values()):
+            return HttpResponse(json.dumps({'error': "amount has to be positive"}))
+
+        products = Product.objects.select_related('unit').in_bulk(list(amounts))
+        missing = sorted(set(amounts) - set(products))
+        if missing:
+            return HttpResponse(json.dumps(
+                {'error': "product {} not found".format(", ".join(map(str, missing)))}))
+
+        with transaction.atomic():
+            writes.save_amounts(self.object.pk, self.active_group.pk, amounts, products)
+        caching.bundle_changed(self.object.pk)
+
+        return_data = {'price_for_group': "{:.2f}".format(self.object.price_for_group(self.active_group))}
         return HttpResponse(json.dumps(return_data))
 
     def get_products(self):
         """
         Returns a list of all available products with extra attributes.
 
-        This extra attributes are in particular a OrderForm.
+        The products are read from the cached catalog (see order.caching). This
+        extra attributes are in particular a OrderForm.
 
         Validates this forms, if self.request is a post-request.
+
+        For archived bundles, only the products of the settlement are returned
+        with their settled prices.
         """
-        products = Product.objects.filter(available=True).select_related()
+        if self.object.archived:
+            return self.get_archived_products()
+
+        products = caching.get_catalog()['products']
 
         # Order-data can only be used, if there is an active_group
         if self.active_group is not None:
             query = Order.objects.filter(bundle=self.object, group=self.active_group)
-            # Create a hashtable, of products hashed from there products
-            order_dict = dict((order.product, order) for order in query)
+            # Create a hashtable, of orders hashed from the ids of there products
+            order_dict = dict((order.product_id, order) for order in query)
 
             for product in products:
                 prefix = "p{}".format(product.pk)
-                form_kwargs = {'prefix': prefix, 'instance': order_dict.get(product, None)}
+                form_kwargs = {'prefix': prefix, 'instance': order_dict.get(product.pk, None)}
                 if self.request.method == 'POST':
                     product.form = OrderForm(self.request.POST, **form_kwargs)
                     if product.form.is_valid():
@@ -140,6 +397,22 @@ class BundleDetailView(DetailView):
                     product.form = OrderForm(**form_kwargs)
         return products
 
+    def get_archived_products(self):
+        """
+        Returns the products of an archived bundle with the settled prices and
+        with an unbound OrderForm, that shows the amount of the active group.
+        """
+        products = list(Product.objects.filter(totals__bundle=self.object).select_related('unit'))
+        settle(products, self.object.get_settled_prices())
+        if self.active_group is not None:
+            amounts = dict(
+                (product, amount) for group, product, amount
+                in self.object.get_order_values('group', 'product', 'amount') if group == self.active_group.pk)
+            for product in products:
+                product.form = OrderForm(prefix="p{}".format(product.pk),
+                                         instance=Order(amount=amounts.get(product.pk, 0)))
+        return products
+
     def get_context_data(self, **context):
         """
         Returns extra context for the view.
@@ -150,12 +423,13 @@ class BundleDetailView(DetailView):
         * price_for_group = the costs for the active_group
         * price_unknown = True, if not all ordered products have a price
         """
+        total = self.object.get_total(self.active_group)
         return super().get_context_data(
             products=self.get_products(),
             group_form=GroupChooseForm(initial={'group': self.active_group}),
             active_group=self.active_group,
-            price_for_group="{:.2f}".format(self.object.price_for_group(self.active_group)),
-            price_unknown=self.object.has_unknown_price(self.active_group),
+            price_for_group="{:.2f}".format(total.get_price()),
+            price_unknown=total.has_unknown_price(),
             **context)
 
 
@@ -193,7 +467,13 @@ class BundleCloseView(SingleObjectMixin, RedirectView):
 
     def get(self, *args, **kwargs):
         self.bundle = self.get_object()  # TODO: this is propably called twice
+
+        # Archived bundles can not be opened again
+        if self.bundle.archived:
+            raise PermissionDenied()
+
         self.bundle.open = self.open
+        self.bundle.closed = None if self.open else timezone.now()
         self.bundle.save()
         return super().get(*args, **kwargs)
 
@@ -215,7 +495,7 @@ class NewestBundleView(RedirectView):
             return reverse('order_bundle_list')
 
 
-class BundleOrderView(DetailView):
+class BundleOrderView(ConditionalBundleMixin, ClosedBundleCacheMixin, DetailView):
     """
     DetailView of a Bundle, to see summary of all orders, for ordering all the
     products from the distributor.
@@ -232,7 +512,12 @@ class BundleOrderView(DetailView):
         product-object two attributes are appended.
         * amount: the amount of ordered units for this product in this bundle
         * order_price: the price for the order of this product for this bundle
+
+        For archived bundles, the products are read from the settlement.
         """
+        if self.object.archived:
+            return self.get_archived_products()
+
         # Generates a dict to save for each product the ordered amount.
         products_dict = defaultdict(int)
         for order in self.object.orders.all().select_related():
@@ -242,13 +527,24 @@ class BundleOrderView(DetailView):
         for product, amount in products_dict.items():
             if amount > 0:
                 product.amount = amount
-                product.order_price = product.multiplier * amount
+                product.order_price = from_micros(product.get_line_price(amount))
                 products.append(product)
 
         products.sort(key=lambda product: product.name)
 
         return products
 
+    def get_archived_products(self):
+        products = []
+        query = self.object.product_totals.filter(amount__gt=0).select_related('product__unit')
+        for total in query.order_by('product__name'):
+            product = total.product
+            product.price_cents = total.unit_price
+            product.amount = total.amount
+            product.order_price = from_micros(total.price)
+            products.append(product)
+        return products
+
     def get_context_data(self, **context):
         """
         Returns all products and the price for all products as extra context.
@@ -260,7 +556,7 @@ class BundleOrderView(DetailView):
             **context)
 
 
-class BundleOutputView(DetailView):
+class BundleOutputView(ConditionalBundleMixin, ClosedBundleCacheMixin, DetailView):
     """
     DetailView to show all orders of a bundle, so the products can be
     distributed.
@@ -270,6 +566,10 @@ class BundleOutputView(DetailView):
 
     model = Bundle
     template_name = 'order/bundle_detail_output.html'
+    batch = False
+    """
+    If True, ajax-requests are handled by ajax_batch instead of ajax.
+    """
 
     def post(self, request, *args, **kwargs):
         """
@@ -282,6 +582,13 @@ class BundleOutputView(DetailView):
             raise PermissionDenied()
 
         self.object = self.get_object()
+
+        # Orders of archived bundles can not be changed
+        if self.object.archived:
+            raise PermissionDenied()
+
+        if self.batch:
+            return self.ajax_batch(request, *args, **kwargs)
         return self.ajax(request, *args, **kwargs)
 
     def ajax(self, request, *args, **kwargs):
@@ -295,90 +602,283 @@ class BundleOutputView(DetailView):
         product: id
         delivered: int (e.G. 500)
 
+        version: int (optional)
+
         The response is in json, for excample:
         {'price_for_group': 5.45,
          'price_for_all': 10.34,
-         'product_delivered': 23}
+         'product_delivered': 23,
+         'version': 4}
         where product_delivered is the total delivered amount (for all groups)
+        and version the new version of the order (see Order.version). The
+        version is missing, if the change was saved by the write buffer (see
+        order.writes).
+
+        If a version is send, the amount is only saved, if the order still has
+        this version. Otherwise the response contains the current delivered
+        amount and version of the order:
+        {'error': "...", 'conflict': {'delivered': 300, 'version': 5}}
         """
         # TODO: calculate the price and the delivered amount in JS
         try:
-            product = Product.objects.get(pk=request.POST['product'])
+            product = Product.objects.select_related('unit').get(pk=request.POST['product'])
             group = Group.objects.get(pk=request.POST['group'])
         except ObjectDoesNotExist:
             return_data = {'error': "Group or product not found"}
         except KeyError:
             return_data = {'error': "No product or group data in request"}
         else:
-            # Create the order-object if necessary
-            order, __ = Order.objects.get_or_create(product=product, bundle=self.object, group=group)
             try:
-                order.delivered = request.POST['delivered']
+                delivered = int(request.POST['delivered'])
             except KeyError:
                 return_data = {'error': "No amount data in request"}
+            except ValueError:
+                return_data = {'error': "Amount has to be an integer"}
             else:
-                order.save()  # TODO: try to use update()
-
-                # Calculate the total delivered amount for that product
-                query = Order.objects.filter(product=product, bundle=self.object)
-                product_delivered = query.aggregate(delivered=Sum('delivered'))['delivered']
-                return_data = {
-                    'price_for_group': "{:.2f}".format(self.object.price_for_group(group, delivered=True)),
-                    'price_for_all': "{:.2f}".format(self.object.price_for_all(delivered=True)),
-                    'product_delivered': product_delivered}
+                if request.POST.get('version', '') != '':
+                    return self.ajax_version(group, product, delivered, request.POST['version'])
+                change = writes.Change(self.object.pk, group.pk, writes.DELIVERED, product.pk, delivered)
+                return writes.write_change(
+                    request, change, partial(self.save_delivered, group, product, delivered),
+                    partial(self.ajax_response, group, product, delivered))
+        return HttpResponse(json.dumps(return_data))
+
+    def ajax_version(self, group, product, delivered, version):
+        """
+        Saves the delivered amount, if the order has the given version, and
+        returns the response of ajax.
+
+        The change is saved at once and not by the write buffer, because the
+        buffer can not detect conflicts.
+        """
+        try:
+            version = int(version)
+        except ValueError:
+            return HttpResponse(json.dumps({'error': "Version has to be an integer"}))
+        try:
+            version = writes.upsert_order(self.object.pk, group.pk, product, writes.DELIVERED, delivered, version)
+        except writes.Conflict as conflict:
+            return HttpResponse(json.dumps({
+                'error': "The amount was changed by someone else",
+                'conflict': {'delivered': conflict.value, 'version': conflict.version}}))
+        return self.ajax_response(group, product, delivered, True, version)
+
+    def save_delivered(self, group, product, delivered):
+        """
+        Saves the delivered amount of a product for a group. Returns the new
+        version of the order.
+        """
+        return writes.upsert_order(self.object.pk, group.pk, product, writes.DELIVERED, delivered)
+
+    def ajax_response(self, group, product, delivered, saved, version=None):
+        """
+        Returns the response of ajax with the new prices and publishes the
+        change.
+        """
+        if not saved:
+            return HttpResponse(json.dumps({'error': "Amount could not be saved"}))
+
+        return_data = {
+            'price_for_group': "{:.2f}".format(self.object.price_for_group(group, delivered=True)),
+            'price_for_all': "{:.2f}".format(self.object.price_for_all(delivered=True)),
+            'product_delivered': self.object.delivered_for_product(product)}
+        if version is not None:
+            return_data['version'] = version
+        events.publish(self.object.pk, {
+            'cells': [[group.pk, product.pk, delivered, version]],
+            'price_for_group': {group.pk: return_data['price_for_group']},
+            'product_delivered': {product.pk: return_data['product_delivered']},
+            'price_for_all': return_data['price_for_all']})
+        return HttpResponse(json.dumps(return_data))
+
+    def ajax_batch(self, request, *args, **kwargs):
+        """
+        Save the actual delivered amounts for many cells of the output table at
+        once.
+
+        The expected data are the lists 'group', 'product' and 'delivered' (send
+        with jQuery.ajax(traditional=true)), where the n-th elements belong
+        together. An empty delivered value resets the cell to the ordered amount.
+        All orders are saved in one transaction.
+
+        The response is in json, for example:
+        {'price_for_group': {'1': 5.45, '2': 3.10},
+         'product_delivered': {'4': 23},
+         'price_for_all': 10.34}
+        where only the groups and products from the request are included.
+        """
+        group_pks = request.POST.getlist('group')
+        product_pks = request.POST.getlist('product')
+        delivered_values = request.POST.getlist('delivered')
+        if not group_pks or not len(group_pks) == len(product_pks) == len(delivered_values):
+            return HttpResponse(json.dumps({'error': "No product or group data in request"}))
+
+        try:
+            cells = dict(
+                ((int(group), int(product)), int(delivered) if delivered != '' else None)
+                for group, product, delivered in zip(group_pks, product_pks, delivered_values))
+        except ValueError:
+            return HttpResponse(json.dumps({'error': "Group, product and amount have to be integers"}))
+        if any(delivered is not None and delivered < 0 for delivered in cells.values()):
+            return HttpResponse(json.dumps({'error': "Amount has to be positive"}))
+
+        groups = Group.objects.in_bulk(list(set(group for group, __ in cells)))
+        products = Product.objects.select_related('unit').in_bulk(list(set(product for __, product in cells)))
+        if any(group not in groups or product not in products for group, product in cells):
+            return HttpResponse(json.dumps({'error': "Group or product not found"}))
+
+        with transaction.atomic():
+            changed = writes.save_delivered(self.object.pk, cells, products)
+        caching.bundle_changed(self.object.pk)
+
+        group_totals = self.object.group_totals.filter(group__in=list(groups))
+        price_for_group = dict.fromkeys(groups, 0)
+        price_for_group.update(
+            (group, from_micros(price)) for group, price in group_totals.values_list('group', 'price_delivered'))
+        product_totals = self.object.product_totals.filter(product__in=list(products))
+        product_delivered = dict.fromkeys(products, 0)
+        product_delivered.update(product_totals.values_list('product', 'delivered'))
+
+        return_data = {
+            'price_for_group': dict(
+                (group, "{:.2f}".format(price)) for group, price in price_for_group.items()),
+            'product_delivered': product_delivered,
+            'price_for_all': "{:.2f}".format(self.object.price_for_all(delivered=True))}
+        events.publish(self.object.pk, dict(
+            return_data,
+            cells=[[order.group_id, order.product_id, order.get_delivered(), order.version] for order in changed]))
         return HttpResponse(json.dumps(return_data))
 
     def get_context_data(self, **context):
         """
         Returns extra context for the view:
-        * products: sorted list with all products, where at least one is ordered
-                    each product has an extra attribute 'delivered' which is the
-                    actual delivered amount of the product.
+        * columns:  list of tuples (group, price) for each group with an order,
+                    where price is the price the group has to pay.
 
-        * groups:   dict where the key is a group-object and value is a two-value
-                    list where the first element is a dict and the second element
-                    the price the group has to pay. The key of the inner dict is
-                    is an product-object and the value the relevant order-object.
+        * rows:     list of tuples (product, delivered, cells) for each product,
+                    that is ordered at least once. delivered is the amount of
+                    the product that is delivered to all groups. cells is a list
+                    of tuples (group_pk, amount, delivered), one for each column.
 
         * price_for_all: the prive for this bundle
+
+        * price_unknown: True, if not all delivered products have a price
         """
-        # Dict where key=group, value=[group_inner_dict, price_for_group]
-        # and group_inner_dict is key=product, value=order
-        # e.G: {group1: [{product1: order, product2: order, ...}, 34.12], {group2: [....]}, ...}
-        # TODO: make a defaultdict with specific create function
-        group_dict = dict()
+        table = OutputTable(self.object)
+        return super().get_context_data(
+            columns=table.columns(),
+            rows=table.rows(),
+            price_for_all=table.price_for_all,
+            price_unknown=self.object.has_unknown_price(delivered=True),
+            **context)
 
-        # Temporary dict where key=product, value=[delivered_for_all, ordered_for_all]
-        product_dict = defaultdict(lambda: [0, 0])
-        for order in self.object.orders.all().select_related():
-            # get group_dict for specific group in order_dict or create it.
-            try:
-                group_inner_dict = group_dict[order.group][0]
-            except KeyError:
-                group_dict[order.group] = [dict(), 0]
-                group_inner_dict = group_dict[order.group][0]
 
-            # Connect order with group
-            group_inner_dict[order.product] = order
-            group_dict[order.group][1] += order.get_delivered() * order.product.multiplier
+class BundleOutputEventsView(SingleObjectMixin, View):
+    """
+    Stream of server-sent events with the changes of the output table of a
+    bundle (see order.events).
 
-            product_dict[order.product][0] += order.get_delivered()
-            product_dict[order.product][1] += order.amount
+    Each event 'change' contains json in the form:
+    {'cells': [[group_id, product_id, delivered, version], ...],
+     'price_for_group': {'1': 5.45},
+     'product_delivered': {'4': 23},
+     'price_for_all': 10.34}
+    where version is the new version of the order or None, if it is not known.
 
-        # Create a list of all products where each product has an extra argument
-        # 'delivered' which is the amount of all delivered units of this product.
-        products = list()
-        for product, order_values in product_dict.items():
-            if order_values[1] > 0:  # ordered amount > 0
-                product.delivered = order_values[0]  # delivered
-                products.append(product)
-        products.sort(key=lambda product: product.name)
+    The event 'reload' means, that the client has missed some changes and has to
+    load the page again.
 
-        return super().get_context_data(
-            products=products,
-            price_for_all=sum(group[1] for group in group_dict.values()),
-            groups=group_dict,
-            **context)
+    The get-argument 'duration' can be used to close the stream earlier then
+    after events.STREAM_DURATION seconds.
+    """
+
+    model = Bundle
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        try:
+            last_id = int(request.META['HTTP_LAST_EVENT_ID'])
+        except (KeyError, ValueError):
+            last_id = None
+        try:
+            duration = min(float(request.GET['duration']), events.STREAM_DURATION)
+        except (KeyError, ValueError):
+            duration = events.STREAM_DURATION
+
+        response = StreamingHttpResponse(events.stream(self.object.pk, last_id, duration),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Disable the buffering of nginx
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class BundleDataView(ConditionalBundleMixin, ClosedBundleCacheMixin, DetailView):
+    """
+    Returns the products, groups, orders and totals of a bundle as compact json
+    (see order.api).
+
+    The response is compressed with gzip, if the client accepts it. Like the
+    pages of a bundle, it is answered with 304 Not Modified, if the client has
+    the current version, and cached, if the bundle is closed.
+    """
+
+    model = Bundle
+
+    @method_decorator(gzip_page)
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
+    def render_to_response(self, context, **response_kwargs):
+        return HttpResponse(json.dumps(api.bundle_data(self.object), separators=(',', ':')),
+                            content_type='application/json')
+
+
+class BundleChangesView(SingleObjectMixin, View):
+    """
+    Returns the orders and totals of a bundle, that changed after the sequence
+    in the get-argument 'since', as json (see order.api.bundle_changes).
+
+    Without 'since' (or with 0) all orders of the bundle are returned. The
+    response contains the current sequence, which the client sends with the
+    next request.
+    """
+
+    model = Bundle
+
+    def get(self, request, *args, **kwargs):
+        try:
+            since = int(request.GET.get('since', 0))
+        except ValueError:
+            return HttpResponse(json.dumps({'error': "Since has to be an integer"}), content_type='application/json')
+        self.object = self.get_object()
+        response = HttpResponse(json.dumps(api.bundle_changes(self.object, since), separators=(',', ':')),
+                                content_type='application/json')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+class BundleExportView(SingleObjectMixin, View):
+    """
+    View to download a table of a bundle as csv- or tsv-file.
+
+    rows is the function, that yields the rows of the table for the bundle and
+    the argument delivered (e.g. export.order_rows), and filename the start of
+    the name of the file. Both are set in the url with as_view().
+
+    The url has to contain the arguments 'flavor', which is 'ordered' or
+    'delivered', and 'format', which is 'csv' or 'tsv'.
+    """
+
+    model = Bundle
+    rows = None
+    filename = 'bestellung'
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        rows = self.rows(self.object, delivered=kwargs['flavor'] == 'delivered')
+        filename = "{}-{}-{}".format(self.filename, self.object.start.strftime('%Y-%m-%d'), kwargs['flavor'])
+        return export.streaming_response(rows, filename, kwargs['format'])
 
 
 class ProductUpdateView(UpdateView):
@@ -386,16 +886,165 @@ class ProductUpdateView(UpdateView):
     View to update one product.
     """
     model = Product
+    form_class = ProductForm
 
 
-class ProductFormSetView(ModelFormSetView):
+class ProductBulkEditView(ListView):
     """
-    View to update all products, and add new ones.
+    View to update, add and delete many products at once.
+
+    The products are shown in pages, which can be filtered with the
+    ProductFilterForm. Each row has a form with the prefix 'p<pk>' for an
+    existing product or 'new<n>' for a new product. The javascript only enables
+    the hidden input 'rows' of the changed rows, so only their prefixes are
+    send and only their forms are validated and saved.
+
+    All changes are saved in one transaction. Existing products are updated
+    without loading them again, new products are created with bulk_create and
+    the totals are rebuilt once for all bundles with changed prices.
     """
+
     model = Product
     template_name = 'order/product_formset.html'
-    can_delete = True
-    extra = 20
+    paginate_by = 50
+    extra = 5
+
+    def get_queryset(self):
+        self.filter_form = ProductFilterForm(self.request.GET)
+        queryset = super().get_queryset().select_related('unit')
+        if self.filter_form.is_valid():
+            queryset = self.filter_form.filter(queryset)
+        return queryset
+
+    def get_unit_choices(self):
+        if not hasattr(self, '_unit_choices'):
+            self._unit_choices = [('', '---------')] + [(unit.pk, unit.name) for unit in Unit.objects.all()]
+        return self._unit_choices
+
+    def get_form(self, prefix, instance=None, data=None):
+        return ProductForm(data, instance=instance, prefix=prefix, unit_choices=self.get_unit_choices())
+
+    def post(self, request, *args, **kwargs):
+        forms, deleted = self.get_changed_forms(request.POST)
+        self.bound_forms = dict((form.prefix, form) for form in forms)
+        self.error = None
+        if all(form.is_valid() for form in forms):
+            try:
+                self.save(forms, deleted)
+            except IntegrityError:
+                self.error = "Die Produktnamen müssen eindeutig sein."
+            else:
+                return HttpResponseRedirect(request.get_full_path())
+
+        self.object_list = self.get_queryset()
+        return self.render_to_response(self.get_context_data())
+
+    def get_changed_forms(self, data):
+        """
+        Returns a tuple (forms, deleted), where forms is a list with a bound form
+        for each changed row and deleted is a list with the primary keys of the
+        products to delete.
+        """
+        prefixes = data.getlist('rows')
+        pks = [int(prefix[1:]) for prefix in prefixes if prefix[:1] == 'p' and prefix[1:].isdigit()]
+        products = Product.objects.select_related('unit').in_bulk(pks)
+
+        forms = []
+        deleted = []
+        for prefix in prefixes:
+            if prefix[:1] == 'p' and prefix[1:].isdigit() and int(prefix[1:]) in products:
+                if data.get(prefix + '-delete'):
+                    deleted.append(int(prefix[1:]))
+                    continue
+                form = self.get_form(prefix, products[int(prefix[1:])], data)
+            elif prefix[:3] == 'new' and prefix[3:].isdigit():
+                form = self.get_form(prefix, data=data)
+            else:
+                continue
+            if form.has_changed():
+                forms.append(form)
+        return forms, deleted
+
+    def save(self, forms, deleted):
+        """
+        Saves the valid forms and deletes the products with the primary keys in
+        deleted.
+        """
+        with transaction.atomic():
+            repriced = []
+            new_products = []
+            for form in forms:
+                if form.instance.pk is None:
+                    new_products.append(form.instance)
+                    continue
+                Product.objects.filter(pk=form.instance.pk).update(
+                    **dict((field, form.cleaned_data[field]) for field in form.changed_data))
+                if 'price_cents' in form.changed_data or 'unit' in form.changed_data:
+                    repriced.append(form.instance.pk)
+            Product.objects.bulk_create(new_products)
+
+            if deleted:
+                with totals.rebuild_after(Bundle.objects.filter(orders__product__in=deleted)):
+                    Product.objects.filter(pk__in=deleted).delete()
+            if repriced:
+                bundles = Bundle.objects.filter(orders__product__in=repriced)
+                totals.rebuild(bundles.values_list('pk', flat=True).distinct())
+        # update() and bulk_create() do not send signals
+        caching.catalog_changed()
+
+    def get_context_data(self, **context):
+        """
+        Returns extra context for the view:
+        * rows: a form for each product of the page and for each new product
+        * filter_form: the ProductFilterForm
+        * query_string: the get-arguments without the page, for the page links
+        * error: an error, that does not belong to one form
+        """
+        context = super().get_context_data(**context)
+        bound_forms = getattr(self, 'bound_forms', {})
+        rows = []
+        for product in context['object_list']:
+            prefix = 'p{}'.format(product.pk)
+            rows.append(bound_forms.get(prefix) or self.get_form(prefix, product))
+        for i in range(self.extra):
+            prefix = 'new{}'.format(i)
+            rows.append(bound_forms.get(prefix) or self.get_form(prefix))
+
+        query = self.request.GET.copy()
+        query.pop('page', None)
+        context.update(
+            rows=rows,
+            filter_form=self.filter_form,
+            query_string=query.urlencode(),
+            error=getattr(self, 'error', None))
+        return context
+
+
+class ProductImportView(FormView):
+    """
+    View to upload a price list as csv-file (see order.pricelist).
+
+    The file is read while it is imported and the report of the changes is
+    shown after the import.
+    """
+
+    form_class = PriceListForm
+    template_name = 'order/product_import.html'
+
+    def form_valid(self, form):
+        lines = codecs.iterdecode(form.cleaned_data['file'], 'utf-8')
+        try:
+            report = pricelist.import_price_list(
+                lines, disable_vanished=form.cleaned_data['disable_vanished'],
+                dry_run=form.cleaned_data['dry_run'])
+        except UnicodeDecodeError:
+            form.add_error('file', "Die Datei muss UTF-8 kodiert sein.")
+            return self.form_invalid(form)
+        except pricelist.PriceListError as error:
+            form.add_error('file', str(error))
+            return self.form_invalid(form)
+        return self.render_to_response(self.get_context_data(
+            form=form, report=report, dry_run=form.cleaned_data['dry_run']))
 
 
 class GroupListView(ListView):
@@ -410,6 +1059,7 @@ class GroupCreateView(CreateView):
     Create new groups.
     """
     model = Group
+    fields = ['name', 'enclosure']
 
 
 class GroupUpdateView(UpdateView):
@@ -417,6 +1067,7 @@ class GroupUpdateView(UpdateView):
     Update existing groups.
     """
     model = Group
+    fields = ['name', 'enclosure']
 
 
 class GroupDeleteView(DeleteView):
@@ -0,0 +1,510 @@
+"""
+Saving of ordered and delivered amounts, optionally coalesced.
+
+The order page and the output table send one ajax-request for each changed
+input. If settings.ORDER_COALESCE_DELAY is set, these requests do not save
+their change on their own. The changes are collected in a WriteBuffer of the
+process for each bundle and group, where a later change of the same cell
+replaces the earlier one, and are saved together in one transaction:
+
+* after ORDER_COALESCE_DELAY seconds, by the first request, that is waiting,
+* or at once, if ORDER_COALESCE_MAX_PENDING cells are waiting.
+
+A request waits until its change is saved, before it responds with the new
+prices. So every change, that was confirmed to a client, is in the database
+and all reads (also in other processes) see at least the confirmed changes.
+The buffer only coalesces the requests, that arrive while a batch is
+collected, so the delay should be short (e.g. 0.05 seconds). The buffer
+belongs to one process: with many worker processes, only the requests to the
+same process are coalesced.
+
+A batch is saved with one UPDATE and one INSERT of the orders, one change of
+the totals and one sequence for each bundle (see save_cells).
+
+If the site runs under ASGI (see order.asgi), the ajax views do not wait for
+their change in a thread. They return a DeferredResponse and the ASGI handler
+waits for the batch in the event loop. In this case the changes are always
+saved by a buffer: without ORDER_COALESCE_DELAY, a batch is saved at once and
+the changes, that arrive while it is saved, are saved together in the next
+batch.
+"""
+import logging
+import threading
+from collections import deque, namedtuple
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F
+from django.http import HttpResponse
+
+from . import caching, database, totals
+from .models import Order, Product, next_sequence
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDING = 100
+
+UPSERT_ATTEMPTS = 5
+"""
+Number of attempts of upsert_order to save an order, that is changed by
+others at the same time.
+"""
+
+UPDATE_CHUNK_SIZE = 150
+"""
+Number of orders, that update_orders saves with one statement. Each order
+needs up to five parameters and SQLite allows 999.
+"""
+
+AMOUNT = 'amount'
+DELIVERED = 'delivered'
+
+DEFER_WRITES = 'order.defer_writes'
+"""
+Key in request.META, that is set by the ASGI handler. If it is True, the views
+return a DeferredResponse for their changes.
+"""
+
+Change = namedtuple('Change', 'bundle_pk group_pk field product_pk value')
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+class Conflict(Exception):
+    """
+    Raised by upsert_order, if the order was changed by someone else.
+
+    value and version are the current value and version of the order (both
+    None, if the order does not exist).
+    """
+
+    def __init__(self, value, version):
+        super().__init__("the order was changed in the meantime")
+        self.value = value
+        self.version = version
+
+
+def upsert_sql(field, connection):
+    """
+    Returns the statement, that inserts an order or, if the order exists and
+    has the expected version, only updates the field and the version. The
+    sequence is set afterwards (see upsert_order).
+
+    The parameters are bundle, group, product, amount, delivered and the
+    expected version. The statement needs PostgreSQL 9.5 or SQLite 3.24 (see
+    insert_or_update for the others) and is quoted for the connection.
+    """
+    meta = Order._meta
+    quote = connection.ops.quote_name
+    table = quote(meta.db_table)
+    keys = [quote(meta.get_field(name).column) for name in ('group', 'product', 'bundle')]
+    return (
+        'INSERT INTO {table} ({bundle}, {group}, {product}, {amount}, {delivered}, {version}, {sequence}) '
+        'VALUES (%s, %s, %s, %s, %s, 0, 0) '
+        'ON CONFLICT ({keys}) DO UPDATE SET {field} = excluded.{field}, {version} = {table}.{version} + 1 '
+        'WHERE {table}.{version} = %s'.format(
+            table=table, keys=', '.join(keys), field=quote(field),
+            bundle=keys[2], group=keys[0], product=keys[1], amount=quote('amount'),
+            delivered=quote('delivered'), version=quote('version'), sequence=quote('sequence')))
+
+
+def insert_or_update(orders, bundle_pk, group_pk, product, field, amount, delivered, version):
+    """
+    Saves the order with the statement of upsert_sql in the database of orders
+    and returns the number of saved rows (0, if the order was changed by
+    someone else).
+
+    Without INSERT ... ON CONFLICT (see database.supports), the order is
+    updated, if it has the version, or created, if version is None, with the
+    ORM. An order, that was created by someone else in the meantime, is not
+    saved.
+    """
+    connection = connections[orders.db]
+    if database.supports(connection, database.UPSERT_SQLITE_VERSION, database.UPSERT_POSTGRESQL_VERSION):
+        cursor = connection.cursor()
+        cursor.execute(upsert_sql(field, connection), [bundle_pk, group_pk, product.pk, amount, delivered, version])
+        return cursor.rowcount
+    if version is not None:
+        return orders.filter(version=version).update(**{
+            field: amount if field == AMOUNT else delivered, 'version': F('version') + 1})
+    try:
+        with transaction.atomic(using=orders.db):
+            Order.objects.using(orders.db).bulk_create([Order(
+                bundle_id=bundle_pk, group_id=group_pk, product_id=product.pk, amount=amount, delivered=delivered)])
+    except IntegrityError:
+        return 0
+    return 1
+
+
+def upsert_order(bundle_pk, group_pk, product, field, value, version=None):
+    """
+    Saves the amount or the delivered amount (field is AMOUNT or DELIVERED) of
+    one order and returns the new version of the order.
+
+    The order is saved with one statement, that creates the order or only
+    changes the field, so no other field of the order is overwritten. The
+    statement only updates the order, if it was not changed since it was read
+    for the totals, otherwise it is read again, but at most UPSERT_ATTEMPTS
+    times.
+
+    If version is given, the order is only changed, if it still has this
+    version. Otherwise (or if the order could not be saved in any attempt)
+    Conflict is raised.
+    """
+    using = router.db_for_write(Order)
+    orders = Order.objects.using(using).filter(bundle=bundle_pk, group=group_pk, product=product.pk)
+    for __ in range(UPSERT_ATTEMPTS):
+        current = orders.values_list('amount', 'delivered', 'version').first()
+        old, current_version = (None, None) if current is None else (current[:2], current[2])
+        if version is not None and version != current_version:
+            raise conflict(field, old, current_version)
+
+        amount, delivered = old or (0, None)
+        if field == AMOUNT:
+            amount = value
+        else:
+            delivered = value
+        # The statement and the totals are saved together. Inside of another
+        # transaction no extra savepoint is needed, because an error is raised.
+        with transaction.atomic(using=using, savepoint=False):
+            saved = insert_or_update(orders, bundle_pk, group_pk, product, field, amount, delivered, current_version)
+            if saved:
+                totals.order_changed(bundle_pk, group_pk, product, old, (amount, delivered))
+                orders.update(sequence=next_sequence(bundle_pk, using))
+        if saved:
+            caching.bundle_changed(bundle_pk)
+            return 0 if current_version is None else current_version + 1
+    logger.warning("Could not save order of group %s and product %s after %s attempts",
+                   group_pk, product.pk, UPSERT_ATTEMPTS)
+    raise conflict(field, old, current_version)
+
+
+def conflict(field, old, version):
+    """
+    Returns the Conflict for the current amount and delivered amount (old is
+    None, if the order does not exist) and version of an order.
+    """
+    if old is None:
+        return Conflict(None, None)
+    amount, delivered = old
+    return Conflict(amount if field == AMOUNT or delivered is None else delivered, version)
+
+
+def update_sql(fields, counts, size, connection):
+    """
+    Returns the statement, that sets the fields (AMOUNT and DELIVERED) of size
+    orders to their new values, increases their versions and sets their
+    sequence. The statement is quoted for the connection.
+
+    counts is a list with the number of changed orders for each field. The
+    parameters are a pair (pk, value) for each changed order of each field, the
+    sequence and the primary keys of all orders.
+    """
+    meta = Order._meta
+    quote = connection.ops.quote_name
+    pk = quote(meta.pk.column)
+    columns = ['{field} = CASE {pk} {whens}ELSE {field} END'.format(
+        field=quote(field), pk=pk, whens='WHEN %s THEN %s ' * count) for field, count in zip(fields, counts)]
+    return 'UPDATE {table} SET {columns}, {version} = {version} + 1, {sequence} = %s WHERE {pk} IN ({pks})'.format(
+        table=quote(meta.db_table), columns=', '.join(columns), version=quote('version'),
+        sequence=quote('sequence'), pk=pk, pks=', '.join(['%s'] * size))
+
+
+def update_orders(orders, old_values, using):
+    """
+    Saves the amounts and delivered amounts of the changed orders in the
+    database using with one statement for each UPDATE_CHUNK_SIZE orders (see
+    update_sql).
+
+    old_values is a dict with the tuple (amount, delivered) in the database for
+    the pk of each order. Only the changed fields are written.
+    """
+    connection = connections[using]
+    cursor = connection.cursor()
+    for start in range(0, len(orders), UPDATE_CHUNK_SIZE):
+        chunk = orders[start:start + UPDATE_CHUNK_SIZE]
+        fields, counts, params = [], [], []
+        for index, field in enumerate((AMOUNT, DELIVERED)):
+            changed = [(order.pk, getattr(order, field)) for order in chunk
+                       if getattr(order, field) != old_values[order.pk][index]]
+            if changed:
+                fields.append(field)
+                counts.append(len(changed))
+                params.extend(value for pair in changed for value in pair)
+        params.append(chunk[0].sequence)
+        params.extend(order.pk for order in chunk)
+        cursor.execute(update_sql(fields, counts, len(chunk), connection), params)
+
+
+def save_cells(bundle_pk, cells, products):
+    """
+    Saves the ordered and delivered amounts of many orders of one bundle.
+
+    cells is a dict with a dict {field: value} for each tuple (group_pk,
+    product_pk), where field is AMOUNT or DELIVERED. products is a dict with
+    the products (with their units) for all cells. Has to be called in a
+    transaction.
+
+    The orders are read and locked with one query. The changed orders are
+    saved with one UPDATE (see update_orders) and the new ones with one INSERT.
+    The totals are changed once for all orders and all orders get the same
+    sequence.
+
+    Returns a list of the changed and created orders.
+    """
+    cells = dict(cells)
+    changes = totals.Changes()
+    changed = []
+    old_values = {}
+    using = router.db_for_write(Order)
+    query = Order.objects.using(using).select_for_update().filter(
+        bundle=bundle_pk, group__in=list(set(group for group, __ in cells)),
+        product__in=list(set(product for __, product in cells)))
+    for pk, group, product, amount, delivered, version in query.values_list(
+            'pk', 'group', 'product', 'amount', 'delivered', 'version'):
+        if (group, product) not in cells:
+            continue
+        values = cells.pop((group, product))
+        order = Order(pk=pk, bundle_id=bundle_pk, group_id=group, product=products[product], version=version + 1,
+                      amount=values.get(AMOUNT, amount), delivered=values.get(DELIVERED, delivered))
+        if (order.amount, order.delivered) == (amount, delivered):
+            continue
+        changes.add(bundle_pk, group, order.product, amount, delivered if delivered is not None else amount, sign=-1)
+        changes.add_order(order)
+        changed.append(order)
+        old_values[pk] = (amount, delivered)
+
+    new_orders = [
+        Order(bundle_id=bundle_pk, group_id=group, product=products[product], amount=values.get(AMOUNT, 0),
+              delivered=values.get(DELIVERED))
+        for (group, product), values in cells.items()]
+    for order in new_orders:
+        changes.add_order(order)
+    if not changed and not new_orders:
+        return []
+
+    if not totals.is_paused():
+        changes.save()
+    # The sequence is taken after the totals (see next_sequence).
+    sequence = next_sequence(bundle_pk, using)
+    for order in changed + new_orders:
+        order.sequence = sequence
+    update_orders(changed, old_values, using)
+    Order.objects.using(using).bulk_create(new_orders)
+    return changed + new_orders
+
+
+def save_amounts(bundle_pk, group_pk, amounts, products):
+    """
+    Saves the ordered amounts of one group.
+
+    amounts is a dict with the amount for each product pk. products is a dict
+    with the products (with their units). Has to be called in a transaction.
+    """
+    save_cells(bundle_pk, dict(((group_pk, product), {AMOUNT: amount}) for product, amount in amounts.items()),
+               products)
+
+
+def save_delivered(bundle_pk, cells, products):
+    """
+    Saves the delivered amounts of the cells of an output table.
+
+    cells is a dict with the delivered amount (or None) for each tuple
+    (group_pk, product_pk). products is a dict with the products (with their
+    units). Has to be called in a transaction.
+
+    Returns a list of the changed and created orders.
+    """
+    return save_cells(bundle_pk, dict((key, {DELIVERED: delivered}) for key, delivered in cells.items()), products)
+
+
+class WriteBuffer:
+    """
+    Collects changes of the amounts and saves them in batches.
+
+    pending is a dict with a dict {product_pk: value} for each tuple
+    (bundle_pk, group_pk, field), where field is AMOUNT or DELIVERED. The
+    batches are numbered: batch is the number of the batch, that is collected
+    at the moment, and all batches before flushed are saved.
+    """
+
+    def __init__(self, delay, max_size=MAX_PENDING):
+        self.delay = delay
+        self.max_size = max_size
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.pending = {}
+        self.size = 0
+        self.batch = 0
+        self.flushed = 0
+        self.failed = deque(maxlen=100)
+        self.waiters = []
+
+    def add(self, bundle_pk, group_pk, field, product_pk, value):
+        """
+        Adds a change to the current batch and returns the number of the batch.
+        """
+        with self.condition:
+            cells = self.pending.setdefault((bundle_pk, group_pk, field), {})
+            if product_pk not in cells:
+                self.size += 1
+            cells[product_pk] = value
+            if self.size >= self.max_size:
+                self.condition.notify_all()
+            return self.batch
+
+    def commit(self, batch):
+        """
+        Waits until the batch is saved. Returns False, if it could not be saved.
+
+        If the batch is not saved after delay seconds (or if it is full), the
+        batch is saved by this thread.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.flushed > batch or self.size >= self.max_size, self.delay)
+        self.flush(batch)
+        return batch not in self.failed
+
+    def write(self, bundle_pk, group_pk, field, product_pk, value):
+        """
+        Adds a change and waits until it is saved. Returns False, if it could not
+        be saved.
+        """
+        return self.commit(self.add(bundle_pk, group_pk, field, product_pk, value))
+
+    def add_waiter(self, batch, callback):
+        """
+        Calls callback (without arguments) in the flushing thread, after the
+        batch is saved, or at once, if it is already saved.
+
+        Returns the time in seconds, after which the waiter has to save the
+        batch itself (with flush), like commit does.
+        """
+        with self.condition:
+            if self.flushed <= batch:
+                self.waiters.append((batch, callback))
+                callback = None
+            delay = 0 if self.size >= self.max_size else self.delay
+        if callback is not None:
+            callback()
+        return delay
+
+    def flush(self, batch=None):
+        """
+        Saves all pending changes in one transaction.
+
+        If batch is given, nothing is done if the batch is already saved.
+        """
+        with self.flush_lock:
+            with self.condition:
+                if batch is not None and self.flushed > batch:
+                    return
+                pending, self.pending, self.size = self.pending, {}, 0
+                current = self.batch
+                self.batch += 1
+
+            try:
+                save_pending(pending)
+            except Exception:
+                logger.exception("Could not save %s coalesced changes", len(pending))
+                self.failed.append(current)
+
+            with self.condition:
+                self.flushed = current + 1
+                self.condition.notify_all()
+                waiters = [waiter for waiter in self.waiters if waiter[0] <= current]
+                self.waiters = [waiter for waiter in self.waiters if waiter[0] > current]
+            for __, callback in waiters:
+                callback()
+
+
+def save_pending(pending):
+    """
+    Saves the changes of a WriteBuffer in one transaction, with one
+    save_cells for each bundle.
+    """
+    if not pending:
+        return
+    product_pks = set()
+    for cells in pending.values():
+        product_pks.update(cells)
+    products = Product.objects.select_related('unit').in_bulk(list(product_pks))
+
+    bundles = {}
+    for (bundle_pk, group_pk, field), cells in pending.items():
+        bundle_cells = bundles.setdefault(bundle_pk, {})
+        for product_pk, value in cells.items():
+            bundle_cells.setdefault((group_pk, product_pk), {})[field] = value
+    with transaction.atomic(using=router.db_for_write(Order)):
+        for bundle_pk, cells in bundles.items():
+            save_cells(bundle_pk, cells, products)
+
+    for bundle_pk in set(key[0] for key in pending):
+        caching.bundle_changed(bundle_pk)
+    caching.bump_deferred()
+
+
+def get_buffer(deferred=False):
+    """
+    Returns the WriteBuffer of the process or None, if the changes are not
+    coalesced.
+
+    If deferred is True, a buffer is returned in any case.
+    """
+    global _buffer
+    delay = getattr(settings, 'ORDER_COALESCE_DELAY', 0)
+    if not delay and not deferred:
+        return None
+    max_size = getattr(settings, 'ORDER_COALESCE_MAX_PENDING', MAX_PENDING)
+    with _buffer_lock:
+        if _buffer is None or (_buffer.delay, _buffer.max_size) != (delay, max_size):
+            _buffer = WriteBuffer(delay, max_size)
+        return _buffer
+
+
+class DeferredResponse(HttpResponse):
+    """
+    Response for a change, that was added to a WriteBuffer, but is not saved
+    yet.
+
+    The ASGI handler waits for the batch and then calls complete(), which sets
+    the content of the response to the content of respond(saved).
+    """
+
+    def __init__(self, buffer, batch, respond):
+        super().__init__()
+        self.buffer = buffer
+        self.batch = batch
+        self.respond = respond
+
+    def complete(self, saved):
+        self.content = self.respond(saved).content
+
+
+def write_change(request, change, save, respond):
+    """
+    Saves a change from an ajax-request and returns the response.
+
+    save is a function, that saves the change without a buffer and returns
+    the new version of the order. respond is a function, that returns the
+    response for the change. It gets True as argument, if the change was saved,
+    and the new version of the order, if it is known.
+
+    Returns a DeferredResponse for ASGI requests (see DEFER_WRITES). Otherwise
+    the change is saved by the buffer of the process (if the changes are
+    coalesced) or by save(). If save() raises Conflict, the change is not
+    saved.
+    """
+    if request.META.get(DEFER_WRITES):
+        buffer = get_buffer(deferred=True)
+        return DeferredResponse(buffer, buffer.add(*change), respond)
+
+    buffer = get_buffer()
+    if buffer is not None:
+        return respond(buffer.write(*change))
+    try:
+        version = save()
+    except Conflict:
+        return respond(False)
+    return respond(True, version)